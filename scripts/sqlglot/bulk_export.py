@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+ЭКСПОРТ ДЛЯ МАССОВОЙ ЗАГРУЗКИ
+Данные INSERT ... VALUES уходят в CSV/TSV по таблицам, остальные выражения
+конвертируются гибридным транспилятором; рядом пишется скрипт загрузки
+(\\copy, COPY FROM S3, COPY INTO из стейджа, bq load, .import SQLite).
+С defer_constraints индексы и внешние ключи создаются после загрузки (constraints.sql).
+"""
+
+import os
+import re
+import sys
+import time
+import base64
+from typing import IO, Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from bulk_insert import (
+    decode_mysql_string, iter_row_values, parse_dml_target, parse_insert_header, unquote_identifier
+)
+from ddl_dependencies import leading_words, load_plan_report, plan_schema_load, use_database
+from hybrid_transpiler_demo import (
+    convert_prepared_statement, finish_method_counter, new_method_counter, prepare_statement_text
+)
+from sql_lexer import DEFAULT_CHUNK_SIZE, MappedTextReader, iter_statements_from_file
+
+# ==================== Форматы файлов ====================
+
+SCHEMA_FILE = "schema.sql"
+DATA_FILE = "data.sql"
+CONSTRAINTS_FILE = "constraints.sql"
+
+_CSV_QUOTE = re.compile(r'[,"\r\n]')
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+# Выражения с данными, которые не попали в файлы, выполняются после загрузки
+_DATA_STATEMENT = re.compile(
+    r'(?:\s+|--[^\n]*(?:\n|\Z)|/\*[\s\S]*?\*/)*(?:INSERT|REPLACE|UPDATE|DELETE)\b', re.IGNORECASE
+)
+_USE_STATEMENT = re.compile(r'(?:\s+|--[^\n]*(?:\n|\Z)|/\*[\s\S]*?\*/)*USE\b', re.IGNORECASE)
+
+def make_csv_encoder(null: str) -> Callable[[Optional[str]], str]:
+    """CSV (RFC 4180): NULL - null без кавычек, пустая строка - \"\""""
+    def encode(value: Optional[str]) -> str:
+        if value is None:
+            return null
+        if not value or value == null or _CSV_QUOTE.search(value):
+            return '"' + value.replace('"', '""') + '"'
+        return value
+    return encode
+
+def encode_tsv(value: Optional[str]) -> str:
+    """Текстовый формат COPY: табуляция, \\N - NULL, экранирование обратной косой чертой"""
+    if value is None:
+        return "\\N"
+    return value.translate(_TSV_ESCAPES)
+
+class LoadTarget(NamedTuple):
+    """Как целевой диалект загружает файлы"""
+    formats: Tuple[str, ...]                 # первый - по умолчанию
+    csv_null: str                            # NULL в CSV
+    encode_binary: Callable[[str], str]      # hex-цифры -> текст значения
+    script_name: str
+    # (шаги загрузки, формат, сводка экспорта) -> текст скрипта; шаг - файл
+    # таблицы или {"script": SQL-файл данных}, в порядке выполнения
+    render_script: Callable[[List[Dict[str, Any]], str, Dict[str, Any]], str]
+
+# ==================== Скрипты загрузки ====================
+
+S3_PLACEHOLDER = "s3://<bucket>/<prefix>"
+IAM_ROLE_PLACEHOLDER = "<iam-role-arn>"
+STAGE_PLACEHOLDER = "<stage>"
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def target_identifier(source: str) -> str:
+    """Имя для скрипта загрузки с кавычками как в исходнике: конвертированная
+    схема сохраняет их, а имя без кавычек целевая СУБД приводит к своему регистру"""
+    if source[:1] in ('`', '"'):
+        return quote_identifier(unquote_identifier(source))
+    return source
+
+def qualified_name(table: Dict[str, Any]) -> str:
+    return ".".join(target_identifier(part) for part in table["source_table"])
+
+def column_list(table: Dict[str, Any]) -> str:
+    if table["source_columns"] is None:
+        return ""
+    return " (" + ", ".join(target_identifier(column) for column in table["source_columns"]) + ")"
+
+def sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def postgres_script(steps: List[Dict[str, Any]], data_format: str, export: Dict[str, Any]) -> str:
+    options = "FORMAT csv" if data_format == "csv" else "FORMAT text"
+    lines = ["-- psql -v ON_ERROR_STOP=1 -f load.sql (run from the export directory)",
+             f"\\i {SCHEMA_FILE}"]
+    for step in steps:
+        if "script" in step:
+            lines.append(f"\\i {step['script']}")
+        else:
+            lines.append(f"\\copy {qualified_name(step)}{column_list(step)} FROM {sql_string(step['file'])} WITH ({options})")
+    if export["constraint_statements"]:
+        lines.append(f"\\i {CONSTRAINTS_FILE}")
+    return "\n".join(lines) + "\n"
+
+def redshift_script(steps: List[Dict[str, Any]], data_format: str, export: Dict[str, Any]) -> str:
+    if data_format == "csv":
+        options = "FORMAT AS CSV NULL AS '\\N'"
+    else:
+        options = "DELIMITER '\\t' NULL AS '\\N' ESCAPE"
+    # SQL-файлы данных выполняются между COPY, поэтому скрипт - для psql, как у PostgreSQL
+    lines = ["-- psql -v ON_ERROR_STOP=1 -f load.sql (run from the export directory)",
+             f"-- Upload the data files to {S3_PLACEHOLDER}/ and replace {IAM_ROLE_PLACEHOLDER}",
+             f"\\i {SCHEMA_FILE}"]
+    for step in steps:
+        if "script" in step:
+            lines.append(f"\\i {step['script']}")
+        else:
+            lines.append(f"COPY {qualified_name(step)}{column_list(step)} FROM "
+                         f"'{S3_PLACEHOLDER}/{step['file']}' IAM_ROLE '{IAM_ROLE_PLACEHOLDER}' {options};")
+    if export["constraint_statements"]:
+        lines.append(f"\\i {CONSTRAINTS_FILE}")
+    return "\n".join(lines) + "\n"
+
+def snowflake_script(steps: List[Dict[str, Any]], data_format: str, export: Dict[str, Any]) -> str:
+    if data_format == "csv":
+        file_format = "TYPE = CSV FIELD_OPTIONALLY_ENCLOSED_BY = '\"' EMPTY_FIELD_AS_NULL = TRUE"
+    else:
+        file_format = "TYPE = CSV FIELD_DELIMITER = '\\t' ESCAPE_UNENCLOSED_FIELD = '\\\\' NULL_IF = ('\\\\N')"
+    # PUT получает абсолютный путь: относительный snowsql считает от своего текущего каталога
+    output_dir = os.path.abspath(export["output_dir"])
+    lines = [f"-- snowsql -f load.sql (run from the export directory); replace {STAGE_PLACEHOLDER} "
+             f"with an internal stage name",
+             f"!source {SCHEMA_FILE}",
+             f"CREATE STAGE IF NOT EXISTS {STAGE_PLACEHOLDER};"]
+    for step in steps:
+        if "script" in step:
+            lines.append(f"!source {step['script']}")
+            continue
+        path = os.path.join(output_dir, step["file"]).replace(os.sep, "/")
+        lines.append(f"PUT 'file://{path}' @{STAGE_PLACEHOLDER} AUTO_COMPRESS = TRUE;")
+        lines.append(f"COPY INTO {qualified_name(step)}{column_list(step)} FROM @{STAGE_PLACEHOLDER}/{step['file']}.gz "
+                     f"FILE_FORMAT = ({file_format});")
+    if export["constraint_statements"]:
+        lines.append(f"!source {CONSTRAINTS_FILE}")
+    return "\n".join(lines) + "\n"
+
+def bigquery_script(steps: List[Dict[str, Any]], data_format: str, export: Dict[str, Any]) -> str:
+    query = 'bq query --use_legacy_sql=false --dataset_id="$BQ_DATASET" <'
+    lines = ["#!/bin/sh",
+             "# Set BQ_DATASET ([project:]dataset) and run from the export directory.",
+             "# bq load maps CSV fields to table columns by position.",
+             "set -e",
+             f"{query} {SCHEMA_FILE}"]
+    for step in steps:
+        if "script" in step:
+            lines.append(f"{query} {step['script']}")
+        else:
+            lines.append(f"bq load --source_format=CSV --null_marker='\\N' --allow_quoted_newlines "
+                         f"\"$BQ_DATASET.{step['table'][-1]}\" {step['file']}")
+    if export["constraint_statements"]:
+        lines.append(f"{query} {CONSTRAINTS_FILE}")
+    return "\n".join(lines) + "\n"
+
+def sqlite_script(steps: List[Dict[str, Any]], data_format: str, export: Dict[str, Any]) -> str:
+    lines = ["-- sqlite3 target.db < load.sql (run from the export directory)",
+             "-- .import maps fields by position; NULL arrives as an empty string, binary data as hex text",
+             ".bail on",
+             f".read {SCHEMA_FILE}"]
+    for step in steps:
+        if "script" in step:
+            lines.append(f".read {step['script']}")
+        else:
+            lines.append(f".import --csv {step['file']} {target_identifier(step['source_table'][-1])}")
+    if export["constraint_statements"]:
+        lines.append(f".read {CONSTRAINTS_FILE}")
+    return "\n".join(lines) + "\n"
+
+LOAD_TARGETS: Dict[str, LoadTarget] = {
+    "postgres": LoadTarget(("csv", "tsv"), "", lambda digits: "\\x" + digits, "load.sql", postgres_script),
+    "redshift": LoadTarget(("csv", "tsv"), "\\N", lambda digits: digits, "load.sql", redshift_script),
+    "snowflake": LoadTarget(("csv", "tsv"), "", lambda digits: digits, "load.sql", snowflake_script),
+    "bigquery": LoadTarget(("csv",), "\\N",
+                           lambda digits: base64.b64encode(bytes.fromhex(digits)).decode('ascii'),
+                           "load.sh", bigquery_script),
+    "sqlite": LoadTarget(("csv",), "", lambda digits: digits, "load.sql", sqlite_script),
+}
+
+# ==================== Значения ====================
+
+def literal_value(text: str, encode_binary: Callable[[str], str]) -> Optional[str]:
+    """Текст значения для файла из литерала MySQL; None - NULL"""
+    first = text[0]
+    if first == "'":
+        if "\\" not in text and "''" not in text:
+            return text[1:-1]
+        return decode_mysql_string(text)
+    if first in "nN":
+        return None
+    if first in "tT":
+        return "1"
+    if first in "fF":
+        return "0"
+    if first in "xX":
+        digits = text[2:-1]
+    elif text[:2] in ("0x", "0X"):
+        digits = text[2:]
+    else:
+        # Число; знак мог быть отделён пробелом
+        return "".join(text.split()) if " " in text else text
+    return encode_binary(digits if len(digits) % 2 == 0 else "0" + digits)
+
+def table_group(table: List[str], database: str) -> str:
+    """Ключ таблицы из частей имени без кавычек - как ddl_dependencies.table_key"""
+    parts = [part.lower() for part in table]
+    if len(parts) > 1:
+        database = parts[-2]
+    return f"{database}.{parts[-1]}" if database else parts[-1]
+
+def table_file_name(table: List[str], extension: str, used: Dict[Any, str]) -> str:
+    """Имя файла таблицы без символов, опасных для путей и скриптов"""
+    base = re.sub(r"[^\w.-]", "_", ".".join(table)) or "table"
+    name = f"{base}.{extension}"
+    suffix = 1
+    while name in used.values():
+        suffix += 1
+        name = f"{base}_{suffix}.{extension}"
+    return name
+
+# ==================== Экспорт ====================
+
+def export_bulk_load(source: IO[str], output_dir: str, to_dialect: str, from_dialect: str = "mysql",
+                     data_format: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     defer_constraints: bool = False) -> Dict[str, Any]:
+    """Потоково раскладывает SQL-дамп на схему, файлы данных и скрипт загрузки.
+
+    INSERT ... VALUES из одних литералов пишется строками в <таблица>.csv
+    (или .tsv) без конвертации SQL; остальные выражения проходят гибридный
+    транспилятор: DDL и прочее - в schema.sql, INSERT/UPDATE/DELETE, которые
+    не удалось разложить на значения, - в <таблица>.data.sql.
+    Колонки файла - из списка колонок INSERT, без строки заголовка.
+    Таблицы загружаются в порядке первого появления в дампе (с
+    defer_constraints - в порядке плана), SQL-файл данных таблицы выполняется
+    сразу после её файлов: строки родительской таблицы из SQL попадают в базу
+    раньше строк дочерних. Выражения с неизвестной таблицей - в data.sql
+    после всех файлов. Выражение из SQL перед строками той же таблицы (или с
+    неизвестной таблицей перед любыми строками) изменило бы порядок - такой
+    дамп не экспортируется (ValueError). Прочие зависимости между таблицами
+    (UPDATE ... JOIN, подзапросы) не отслеживаются.
+    defer_constraints - схема собирается до конца файла и планируется по
+    графу внешних ключей: таблицы создаются и загружаются в топологическом
+    порядке, вторичные индексы и внешние ключи - в constraints.sql после данных.
+    """
+    target = LOAD_TARGETS.get(to_dialect)
+    if target is None:
+        raise ValueError(f"Bulk-load export supports: {', '.join(LOAD_TARGETS)}")
+    data_format = data_format or target.formats[0]
+    if data_format not in target.formats:
+        raise ValueError(f"{to_dialect} bulk load supports formats: {', '.join(target.formats)}")
+    if data_format == "csv":
+        encode, delimiter = make_csv_encoder(target.csv_null), ","
+    else:
+        encode, delimiter = encode_tsv, "\t"
+
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    method_used = new_method_counter()
+    warnings: List[str] = []
+    tables: Dict[tuple, Dict[str, Any]] = {}
+    files: Dict[tuple, IO[str]] = {}
+    file_names: Dict[tuple, str] = {}
+    counters = {SCHEMA_FILE: "schema_statements", CONSTRAINTS_FILE: "constraint_statements"}
+    export = {"output_dir": os.path.abspath(output_dir),
+              "schema_statements": 0, "data_statements": 0, "constraint_statements": 0}
+    written: Dict[str, int] = {}   # выражений в каждом SQL-файле
+    total_statements = 0
+    converted = 0
+    # Таблицы, которые меняют выражения SQL-файлов данных; None в множестве - таблица не определена
+    data_targets: Set[Optional[str]] = set()
+    # Ключ таблицы -> её файлы, в порядке появления таблиц в дампе
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    # Ключ таблицы -> её SQL-файл данных (None - data.sql для неизвестной таблицы)
+    data_files: Dict[Optional[str], str] = {}
+    schema_sources: List[str] = []
+    load_plan = None
+    order_keys: List[str] = []
+    database = ""   # база текущего USE - для ключей таблиц в плане загрузки
+
+    def write(stmt: str, name: Optional[str] = None, data_file: str = DATA_FILE) -> None:
+        """Конвертирует выражение и дописывает в name (по умолчанию - схема или data_file)"""
+        nonlocal converted
+        transpiled = convert_prepared_statement(prepare_statement_text(stmt), from_dialect, to_dialect, method_used,
+                                                warnings=warnings, index=converted)
+        converted += 1
+        if transpiled is None or not transpiled.strip():
+            return
+        if name is None:
+            name = data_file if _DATA_STATEMENT.match(transpiled) else SCHEMA_FILE
+        if name not in outputs:
+            outputs[name] = open(os.path.join(output_dir, name), 'w', encoding='utf-8')
+        if written.get(name):
+            outputs[name].write("\n\n")
+        outputs[name].write(transpiled if transpiled.rstrip().endswith(';') else transpiled.rstrip() + ';')
+        written[name] = written.get(name, 0) + 1
+        export[counters.get(name, "data_statements")] += 1
+
+    names = (SCHEMA_FILE, CONSTRAINTS_FILE) if defer_constraints else (SCHEMA_FILE,)
+    outputs = {name: open(os.path.join(output_dir, name), 'w', encoding='utf-8') for name in names}
+    try:
+        for stmt, _, _ in iter_statements_from_file(source, chunk_size):
+            total_statements += 1
+            header = parse_insert_header(stmt) if from_dialect == "mysql" else None
+            if header is not None:
+                source_table, source_columns, header_end = header
+                table = [unquote_identifier(part) for part in source_table]
+                columns = [unquote_identifier(column) for column in source_columns] if source_columns is not None else None
+                try:
+                    lines = [delimiter.join([encode(literal_value(value, target.encode_binary)) for value in row]) + "\n"
+                             for row in iter_row_values(stmt, header_end)]
+                except ValueError:
+                    lines = None
+                if lines is not None:
+                    group = table_group(table, database)
+                    if data_targets & {None, group}:
+                        raise ValueError(f"SQL data statement before INSERT rows of {'.'.join(table)} "
+                                         f"(statement {total_statements}): it runs after the file loads "
+                                         f"and would change the order; use convert for this dump")
+                    key = (tuple(table), tuple(columns) if columns is not None else None)
+                    if key not in files:
+                        file_names[key] = table_file_name(table, data_format, file_names)
+                        files[key] = open(os.path.join(output_dir, file_names[key]), 'w', encoding='utf-8', newline='')
+                        tables[key] = {"table": table, "columns": columns, "source_table": source_table,
+                                       "source_columns": source_columns, "file": file_names[key], "rows": 0}
+                        groups.setdefault(group, []).append(tables[key])
+                    files[key].writelines(lines)
+                    tables[key]["rows"] += len(lines)
+                    continue
+
+            if _USE_STATEMENT.match(stmt):
+                database = use_database(stmt) or database
+            if _DATA_STATEMENT.match(stmt):
+                changed = parse_dml_target(stmt)
+                group = table_group(changed, database) if changed else None
+                data_targets.add(group)
+                if group not in data_files:
+                    data_files[group] = table_file_name(changed, "data.sql", data_files) if changed else DATA_FILE
+                    if group is not None:
+                        groups.setdefault(group, [])
+                write(stmt, data_file=data_files[group])
+                continue
+            if defer_constraints:
+                # Схема нужна целиком, чтобы построить граф; данные пишутся сразу
+                schema_sources.append(stmt)
+                continue
+            write(stmt)
+
+        if defer_constraints:
+            plan = plan_schema_load(schema_sources, to_dialect)
+            load_plan = load_plan_report(plan)
+            order_keys = plan.keys
+            for main, deferred in plan.segments:
+                for stmt in main:
+                    write(stmt, SCHEMA_FILE)
+                if deferred and main and leading_words(main[0], 1) == ["USE"]:
+                    # Отложенная часть выполняется отдельным файлом - со своим USE
+                    write(main[0], CONSTRAINTS_FILE)
+                for stmt in deferred:
+                    write(stmt, CONSTRAINTS_FILE)
+    finally:
+        for name, output in outputs.items():
+            if written.get(name):
+                output.write("\n")
+        for output in [*outputs.values(), *files.values()]:
+            output.close()
+
+    for name in names[1:]:
+        if not written.get(name):
+            os.remove(os.path.join(output_dir, name))
+    order = list(groups)
+    if load_plan is not None:
+        # Таблицы загружаются в порядке создания
+        rank = {key: position for position, key in enumerate(order_keys)}
+        order.sort(key=lambda group: rank.get(group, len(rank)))
+    # Выражение данных после конвертации могло уйти в схему - SQL-файл данных мог не появиться
+    steps: List[Dict[str, Any]] = []
+    for group in [*order, None]:
+        steps.extend(groups.get(group, []))
+        if written.get(data_files.get(group, "")):
+            steps.append({"script": data_files[group]})
+    table_list = [step for step in steps if "script" not in step]
+    with open(os.path.join(output_dir, target.script_name), 'w', encoding='utf-8') as script:
+        script.write(target.render_script(steps, data_format, export))
+    if target.script_name.endswith(".sh"):
+        os.chmod(os.path.join(output_dir, target.script_name), 0o755)
+
+    primary_method = finish_method_counter(method_used)
+    return {
+        "success": True,
+        "from_dialect": from_dialect,
+        "to_dialect": to_dialect,
+        "format": data_format,
+        "output_dir": export["output_dir"],
+        "load_script": target.script_name,
+        "tables": {table["file"]: {"table": ".".join(table["table"]), "rows": table["rows"]} for table in table_list},
+        "total_statements": total_statements,
+        "schema_statements": export["schema_statements"],
+        "data_statements": export["data_statements"],
+        "constraint_statements": export["constraint_statements"],
+        "data_files": [step["script"] for step in steps if "script" in step],
+        "load_plan": load_plan,
+        "methods_used": method_used,
+        "primary_method": primary_method,
+        "warnings": warnings,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+
+def export_file(input_path: str, output_dir: str, to_dialect: str, from_dialect: str = "mysql",
+                data_format: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                defer_constraints: bool = False) -> Dict[str, Any]:
+    """export_bulk_load для файла (mmap, как convert)"""
+    with MappedTextReader(input_path) as source:
+        result = export_bulk_load(source, output_dir, to_dialect, from_dialect, data_format, chunk_size,
+                                  defer_constraints)
+        result["input_bytes"] = source.size
+    return result
+
+# ==================== CLI ====================
+
+def main(args: Optional[List[str]] = None) -> int:
+    """export <input.sql> <диалект> -d <каталог> [--format csv|tsv]; сводка - в stderr"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="hybrid_transpiler_demo.py export",
+                                     description="Экспорт дампа в файлы данных и скрипт массовой загрузки")
+    parser.add_argument("input", help="входной SQL-файл")
+    parser.add_argument("dialect", choices=list(LOAD_TARGETS), help="целевой диалект")
+    parser.add_argument("-d", "--output-dir", required=True, help="каталог для схемы, данных и скрипта")
+    parser.add_argument("--format", dest="data_format", choices=["csv", "tsv"],
+                        help="формат файлов данных (по умолчанию csv)")
+    parser.add_argument("--from", dest="from_dialect", default="mysql", help="исходный диалект")
+    parser.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_SIZE / (1024 * 1024),
+                        help="размер блока чтения в мегабайтах")
+    parser.add_argument("--defer-constraints", action="store_true",
+                        help="таблицы в порядке внешних ключей, индексы и внешние ключи - после загрузки")
+    options = parser.parse_args(args)
+
+    try:
+        result = export_file(options.input, options.output_dir, options.dialect, options.from_dialect,
+                             options.data_format, max(int(options.chunk_mb * 1024 * 1024), 4096),
+                             options.defer_constraints)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    print(f"✅ {options.input} -> {result['output_dir']} ({options.dialect}, {result['format']})", file=sys.stderr)
+    print(f"  • Таблиц с данными: {len(result['tables'])} "
+          f"({sum(table['rows'] for table in result['tables'].values())} строк)", file=sys.stderr)
+    print(f"  • Выражений схемы: {result['schema_statements']}, данных в SQL: {result['data_statements']}",
+          file=sys.stderr)
+    plan = result["load_plan"]
+    if plan is not None:
+        print(f"  • Индексов и внешних ключей после загрузки: {result['constraint_statements']}", file=sys.stderr)
+        for number, level in enumerate(plan["load_levels"], 1):
+            print(f"  • Уровень {number} (параллельно): {', '.join(level)}", file=sys.stderr)
+        for cycle in plan["cycles"]:
+            print(f"  ⚠️  Цикл внешних ключей: {', '.join(cycle)}", file=sys.stderr)
+    print(f"  • Скрипт загрузки: {result['load_script']}", file=sys.stderr)
+    print(f"  • Время: {result['elapsed_s']} сек", file=sys.stderr)
+    for warning in result["warnings"][:10]:
+        print(f"  ⚠️  {warning}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+# ==================== ИМПОРТЫ ====================
+
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from dialect_rules import get_rule_set
+from sql_features import detect_sql_features, is_complex
+from sql_lexer import compile_pattern
+
+# ==================== Шаблоны ====================
+
+_JOIN_BLOCK_PARTS = 16384
+
+_IDENT = r'(?:`[^`]*(?:``[^`]*)*`|"[^"]*"|[^\W\d][\w$]*)'
+_TABLE = f'{_IDENT}(?:\\s*\\.\\s*{_IDENT})?'
+
+# Заголовок INSERT INTO t [(колонки)] VALUES - вместе с комментариями перед выражением
+_HEADER = re.compile(
+    r'(?:\s+|--[^\n]*(?:\n|\Z)|/\*[\s\S]*?\*/)*'
+    f'INSERT\\s+(?:INTO\\s+)?(?P<table>{_TABLE})\\s*(?P<columns>\\(\\s*{_IDENT}(?:\\s*,\\s*{_IDENT})*\\s*\\)\\s*)?'
+    r'VALUES?(?=\s*\()',
+    re.IGNORECASE
+)
+
+# Строковый литерал MySQL: экранирование обратной косой чертой и удвоенной кавычкой.
+# Квантификаторы захватывающие (*+), чтобы на сотнях мегабайт не было возвратов;
+# разбор однозначен (закрывающая кавычка не из пары ''), см. compile_pattern
+_STRING = r"'[^'\\]*+(?:(?:\\[\s\S]|'')[^'\\]*+)*+'(?!')"
+# 0x-литерал: ведущий 0 поглощается вместе с цифрами, поэтому шаблон начинается с x
+_HEX = r"(?<=(?<![\w.])0)[xX][0-9A-Fa-f]++(?![\w.])|[xX]'[0-9A-Fa-f]*+'"
+
+# Строки VALUES, в которых только литералы: числа, строки, NULL, TRUE/FALSE, hex.
+# Цифры, знаки и скобки поглощаются отрезками между остальными литералами,
+# форма чисел не проверяется
+_ROWS_TEXT = r"[\d.,()\s+-]*+"
+_ROWS = compile_pattern(
+    f"{_ROWS_TEXT}(?:(?:{_STRING}"
+    r"|(?i:NULL|TRUE|FALSE)(?!\w)"
+    r"|(?<=\d)[eE](?=[-+\d])"
+    f"|{_HEX}){_ROWS_TEXT})*+;?+\\Z"
+)
+
+# Значение VALUES для разбора по строкам: литерал целиком, с проверкой границы
+_VALUE = (
+    f"(?:{_STRING}|[xX]'[0-9A-Fa-f]*+'|0[xX][0-9A-Fa-f]++|(?i:NULL|TRUE|FALSE)"
+    r"|(?:[-+]\s*+)?+(?:\d++(?:\.\d*+)?+|\.\d++)(?:[eE][-+]?+\d++)?+)(?![\w.'])"
+)
+_VALUES_ROW = f"\\(\\s*+{_VALUE}\\s*+(?:,\\s*+{_VALUE}\\s*+)*+\\)"
+# Строки разбираются пачками: проверка формы пачки и findall значений внутри неё
+_ROW_BLOCK_ROWS = 4096
+_ROW_BLOCK = compile_pattern(f"\\s*+,?+\\s*+{_VALUES_ROW}(?:\\s*+,\\s*+{_VALUES_ROW}){{0,{_ROW_BLOCK_ROWS - 1}}}+")
+_ROW_ITEM = compile_pattern(f"[(,]\\s*+({_VALUE})\\s*+(\\)?)")
+_ROWS_END = compile_pattern(r"\s*+;?+\s*+\Z")
+
+# ==================== Литералы целевых диалектов ====================
+
+class LiteralStyle(NamedTuple):
+    """Запись литералов в диалекте; None - как в MySQL"""
+    encode_string: Optional[Callable[[str], str]]   # значение строки -> литерал
+    plain_string: str         # шаблон строк, которые переписывать не нужно
+    hex_format: Optional[str]     # двоичные данные, {} - hex-цифры
+    booleans: Optional[tuple]     # замены TRUE, FALSE
+    quote_escape: Optional[str] = None   # замена \' в строках без других экранирований
+
+def encode_standard_string(value: str) -> str:
+    """Стандартный SQL: кавычка удваивается, обратная косая черта - обычный символ"""
+    return "'" + value.replace("'", "''") + "'"
+
+_SNOWFLAKE_ESCAPES = str.maketrans({"\\": "\\\\", "'": "''", "\0": "\\0"})
+_BIGQUERY_ESCAPES = str.maketrans({
+    "\\": "\\\\", "'": "\\'", "\n": "\\n", "\r": "\\r", "\t": "\\t",
+    "\b": "\\b", "\0": "\\x00", "\x1a": "\\x1a",
+})
+
+# Строка без обратной косой черты одинакова в MySQL и стандартном SQL
+_PLAIN_STANDARD = r"'[^'\\]*+(?:''[^'\\]*+)*+'(?!')"
+# Snowflake понимает те же основные экранирования, что и MySQL
+_PLAIN_SNOWFLAKE = r"'[^'\\]*+(?:(?:\\['\\\"nrtb0]|'')[^'\\]*+)*+'(?!')"
+# В BigQuery нет удвоенной кавычки, \0 и переводов строки в '...'
+_PLAIN_BIGQUERY = r"'[^'\\\n\r]*+(?:\\['\\\"nrtb][^'\\\n\r]*+)*+'(?!')"
+
+_STANDARD = LiteralStyle(encode_standard_string, _PLAIN_STANDARD, None, None, "''")
+
+LITERAL_STYLES: Dict[str, LiteralStyle] = {
+    "mysql": LiteralStyle(None, _STRING, None, None),
+    "postgres": _STANDARD._replace(hex_format="decode('{}', 'hex')"),
+    "redshift": _STANDARD._replace(hex_format="FROM_HEX('{}')"),
+    "sqlite": _STANDARD._replace(hex_format="X'{}'"),
+    "oracle": _STANDARD._replace(hex_format="HEXTORAW('{}')", booleans=("1", "0")),
+    "mssql": _STANDARD._replace(hex_format="0x{}", booleans=("1", "0")),
+    "snowflake": LiteralStyle(lambda value: "'" + value.translate(_SNOWFLAKE_ESCAPES) + "'",
+                              _PLAIN_SNOWFLAKE, "TO_BINARY('{}', 'HEX')", None),
+    "bigquery": LiteralStyle(lambda value: "'" + value.translate(_BIGQUERY_ESCAPES) + "'",
+                             _PLAIN_BIGQUERY, "FROM_HEX('{}')", None),
+}
+
+_MYSQL_ESCAPE = re.compile(r"\\([\s\S])|''")
+_MYSQL_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+def _unescape(match) -> str:
+    char = match.group(1)
+    if char is None:
+        return "'"
+    if char in "%_":
+        # MySQL оставляет обратную косую черту перед % и _
+        return "\\" + char
+    return _MYSQL_ESCAPES.get(char, char)
+
+def decode_mysql_string(literal: str) -> str:
+    """Значение строкового литерала MySQL ('...' с экранированием)"""
+    return _MYSQL_ESCAPE.sub(_unescape, literal[1:-1])
+
+@lru_cache(maxsize=None)
+def _literal_pattern(to_dialect: str) -> "re.Pattern":
+    """Шаблон для finditer: отрезок литералов без изменений, затем литерал,
+    который нужно переписать, лишние пробелы или конец текста"""
+    style = LITERAL_STYLES.get(to_dialect, LITERAL_STYLES["mysql"])
+    text = r"[\d.,()+;-]*+"
+    keep = [r"\s(?!\s)", style.plain_string, r"(?i:NULL)(?!\w)", r"(?<=\d)[eE](?=[-+\d])"]
+    if style.hex_format is None:
+        keep.append(_HEX)
+    if style.booleans is None:
+        keep.append(r"(?i:TRUE|FALSE)(?!\w)")
+    return compile_pattern(
+        f"{text}(?:(?:{'|'.join(keep)}){text})*+"
+        f"(?:(?P<string>{_STRING})|(?P<hex>{_HEX})|(?P<boolean>(?i:TRUE|FALSE)(?!\\w))"
+        r"|(?P<ws>\s{2,}+)|(?P<end>\Z))"
+    )
+
+# ==================== Быстрый путь ====================
+
+def match_bulk_insert(sql: str, start: int = 0, end: Optional[int] = None) -> Optional[int]:
+    """Конец заголовка, если sql[start:end] - INSERT ... VALUES только с литералами.
+
+    Такие выражения (дампы mysqldump) не токенизируются и не разбираются:
+    проверка строк - один проход регулярного выражения.
+    """
+    if end is None:
+        end = len(sql)
+    header = _HEADER.match(sql, start, end)
+    if header is None or _ROWS.match(sql, header.end(), end) is None:
+        return None
+    return header.end()
+
+# Таблица, которую меняет INSERT/REPLACE/UPDATE/DELETE; UPDATE a, b ... не подходит
+_DML_TARGET = re.compile(
+    r'(?:\s+|--[^\n]*(?:\n|\Z)|/\*[\s\S]*?\*/)*'
+    r'(?:(?:INSERT|REPLACE)(?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE))*(?:\s+INTO)?'
+    r'|UPDATE(?:\s+(?:LOW_PRIORITY|IGNORE))*'
+    r'|DELETE(?:\s+(?:LOW_PRIORITY|QUICK|IGNORE))*\s+FROM)'
+    f'\\s+(?P<table>{_TABLE})(?=[\\s(;]|\\Z)',
+    re.IGNORECASE
+)
+
+def unquote_identifier(identifier: str) -> str:
+    """Имя без кавычек MySQL (`...` или "...")"""
+    if identifier[:1] in ('`', '"'):
+        quote = identifier[0]
+        return identifier[1:-1].replace(quote * 2, quote)
+    return identifier
+
+def parse_insert_header(sql: str, start: int = 0) -> Optional[Tuple[List[str], Optional[List[str]], int]]:
+    """(части имени таблицы, колонки или None, конец заголовка) - как в тексте, с кавычками"""
+    header = _HEADER.match(sql, start)
+    if header is None:
+        return None
+    table = re.findall(_IDENT, header.group("table"))
+    columns = header.group("columns")
+    if columns is not None:
+        columns = re.findall(_IDENT, columns)
+    return table, columns, header.end()
+
+def parse_dml_target(sql: str) -> Optional[List[str]]:
+    """Части имени таблицы (без кавычек), которую меняет выражение; None - не определить"""
+    target = _DML_TARGET.match(sql)
+    if target is None:
+        return None
+    return [unquote_identifier(part) for part in re.findall(_IDENT, target.group("table"))]
+
+def iter_row_values(sql: str, header_end: int) -> Iterator[List[str]]:
+    """Тексты значений каждой строки VALUES (строки - литералами MySQL).
+
+    Форма строк и то, что в них только литералы, проверяется по ходу
+    разбора; иначе - ValueError (строки до ошибки уже выданы).
+    """
+    position = header_end
+    row: List[str] = []
+    while True:
+        block = _ROW_BLOCK.match(sql, position)
+        if block is None:
+            break
+        for value, row_end in _ROW_ITEM.findall(sql, position, block.end()):
+            row.append(value)
+            if row_end:
+                yield row
+                row = []
+        position = block.end()
+    if position == header_end or _ROWS_END.match(sql, position) is None:
+        raise ValueError(f"Unsupported VALUES row at offset {position}")
+
+def prepare_bulk_insert(sql: str, start: int = 0, end: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Подготовленное выражение (как prepare_statement) для быстрого пути или None"""
+    if end is None:
+        end = len(sql)
+    header_end = match_bulk_insert(sql, start, end)
+    if header_end is None:
+        return None
+    # Признаки ищутся только в заголовке: в строках VALUES нет ни слов, ни операторов
+    features = detect_sql_features(sql[start:header_end])
+    if is_complex(features):
+        return None
+    return {
+        "sql": sql[start:end],
+        "features": features,
+        "is_complex": False,
+        "alter_foreign_key": False,
+        "normalized": None,
+        "parse": None,
+        "bulk_insert": header_end - start,
+    }
+
+def iter_bulk_insert(sql: str, header_end: int, to_dialect: str) -> Iterator[str]:
+    """Конвертирует INSERT ... VALUES без разбора строк на токены, отдавая результат блоками.
+
+    Заголовок проходит простые замены диалекта, в строках переписываются
+    только литералы, запись которых в целевом диалекте другая (экранирование
+    строк, двоичные данные, TRUE/FALSE), и лишние пробелы сводятся к одному.
+    Остальной текст копируется отрезками; отрезки отдаются блоками по мере
+    готовности, так что кроме исходного выражения в памяти только один блок.
+    """
+    style = LITERAL_STYLES.get(to_dialect, LITERAL_STYLES["mysql"])
+    header = sql[:header_end]
+    if not header.upper().endswith("VALUES"):
+        # VALUE - синоним VALUES только в MySQL
+        header += "S" if header[-1].isupper() else "s"
+    yield get_rule_set("simple", to_dialect).apply(header)
+    parts: List[str] = []
+    position = header_end
+
+    for match in _literal_pattern(to_dialect).finditer(sql, header_end):
+        kind = match.lastgroup
+        if kind == "end":
+            break
+        start, end = match.span(kind)
+        literal = sql[start:end]
+        if kind == "string":
+            body = literal[1:-1]
+            if style.quote_escape is not None and body.count("\\") == body.count("\\'"):
+                # Частый случай дампов: единственное экранирование - \'
+                replacement = "'" + body.replace("\\'", style.quote_escape) + "'"
+            else:
+                replacement = style.encode_string(decode_mysql_string(literal))
+        elif kind == "hex":
+            if literal.endswith("'"):
+                digits = literal[2:-1]
+            else:
+                digits = literal[1:]
+                start -= 1
+            replacement = style.hex_format.format(digits if len(digits) % 2 == 0 else '0' + digits)
+        elif kind == "boolean":
+            replacement = style.booleans[0 if literal.upper() == "TRUE" else 1]
+        else:
+            replacement = ' '
+        parts.append(sql[position:start])
+        parts.append(replacement)
+        position = end
+        if len(parts) >= _JOIN_BLOCK_PARTS:
+            yield ''.join(parts)
+            parts.clear()
+
+    parts.append(sql[position:])
+    yield ''.join(parts)
+
+def convert_bulk_insert(sql: str, header_end: int, to_dialect: str) -> str:
+    """iter_bulk_insert одной строкой.
+
+    Пиковая память - исходное выражение плюс весь результат (около двух
+    размеров выражения); при записи в файл используйте iter_bulk_insert.
+    """
+    return ''.join(iter_bulk_insert(sql, header_end, to_dialect))
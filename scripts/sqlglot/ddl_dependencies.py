@@ -0,0 +1,451 @@
+# ==================== ИМПОРТЫ ====================
+
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sql_lexer import PUNCT, QUOTED, WORD, Token, is_code, split_top_level, tokenize
+
+# ==================== Профили диалектов ====================
+
+# SQLite не умеет ALTER TABLE ... ADD CONSTRAINT: внешние ключи остаются в CREATE TABLE
+INLINE_FOREIGN_KEY_DIALECTS = ("sqlite",)
+# Вторичных индексов нет (Redshift, Snowflake, BigQuery) - KEY/INDEX просто убираются
+NO_INDEX_DIALECTS = ("redshift", "snowflake", "bigquery")
+
+DEFERRED_COMMENT = "-- Run after the data load: secondary indexes and foreign keys"
+
+def constraint_profile(to_dialect: str) -> Tuple[bool, bool]:
+    """(внешние ключи выносятся из CREATE TABLE, индексы создаются) для диалекта"""
+    return to_dialect not in INLINE_FOREIGN_KEY_DIALECTS, to_dialect not in NO_INDEX_DIALECTS
+
+# ==================== Разбор CREATE TABLE ====================
+
+_IDENT = r'(?:`[^`]*(?:``[^`]*)*`|"[^"]*"|[^\W\d][\w$]*)'
+_NAME = f'{_IDENT}(?:\\s*\\.\\s*{_IDENT})?'
+
+_FOREIGN_ITEM = re.compile(f'(?:CONSTRAINT(?:\\s+{_IDENT})?\\s+)?FOREIGN\\s+KEY\\b', re.IGNORECASE)
+_INDEX_ITEM = re.compile(
+    f'(?:(?:CONSTRAINT(?:\\s+{_IDENT})?\\s+)?(?P<unique>UNIQUE)(?:\\s+(?:KEY|INDEX)\\b)?|(?:KEY|INDEX)\\b)'
+    f'(?:\\s*(?P<name>{_IDENT}))?\\s*(?:USING\\s+\\w+\\s*)?\\((?P<columns>(?:[^()]|\\([^()]*\\))*)\\)',
+    re.IGNORECASE
+)
+_REFERENCES = re.compile(f'\\bREFERENCES\\s+(?P<table>{_NAME})', re.IGNORECASE)
+# Ссылка в определении колонки: col INT [CONSTRAINT имя] REFERENCES t (c) [MATCH ...] [ON ...]
+_COLUMN_REFERENCE = re.compile(
+    f'(?:CONSTRAINT\\s+(?P<constraint>{_IDENT})\\s+)?(?P<definition>REFERENCES\\s+{_NAME}\\s*(?:\\([^()]*\\))?'
+    r'(?:\s+MATCH\s+(?:FULL|PARTIAL|SIMPLE))?'
+    r'(?:\s+ON\s+(?:DELETE|UPDATE)\s+(?:RESTRICT|CASCADE|SET\s+NULL|SET\s+DEFAULT|NO\s+ACTION))*)',
+    re.IGNORECASE
+)
+# Элементы тела CREATE TABLE, которые не являются колонками
+_TABLE_ITEM_WORDS = ("CONSTRAINT", "PRIMARY", "UNIQUE", "KEY", "INDEX", "CHECK", "FOREIGN", "FULLTEXT", "SPATIAL")
+# Длина префикса индекса (col(10)) есть только в MySQL
+_PREFIX_LENGTH = re.compile(f'({_IDENT})\\s*\\(\\s*\\d+\\s*\\)')
+
+class TableDefinition(NamedTuple):
+    """CREATE TABLE, из которого вынесены внешние ключи и вторичные индексы"""
+    key: str                  # база.таблица без кавычек в нижнем регистре (см. table_key)
+    name: str                 # имя как в выражении
+    display: str              # имя без кавычек
+    create: str               # CREATE TABLE без вынесенных частей
+    references: Set[str]      # ключи таблиц, на которые ссылаются внешние ключи
+    indexes: List[Tuple[bool, Optional[str], str]]   # (UNIQUE, имя, колонки)
+    foreign_keys: List[str]   # определения FOREIGN KEY (и ссылки REFERENCES из колонок)
+
+def unquote(identifier: str) -> str:
+    if identifier[:1] in ('`', '"'):
+        quote = identifier[0]
+        return identifier[1:-1].replace(quote * 2, quote)
+    return identifier
+
+def table_key(name: str, database: str = "") -> str:
+    """Ключ таблицы для графа: база.таблица без кавычек в нижнем регистре.
+
+    Для имени без базы берётся database - база текущего USE (до первого
+    USE её нет, и ключ - одно имя таблицы).
+    """
+    parts = [unquote(part).lower() for part in re.findall(_IDENT, name)]
+    if len(parts) > 1:
+        database = parts[-2]
+    return f"{database}.{parts[-1]}" if database else parts[-1]
+
+def _read_name(sql: str, tokens: List[Token], code: List[int], position: int) -> Tuple[Optional[str], int]:
+    """Имя (возможно, с точкой) с позиции position в списке значимых токенов"""
+    start = position
+    while position < len(code) and tokens[code[position]].kind in (WORD, QUOTED):
+        position += 1
+        if position < len(code) and sql[tokens[code[position]].start] == '.' \
+                and tokens[code[position]].kind not in (WORD, QUOTED, PUNCT):
+            position += 1
+        else:
+            break
+    if position == start:
+        return None, position
+    return sql[tokens[code[start]].start:tokens[code[position - 1]].end], position
+
+def _words(sql: str, tokens: List[Token], code: List[int], count: int) -> List[str]:
+    return [sql[tokens[index].start:tokens[index].end].upper() if tokens[index].kind == WORD else ""
+            for index in code[:count]]
+
+def _referenced_tables(stmt: str, tokens: List[Token], start: int, end: int, database: str) -> List[str]:
+    """Таблицы после REFERENCES в [start, end) - только в коде, не в строках и комментариях"""
+    tables = []
+    for token in tokens:
+        if start <= token.start < end and token.kind == WORD and stmt[token.start:token.end].upper() == "REFERENCES":
+            reference = _REFERENCES.match(stmt, token.start, end)
+            if reference is not None:
+                tables.append(table_key(reference.group("table"), database))
+    return tables
+
+def _split_column_reference(stmt: str, tokens: List[Token], start: int, end: int) -> Optional[Tuple[str, str]]:
+    """(колонка без REFERENCES, FOREIGN KEY для ALTER TABLE) для колонки со ссылкой
+    на другую таблицу или None"""
+    item_code = [index for index, token in enumerate(tokens)
+                 if start <= token.start < end and is_code(token)]
+    if not item_code or tokens[item_code[0]].kind not in (WORD, QUOTED) \
+            or _words(stmt, tokens, item_code, 1)[0] in _TABLE_ITEM_WORDS:
+        return None
+    for position, index in enumerate(item_code):
+        if tokens[index].kind != WORD or stmt[tokens[index].start:tokens[index].end].upper() != "REFERENCES":
+            continue
+        # CONSTRAINT имя перед REFERENCES уходит вместе со ссылкой
+        clause_start = tokens[index].start
+        if position >= 2 and _words(stmt, tokens, item_code[position - 2:], 1) == ["CONSTRAINT"]:
+            clause_start = tokens[item_code[position - 2]].start
+        reference = _COLUMN_REFERENCE.match(stmt, clause_start, end)
+        if reference is None:
+            return None
+        column = stmt[tokens[item_code[0]].start:tokens[item_code[0]].end]
+        constraint = reference.group("constraint")
+        foreign_key = (f"CONSTRAINT {constraint} " if constraint else "") + \
+            f"FOREIGN KEY ({column}) {reference.group('definition')}"
+        return (stmt[start:clause_start].rstrip() + stmt[reference.end():end]), foreign_key
+    return None
+
+def parse_create_table(stmt: str, defer_foreign_keys: bool = True, defer_indexes: bool = True,
+                       database: str = "") -> Optional[TableDefinition]:
+    """Разбирает CREATE TABLE имя (...) или возвращает None (в том числе для
+    CREATE TEMPORARY TABLE, CREATE TABLE ... LIKE и ... AS SELECT);
+    database - база текущего USE для ключей таблиц"""
+    tokens = tokenize(stmt)
+    code = [index for index, token in enumerate(tokens) if is_code(token)]
+    words = _words(stmt, tokens, code, 6)
+    if words[:2] != ["CREATE", "TABLE"]:
+        return None
+    position = 2
+    if words[2:5] == ["IF", "NOT", "EXISTS"]:
+        position = 5
+    name, position = _read_name(stmt, tokens, code, position)
+    if name is None or position >= len(code) or stmt[tokens[code[position]].start] != '(':
+        return None
+
+    # Тело - до парной скобки
+    open_index = code[position]
+    depth = 0
+    close_index = None
+    for index in code[position:]:
+        token = tokens[index]
+        if token.kind == PUNCT:
+            char = stmt[token.start]
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+                if depth == 0:
+                    close_index = index
+                    break
+    if close_index is None:
+        return None
+
+    references: Set[str] = set()
+    indexes: List[Tuple[bool, Optional[str], str]] = []
+    foreign_keys: List[str] = []
+    kept: List[str] = []   # оставшиеся части с исходными отступами
+    items = split_top_level(stmt, tokens, ',', open_index + 1, close_index)
+    for start, end in items:
+        item = stmt[start:end]
+        indent = start
+        while indent > 0 and stmt[indent - 1] in ' \t\r\n':
+            indent -= 1
+        referenced = _referenced_tables(stmt, tokens, start, end, database)
+        references.update(referenced)
+        if _FOREIGN_ITEM.match(item):
+            if defer_foreign_keys:
+                foreign_keys.append(item)
+                continue
+        else:
+            split = _split_column_reference(stmt, tokens, start, end) \
+                if referenced and defer_foreign_keys else None
+            if split is not None:
+                # Ссылка в колонке (col INT REFERENCES t) выносится так же, как FOREIGN KEY
+                column, foreign_key = split
+                foreign_keys.append(foreign_key)
+                kept.append(stmt[indent:start] + column)
+                continue
+            index = _INDEX_ITEM.match(item)
+            if index is not None:
+                if defer_indexes:
+                    indexes.append((index.group("unique") is not None, index.group("name"),
+                                    _PREFIX_LENGTH.sub(r'\1', index.group("columns")).strip()))
+                continue
+        kept.append(stmt[indent:end])
+
+    if not kept:
+        return None
+    # Оставшиеся части - с исходными отступами, без запятых вынесенных
+    create = stmt[:tokens[open_index].end] + ",".join(kept) + stmt[items[-1][1]:]
+    display = ".".join(unquote(part) for part in re.findall(_IDENT, name))
+    key = table_key(name, database)
+    return TableDefinition(key, name, display, create, references - {key}, indexes, foreign_keys)
+
+# ==================== Граф зависимостей ====================
+
+def strongly_connected(tables: List[str], references: Dict[str, Set[str]]) -> List[List[str]]:
+    """Сильно связные компоненты графа ссылок (Тарьян, без рекурсии).
+
+    Компонента выдаётся после всех, на которые ссылается, - это уже
+    топологический порядок; компонента из нескольких таблиц - цикл.
+    """
+    known = set(tables)
+    index_of: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    stack: List[str] = []
+    on_stack: Set[str] = set()
+    components: List[List[str]] = []
+
+    def visit(table: str) -> Tuple[str, Any]:
+        index_of[table] = lowlink[table] = len(index_of)
+        stack.append(table)
+        on_stack.add(table)
+        return table, iter(sorted(references.get(table, set()) & known))
+
+    for root in tables:
+        if root in index_of:
+            continue
+        work = [visit(root)]
+        while work:
+            table, neighbours = work[-1]
+            for neighbour in neighbours:
+                if neighbour not in index_of:
+                    work.append(visit(neighbour))
+                    break
+                if neighbour in on_stack:
+                    lowlink[table] = min(lowlink[table], index_of[neighbour])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[table])
+                if lowlink[table] == index_of[table]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == table:
+                            break
+                    components.append([member for member in tables if member in component])
+    return components
+
+def topological_levels(tables: List[str], references: Dict[str, Set[str]]) -> Tuple[List[List[str]], List[List[str]]]:
+    """Уровни загрузки и циклы внешних ключей.
+
+    Таблицы уровня ссылаются только на таблицы предыдущих уровней, поэтому
+    уровень можно загружать параллельно даже с действующими ограничениями.
+    Цикл попадает в уровень целиком, но без отложенных ограничений не загрузится.
+    """
+    known = set(tables)
+    level_of: Dict[str, int] = {}
+    cycles: List[List[str]] = []
+    for component in strongly_connected(tables, references):
+        outside = set().union(*(references.get(table, set()) for table in component)) & known - set(component)
+        level = max((level_of[table] + 1 for table in outside), default=0)
+        for table in component:
+            level_of[table] = level
+        if len(component) > 1:
+            cycles.append(component)
+    levels: List[List[str]] = [[] for _ in range(max(level_of.values(), default=-1) + 1)]
+    for table in tables:
+        levels[level_of[table]].append(table)
+    return levels, cycles
+
+# ==================== План загрузки ====================
+
+class LoadPlan(NamedTuple):
+    """Выражения исходного диалекта в порядке выполнения и сводка по графу"""
+    segments: List[Tuple[List[str], List[str]]]   # (основные выражения, отложенные) на каждый USE
+    order: List[str]                  # таблицы в порядке создания
+    levels: List[List[str]]           # таблицы, которые можно загружать параллельно
+    cycles: List[List[str]]           # циклы внешних ключей
+    deferred_indexes: int
+    deferred_foreign_keys: int
+    dropped_indexes: int
+    keys: List[str]                   # ключи таблиц (table_key) в порядке order
+
+    @property
+    def statements(self) -> List[str]:
+        return [stmt for main, deferred in self.segments for stmt in main + deferred]
+
+def leading_words(stmt: str, count: int) -> List[str]:
+    """Первые count ключевых слов выражения (после комментариев), в верхнем регистре"""
+    tokens = tokenize(stmt[:512])
+    code = [index for index, token in enumerate(tokens) if is_code(token)]
+    return _words(stmt, tokens, code, count)
+
+def use_database(stmt: str) -> Optional[str]:
+    """База из USE имя (без кавычек, в нижнем регистре) или None для других выражений"""
+    tokens = tokenize(stmt[:1024])
+    code = [index for index, token in enumerate(tokens) if is_code(token)]
+    if _words(stmt, tokens, code, 1) != ["USE"]:
+        return None
+    name, _ = _read_name(stmt, tokens, code, 1)
+    return unquote(re.findall(_IDENT, name)[-1]).lower() if name else None
+
+def _index_name(table: TableDefinition, name: Optional[str], columns: str, used: Set[str]) -> str:
+    """Имя индекса, уникальное в схеме (в MySQL имена уникальны только в таблице)"""
+    base = unquote(name) if name else f"{table.display.split('.')[-1]}_{unquote(re.findall(_IDENT, columns)[0])}_idx"
+    candidate = base
+    if candidate.lower() in used:
+        candidate = f"{table.display.split('.')[-1]}_{base}"
+    suffix = 1
+    while candidate.lower() in used:
+        suffix += 1
+        candidate = f"{table.display.split('.')[-1]}_{base}_{suffix}"
+    used.add(candidate.lower())
+    return "`" + candidate.replace("`", "``") + "`"
+
+def plan_schema_load(statements: List[str], to_dialect: str = "postgres") -> LoadPlan:
+    """Переупорядочивает схему для быстрой загрузки в to_dialect.
+
+    CREATE TABLE поднимаются к первому из них в топологическом порядке
+    (вместе с DROP TABLE тех же таблиц, в обратном порядке); внешние ключи
+    (в том числе REFERENCES в колонках) и вторичные индексы выносятся в ALTER TABLE / CREATE INDEX в конце
+    (после данных) - как и отдельные CREATE INDEX и ALTER TABLE ... FOREIGN
+    KEY скрипта. Выражения USE делят скрипт на части, каждая планируется
+    отдельно; таблицы без базы в имени относятся к базе своей части, и в
+    сводке их имена дополняются этой базой. Выражения остаются в исходном
+    диалекте (MySQL).
+    """
+    defer_foreign_keys, keep_indexes = constraint_profile(to_dialect)
+
+    # Части скрипта между USE
+    parts: List[List[str]] = [[]]
+    for stmt in statements:
+        if leading_words(stmt, 1) == ["USE"] and parts[-1]:
+            parts.append([])
+        parts[-1].append(stmt)
+
+    references: Dict[str, Set[str]] = {}
+    all_tables: List[str] = []
+    names: Dict[str, str] = {}
+    used_index_names: Set[str] = set()
+    counts = {"indexes": 0, "foreign_keys": 0, "dropped": 0}
+    planned = []
+
+    for part in parts:
+        database = use_database(part[0]) or ""
+        tables: Dict[str, Tuple[int, TableDefinition]] = {}
+        drops: Dict[int, List[str]] = {}
+        deferred_indexes: List[str] = []
+        deferred_foreign_keys: List[str] = []
+        main: List[Optional[str]] = list(part)
+
+        for index, stmt in enumerate(part):
+            words = leading_words(stmt, 4)
+            if words[:2] == ["CREATE", "TABLE"]:
+                definition = parse_create_table(stmt, defer_foreign_keys, True, database)
+                if definition is None or definition.key in tables:
+                    continue
+                tables[definition.key] = (index, definition)
+                references.setdefault(definition.key, set()).update(definition.references)
+                if definition.key not in names:
+                    all_tables.append(definition.key)
+                    names[definition.key] = definition.display if "." in definition.display or not database \
+                        else f"{database}.{definition.display}"
+            elif words[:2] == ["DROP", "TABLE"]:
+                drops[index] = [table_key(name, database) for name in re.findall(
+                    _NAME, re.sub(r'^\s*(?:(?:--[^\n]*\n|/\*[\s\S]*?\*/)\s*)*DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?', '',
+                                  stmt, flags=re.IGNORECASE).rstrip('; \n'))]
+            elif words[:2] == ["CREATE", "INDEX"] or words[:3] == ["CREATE", "UNIQUE", "INDEX"]:
+                main[index] = None
+                if keep_indexes:
+                    deferred_indexes.append(stmt)
+                    counts["indexes"] += 1
+                else:
+                    counts["dropped"] += 1
+            elif words[:2] == ["ALTER", "TABLE"] and re.search(r'\bFOREIGN\s+KEY\b', stmt, re.IGNORECASE):
+                reference = _REFERENCES.search(stmt)
+                altered, _ = _read_alter_table(stmt)
+                if reference is not None and altered is not None:
+                    references.setdefault(table_key(altered, database), set()).add(
+                        table_key(reference.group("table"), database))
+                if defer_foreign_keys and reference is not None:
+                    main[index] = None
+                    deferred_foreign_keys.append(stmt)
+                    counts["foreign_keys"] += 1
+
+        for index, definition in tables.values():
+            for unique, name, columns in definition.indexes:
+                if not keep_indexes:
+                    counts["dropped"] += 1
+                    continue
+                statement = (f"CREATE {'UNIQUE ' if unique else ''}INDEX "
+                             f"{_index_name(definition, name, columns, used_index_names)} ON {definition.name} ({columns});")
+                deferred_indexes.append(statement)
+                counts["indexes"] += 1
+            for foreign_key in definition.foreign_keys:
+                deferred_foreign_keys.append(f"ALTER TABLE {definition.name} ADD {foreign_key};")
+                counts["foreign_keys"] += 1
+
+        # DROP TABLE поднимается, только если все его таблицы создаются позже в этой части
+        drops = {index: keys for index, keys in drops.items()
+                 if keys and all(key in tables and tables[key][0] > index for key in keys)}
+        planned.append((main, tables, drops, deferred_indexes + deferred_foreign_keys))
+
+    levels, cycles = topological_levels(all_tables, references)
+    order = [table for level in levels for table in level]
+    rank = {table: position for position, table in enumerate(order)}
+
+    segments: List[Tuple[List[str], List[str]]] = []
+    for main, tables, drops, deferred in planned:
+        if tables:
+            first = min([index for index, _ in tables.values()] + list(drops))
+            # Сначала DROP (зависимые таблицы раньше), затем CREATE в топологическом порядке
+            hoisted = [main[index] for index in sorted(drops, key=lambda index: -max(rank[key] for key in drops[index]))]
+            hoisted += [definition.create for _, definition in sorted(tables.values(), key=lambda item: rank[item[1].key])]
+            for index in [*drops, *(index for index, _ in tables.values())]:
+                main[index] = None
+            main = main[:first] + hoisted + main[first:]
+        if deferred:
+            deferred[0] = f"{DEFERRED_COMMENT}\n{deferred[0]}"
+        segments.append(([stmt for stmt in main if stmt is not None], deferred))
+
+    return LoadPlan(
+        segments,
+        [names[table] for table in order],
+        [[names[table] for table in level] for level in levels],
+        [[names[table] for table in cycle] for cycle in cycles],
+        counts["indexes"],
+        counts["foreign_keys"],
+        counts["dropped"],
+        order,
+    )
+
+def _read_alter_table(stmt: str) -> Tuple[Optional[str], int]:
+    """Имя таблицы из ALTER TABLE имя ..."""
+    tokens = tokenize(stmt[:1024])
+    code = [index for index, token in enumerate(tokens) if is_code(token)]
+    if _words(stmt, tokens, code, 2) != ["ALTER", "TABLE"]:
+        return None, 0
+    return _read_name(stmt, tokens, code, 2)
+
+def load_plan_report(plan: LoadPlan) -> Dict[str, Any]:
+    """Сводка плана для ответа API"""
+    return {
+        "order": plan.order,
+        "load_levels": plan.levels,
+        "cycles": plan.cycles,
+        "deferred_indexes": plan.deferred_indexes,
+        "deferred_foreign_keys": plan.deferred_foreign_keys,
+        "dropped_indexes": plan.dropped_indexes,
+    }
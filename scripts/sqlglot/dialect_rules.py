@@ -0,0 +1,299 @@
+# ==================== ИМПОРТЫ ====================
+
+import re
+import threading
+from typing import Dict, List, NamedTuple, Tuple
+
+from sql_lexer import PROTECTED_PATTERN
+
+# ==================== Описание правил ====================
+
+class Rule(NamedTuple):
+    """Одно правило замены: имя (для статистики), шаблон, замена"""
+    name: str
+    pattern: str
+    replacement: str
+    ignore_case: bool = True
+
+# Нормализация форматирования для server.py: весь SQL сжимается в одну строку
+# Одиночный пробел перед значимым символом уже в нужном виде - такие места
+# не считаются совпадением (меньше срабатываний и правок в быстром пути)
+LAYOUT_COMPACT = [
+    Rule("open_paren_ws", r'\(\s+', '('),
+    Rule("close_paren_ws", r'\s+\)', ')'),
+    Rule("comma_ws", r',(?! \S)\s+', ', '),
+    Rule("whitespace", r'(?! \S)\s+', ' '),
+]
+
+# Нормализация для простых замен гибридного транспилятора
+LAYOUT_TIDY = [
+    Rule("double_semicolon", r'\);+', ');'),
+    Rule("multi_space", r'\s{2,}', ' '),
+]
+
+# Нормализация результата sqlglot
+LAYOUT_SQLGLOT = [
+    Rule("comma_spacing", r'\s*,\s*', ', '),
+    Rule("multi_space", r'\s{2,}', ' '),
+    Rule("double_semicolon", r'\);+', ');'),
+]
+
+# Общие правила MySQL -> целевой диалект (используются и server.py, и гибридом)
+DIALECT_RULES: Dict[str, List[Rule]] = {
+    "postgres": [
+        Rule("pk_auto_increment", r'PRIMARY\s+KEY\s+AUTO_INCREMENT\b', 'GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY'),
+        Rule("auto_increment", r'\bAUTO_INCREMENT\b', 'GENERATED BY DEFAULT AS IDENTITY'),
+        Rule("int", r'\bINT\b', 'INTEGER'),
+        Rule("timestamp", r'\bTIMESTAMP\b', 'TIMESTAMPTZ'),
+        Rule("datetime", r'\bDATETIME\b', 'TIMESTAMP'),
+        Rule("backtick", r'`([^`]+)`', r'"\1"', ignore_case=False),
+        Rule("decimal", r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'DECIMAL(\1,\2)'),
+        Rule("on_update", r'ON\s+UPDATE\s+CURRENT_TIMESTAMP', ''),
+    ],
+    "snowflake": [
+        Rule("auto_increment", r'\bAUTO_INCREMENT\b', 'AUTOINCREMENT'),
+        Rule("int", r'\bINT\b', 'NUMBER'),
+        Rule("decimal", r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMBER(\1,\2)'),
+        Rule("datetime", r'\bDATETIME\b', 'TIMESTAMP_NTZ'),
+        Rule("default_current_timestamp", r'DEFAULT\s+CURRENT_TIMESTAMP(?!\()', 'DEFAULT CURRENT_TIMESTAMP()'),
+        Rule("on_update", r'ON\s+UPDATE\s+CURRENT_TIMESTAMP', ''),
+    ],
+    "bigquery": [
+        # FOREIGN KEY не поддерживается: удаляем вместе с соседней запятой
+        Rule("leading_foreign_key",
+             r'\(\s*FOREIGN\s+KEY\s*\([^)]+\)\s*REFERENCES\s*\w+\s*\([^)]+\)(?:\s*ON\s+DELETE\s+\w+)?\s*,?', '('),
+        Rule("foreign_key",
+             r',?\s*FOREIGN\s+KEY\s*\([^)]+\)\s*REFERENCES\s*\w+\s*\([^)]+\)(?:\s*ON\s+DELETE\s+\w+)?', ''),
+        Rule("auto_increment", r'\bAUTO_INCREMENT\b', ''),
+        Rule("int", r'\bINT\b', 'INT64'),
+        # BigQuery STRING не поддерживает размер в скобках
+        Rule("sized_string", r'\b(?:STRING|VARCHAR)\s*\(\s*\d+\s*\)', 'STRING'),
+        Rule("decimal", r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMERIC(\1,\2)'),
+        Rule("datetime", r'\bDATETIME\b', 'TIMESTAMP'),
+        Rule("default_current_timestamp", r'DEFAULT\s+CURRENT_TIMESTAMP(?!\()', 'DEFAULT CURRENT_TIMESTAMP()'),
+        Rule("enum", r'\bENUM\s*\([^)]+\)', 'STRING'),
+    ],
+    "oracle": [
+        Rule("auto_increment", r'\bAUTO_INCREMENT\b', ''),
+        Rule("int", r'\bINT\b', 'NUMBER(10)'),
+        Rule("varchar", r'\bVARCHAR\s*\(\s*', 'VARCHAR2('),
+        Rule("decimal", r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMBER(\1,\2)'),
+        Rule("timestamp", r'\bTIMESTAMP\b', 'TIMESTAMP WITH TIME ZONE'),
+        Rule("datetime", r'\bDATETIME\b', 'DATE'),
+        Rule("default_current_timestamp", r'DEFAULT\s+CURRENT_TIMESTAMP\b', 'DEFAULT SYSTIMESTAMP'),
+        Rule("enum", r'\bENUM\s*\([^)]+\)', 'VARCHAR2(20)'),
+    ],
+    "mssql": [
+        Rule("auto_increment", r'\bAUTO_INCREMENT\b', 'IDENTITY(1,1)'),
+        Rule("timestamp", r'\b(?:TIMESTAMP|DATETIME)\b', 'DATETIME2'),
+        Rule("current_timestamp", r'\bCURRENT_TIMESTAMP\b', 'GETDATE()'),
+        Rule("backtick", r'`([^`]+)`', r'[\1]', ignore_case=False),
+        Rule("identity", r'\bIDENTITY\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'IDENTITY(\1,\2)'),
+        Rule("enum", r'\bENUM\s*\([^)]+\)', 'VARCHAR(20)'),
+        # MSSQL использует INT, а не INT64
+        Rule("int64", r'\bINT64\b', 'INT'),
+        Rule("numeric", r'\bNUMERIC\b', 'DECIMAL'),
+        Rule("string", r'\bSTRING\b', 'VARCHAR'),
+    ],
+    "sqlite": [
+        Rule("auto_increment", r'\bAUTO_INCREMENT\b', 'AUTOINCREMENT'),
+        Rule("int", r'\bINT\b', 'INTEGER'),
+        Rule("varchar", r'\bVARCHAR\s*\(\s*(\d+)\s*\)', 'TEXT'),
+        Rule("decimal", r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', 'REAL'),
+        Rule("temporal", r'\b(?:TIMESTAMP|DATETIME|DATE)\b', 'TEXT'),
+        Rule("enum", r'\bENUM\s*\([^)]+\)', 'TEXT'),
+    ],
+    "redshift": [
+        Rule("auto_increment", r'\bAUTO_INCREMENT\b', 'IDENTITY(1,1)'),
+        Rule("int", r'\bINT\b', 'INTEGER'),
+        Rule("datetime", r'\bDATETIME\b', 'TIMESTAMP'),
+        Rule("current_timestamp", r'\bCURRENT_TIMESTAMP\b', 'GETDATE()'),
+        Rule("identity", r'\bIDENTITY\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'IDENTITY(\1,\2)'),
+        Rule("enum", r'\bENUM\s*\([^)]+\)', 'VARCHAR(20)'),
+    ],
+}
+
+# Исправления кавычек и типов в выводе sqlglot
+SQLGLOT_POST_RULES: Dict[str, List[Rule]] = {
+    "bigquery": [
+        Rule("double_quote", r'"([^"]+)"', r'`\1`', ignore_case=False),
+    ],
+    "postgres": [
+        Rule("backtick", r'`([^`]+)`', r'"\1"', ignore_case=False),
+    ],
+    "oracle": [
+        Rule("backtick", r'`([^`]+)`', r'"\1"', ignore_case=False),
+    ],
+    "redshift": [
+        Rule("backtick", r'`([^`]+)`', r'"\1"', ignore_case=False),
+    ],
+    "mssql": [
+        Rule("backtick", r'`([^`]+)`', r'[\1]', ignore_case=False),
+        Rule("double_quote", r'"([^"]+)"', r'[\1]', ignore_case=False),
+        Rule("int64", r'\bINT64\b', 'INT'),
+        Rule("numeric_precision", r'\bNUMERIC\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'DECIMAL(\1,\2)'),
+        Rule("numeric", r'\bNUMERIC\b', 'DECIMAL'),
+        Rule("string", r'\bSTRING\b', 'VARCHAR'),
+    ],
+}
+
+# Форматирование числовых типов в выводе sqlglot (для всех диалектов)
+NUMERIC_FORMAT_RULES = [
+    Rule("number_precision", r'\bNUMBER\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMBER(\1,\2)'),
+    Rule("decimal_precision", r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'DECIMAL(\1,\2)'),
+    Rule("numeric_precision", r'\bNUMERIC\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMERIC(\1,\2)'),
+]
+
+# ==================== Компиляция ====================
+
+_BACKREF = re.compile(r'\\(\d+)')
+
+class CompiledRuleSet:
+    """Набор правил, скомпилированный в один шаблон-альтернативу.
+
+    Правила проверяются в порядке объявления: при совпадении в одной позиции
+    побеждает первое. Строка переписывается за один проход re.sub;
+    строковые литералы и комментарии пропускаются без изменений.
+    """
+
+    def __init__(self, name: str, rules: List[Rule]):
+        self.name = name
+        self.rules = rules
+        self.hits: Dict[str, int] = {rule.name: 0 for rule in rules}
+        self._hits_lock = threading.Lock()
+
+        # Первая альтернатива захватывает строки и комментарии целиком
+        parts = [f'(?P<skip>{PROTECTED_PATTERN})']
+        self._dispatch_table: List[Tuple[str, str, bool]] = []
+        group_offset = 1
+        for index, rule in enumerate(rules):
+            inner_groups = re.compile(rule.pattern).groups
+            # Номера групп внутри правила сдвигаются на позицию в общем шаблоне
+            offset = group_offset + 1
+            template = _BACKREF.sub(lambda m: f'\\g<{int(m.group(1)) + offset}>', rule.replacement)
+            self._dispatch_table.append((rule.name, template, template != rule.replacement))
+
+            body = f'(?i:{rule.pattern})' if rule.ignore_case else rule.pattern
+            parts.append(f'(?P<r{index}>{body})')
+            group_offset += inner_groups + 1
+
+        self.pattern = re.compile('|'.join(parts)) if rules else None
+
+    def _record_hits(self, counts: Dict[str, int]) -> None:
+        """Добавляет срабатывания одного вызова к общим счётчикам.
+
+        Вызов считает у себя и сливает под блокировкой: наборы правил общие
+        для потоков сокет-сервера, а += по общему словарю теряет приращения.
+        """
+        if not counts:
+            return
+        with self._hits_lock:
+            hits = self.hits
+            for rule_name, count in counts.items():
+                hits[rule_name] += count
+
+    def apply(self, sql: str) -> str:
+        """Переписывает SQL за один проход"""
+        if self.pattern is None:
+            return sql
+        dispatch_table = self._dispatch_table
+        counts: Dict[str, int] = {}
+
+        def dispatch(match: 're.Match') -> str:
+            if match.lastgroup == 'skip':
+                return match.group()
+            rule_name, template, has_groups = dispatch_table[int(match.lastgroup[1:])]
+            counts[rule_name] = counts.get(rule_name, 0) + 1
+            return match.expand(template) if has_groups else template
+
+        result = self.pattern.sub(dispatch, sql)
+        self._record_hits(counts)
+        return result
+
+    def collect_edits(self, sql: str, start: int, end: int, edits: List[Tuple[int, int, str]]) -> None:
+        """Добавляет в edits правки (начало, конец, замена) для диапазона [start, end).
+
+        Текст не копируется: шаблон ищется прямо в исходной строке, правки
+        с заменой, равной исходному тексту, не добавляются.
+        """
+        if self.pattern is None:
+            return
+        dispatch_table = self._dispatch_table
+        counts: Dict[str, int] = {}
+        for match in self.pattern.finditer(sql, start, end):
+            group = match.lastgroup
+            if group == 'skip':
+                continue
+            rule_name, template, has_groups = dispatch_table[int(group[1:])]
+            counts[rule_name] = counts.get(rule_name, 0) + 1
+            replacement = match.expand(template) if has_groups else template
+            match_start, match_end = match.span()
+            if match_end - match_start != len(replacement) or sql[match_start:match_end] != replacement:
+                edits.append((match_start, match_end, replacement))
+        self._record_hits(counts)
+
+    def hit_counts(self) -> Dict[str, int]:
+        """Снимок счётчиков срабатываний"""
+        with self._hits_lock:
+            return dict(self.hits)
+
+    def reset_hits(self) -> None:
+        with self._hits_lock:
+            for rule_name in self.hits:
+                self.hits[rule_name] = 0
+
+# ==================== Реестр ====================
+
+def _stage_rules(stage: str, dialect: str) -> List[Rule]:
+    """Список правил этапа для диалекта; для неизвестного диалекта - только форматирование"""
+    if stage == "sqlglot_post":
+        return SQLGLOT_POST_RULES.get(dialect, []) + NUMERIC_FORMAT_RULES + LAYOUT_SQLGLOT
+    # Правила диалекта идут раньше форматирования: они длиннее и специфичнее
+    rules = DIALECT_RULES.get(dialect, [])
+    return rules + (LAYOUT_COMPACT if stage == "compact" else LAYOUT_TIDY)
+
+# Наборы компилируются при первом обращении: одноразовый запуск server.py
+# не платит за компиляцию правил диалектов, которые не запрашивались
+_REGISTRY: Dict[str, Dict[str, CompiledRuleSet]] = {"compact": {}, "simple": {}, "sqlglot_post": {}}
+
+def get_rule_set(stage: str, dialect: str) -> CompiledRuleSet:
+    """Возвращает скомпилированный набор правил для этапа и диалекта.
+
+    Этапы: "compact" (server.py), "simple" (простые замены гибрида),
+    "sqlglot_post" (пост-обработка вывода sqlglot).
+    """
+    stage_sets = _REGISTRY[stage]
+    rule_set = stage_sets.get(dialect)
+    if rule_set is None:
+        # setdefault атомарен: при гонке потоков все получают один набор (и одни счётчики)
+        rule_set = stage_sets.setdefault(dialect, CompiledRuleSet(f"{stage}:{dialect}", _stage_rules(stage, dialect)))
+    return rule_set
+
+def compile_all_rule_sets() -> int:
+    """Компилирует наборы всех этапов для всех известных диалектов (прогрев)"""
+    for stage in _REGISTRY:
+        for dialect in set(DIALECT_RULES) | {"mysql"}:
+            get_rule_set(stage, dialect)
+    return sum(len(stage_sets) for stage_sets in _REGISTRY.values())
+
+def compiled_rule_sets() -> List[str]:
+    """Имена уже скомпилированных наборов ("этап:диалект")"""
+    return [rule_set.name for stage_sets in _REGISTRY.values() for rule_set in stage_sets.values()]
+
+def rule_hit_counts(nonzero_only: bool = True) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """Счётчики срабатываний правил: {этап: {диалект: {правило: n}}}.
+
+    Учитываются только уже скомпилированные наборы.
+    """
+    counts: Dict[str, Dict[str, Dict[str, int]]] = {}
+    for stage, stage_sets in _REGISTRY.items():
+        for dialect, rule_set in stage_sets.items():
+            hits = {name: n for name, n in rule_set.hit_counts().items() if n or not nonzero_only}
+            if hits:
+                counts.setdefault(stage, {})[dialect] = hits
+    return counts
+
+def reset_rule_hits() -> None:
+    for stage_sets in _REGISTRY.values():
+        for rule_set in stage_sets.values():
+            rule_set.reset_hits()
@@ -6,10 +6,26 @@
 Включает встроенный сложный пример SQL
 """
 
+import os
 import sys
 import re
+import threading
 import time
-from typing import List, Dict, Any
+from contextlib import ExitStack, contextmanager, nullcontext
+from typing import IO, List, Dict, Any, Iterator, Optional, Tuple
+
+from bulk_insert import convert_bulk_insert, iter_bulk_insert, prepare_bulk_insert
+from ddl_dependencies import constraint_profile, load_plan_report, plan_schema_load
+from dialect_rules import get_rule_set
+from insert_batching import BatchOptions, InsertBatcher, batch_statements
+from sql_features import Feature, detect_features, detect_sql_features, features_to_dict, is_complex
+from sql_lexer import (
+    DEFAULT_CHUNK_SIZE, MappedTextReader, Statement, Token, iter_statements_from_file,
+    normalize_statement, split_statements, statement_spans, tokenize
+)
+from transpile_budget import BudgetExceeded, budget_guard, current_budget, time_budget
+from transpile_cache import ENTRY_OVERHEAD_BYTES, LRUCache
+from transpile_trace import current_trace, trace_stage, tracing
 
 # ==================== ВСТРОЕННЫЙ ПРИМЕР SQL ====================
 
@@ -201,187 +217,274 @@ DIALECT_NOTES = {
 # ==================== Детектор сложных конструкций ====================
 
 def detect_complex_features(sql: str) -> Dict[str, bool]:
-    """Определяет наличие сложных SQL конструкций"""
-    sql_upper = sql.upper()
-    
-    features = {
-        "has_window_functions": any(x in sql_upper for x in [
-            "OVER(", "ROW_NUMBER()", "RANK()", "DENSE_RANK()", 
-            "LEAD(", "LAG(", "FIRST_VALUE(", "LAST_VALUE(",
-            "PARTITION BY", "ORDER BY"
-        ]),
-        "has_cte": "WITH" in sql_upper and ("RECURSIVE" in sql_upper or "AS (" in sql_upper),
-        "has_recursive": "WITH RECURSIVE" in sql_upper,
-        "has_rollup": "WITH ROLLUP" in sql_upper or "GROUPING SETS" in sql_upper,
-        "has_pivot": "PIVOT" in sql_upper or "UNPIVOT" in sql_upper,
-        "has_case_when": "CASE WHEN" in sql_upper or "CASE" in sql_upper,
-        "has_subqueries": any(f"({keyword}" in sql_upper for keyword in [
-            "SELECT", "FROM", "WHERE", "HAVING"
-        ]),
-        "has_json_functions": any(x in sql_upper for x in [
-            "JSON_", "->>", "->", "#>", "#>>"
-        ]),
-        "has_string_functions": any(x in sql_upper for x in [
-            "CONCAT(", "SUBSTRING(", "REGEXP_", "LIKE"
-        ]),
-        "has_date_functions": any(x in sql_upper for x in [
-            "DATE_ADD", "DATE_SUB", "DATEDIFF", "YEAR(", "MONTH("
-        ]),
-        "has_aggregate_functions": any(x in sql_upper for x in [
-            "SUM(", "AVG(", "COUNT(", "MAX(", "MIN("
-        ]),
-    }
-    
-    features["is_complex"] = any(features[key] for key in [
-        "has_window_functions", "has_cte", "has_recursive", 
-        "has_rollup", "has_pivot"
-    ])
-    
-    return features
+    """Определяет наличие сложных SQL конструкций (словарь has_... / is_complex)"""
+    return features_to_dict(detect_sql_features(sql))
 
 # ==================== Простые замены (для базовых запросов) ====================
 
 def simple_dialect_conversion(sql: str, dialect: str) -> str:
     """Простая конвертация для базовых запросов (CREATE TABLE, простые SELECT)"""
-    result = sql
+    # Убираем ALTER TABLE с FOREIGN KEY для BigQuery полностью
+    if dialect == "bigquery":
+        sql_upper = sql.upper()
+        if 'ALTER TABLE' in sql_upper and 'ADD FOREIGN KEY' in sql_upper:
+            return ''
     
-    # Общие исправления для всех диалектов
-    result = re.sub(r'\);+', ');', result)  # Убираем двойные точки с запятой
-    result = re.sub(r'\s{2,}', ' ', result)  # Убираем лишние пробелы
-    
-    if dialect == "postgres":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'GENERATED BY DEFAULT AS IDENTITY', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'INTEGER', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TIMESTAMPTZ', result, flags=re.IGNORECASE)
-        result = re.sub(r'`([^`]+)`', r'"\1"', result)
-        result = re.sub(r'\bDATETIME\b', 'TIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'ON UPDATE CURRENT_TIMESTAMP', '', result, flags=re.IGNORECASE)
-        
-    elif dialect == "snowflake":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'AUTOINCREMENT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'NUMBER', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMBER(\1,\2)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDATETIME\b', 'TIMESTAMP_NTZ', result, flags=re.IGNORECASE)
-        result = re.sub(r'DEFAULT CURRENT_TIMESTAMP(?!\()', 'DEFAULT CURRENT_TIMESTAMP()', result, flags=re.IGNORECASE)
-        result = re.sub(r'ON UPDATE CURRENT_TIMESTAMP', '', result, flags=re.IGNORECASE)
-        
-    elif dialect == "bigquery":
-        result = re.sub(r'\bAUTO_INCREMENT\b', '', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'INT64', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bVARCHAR\s*\(\s*(\d+)\s*\)', r'STRING', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMERIC(\1,\2)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDATETIME\b', 'TIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'DEFAULT CURRENT_TIMESTAMP(?!\()', 'DEFAULT CURRENT_TIMESTAMP()', result, flags=re.IGNORECASE)
-        
-        # Убираем FOREIGN KEY для BigQuery полностью
-        result = re.sub(r',?\s*FOREIGN KEY\s*\([^)]+\)\s*REFERENCES\s*\w+\s*\([^)]+\)(\s*ON DELETE\s+\w+)?', 
-                       '', result, flags=re.IGNORECASE)
-        
-        # Убираем ALTER TABLE с FOREIGN KEY для BigQuery
-        if 'ALTER TABLE' in result.upper() and 'ADD FOREIGN KEY' in result.upper():
-            result = ''
-            
-        result = re.sub(r'\bENUM\s*\([^)]+\)', 'STRING', result, flags=re.IGNORECASE)
-        
-    elif dialect == "oracle":
-        result = re.sub(r'\bAUTO_INCREMENT\b', '', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'NUMBER(10)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bVARCHAR\s*\(\s*', 'VARCHAR2(', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMBER(\1,\2)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDATETIME\b', 'DATE', result, flags=re.IGNORECASE)
-        result = re.sub(r'DEFAULT CURRENT_TIMESTAMP', 'DEFAULT SYSTIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bENUM\s*\([^)]+\)', 'VARCHAR2(20)', result, flags=re.IGNORECASE)
-        
-    elif dialect == "mssql":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'IDENTITY(1,1)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'DATETIME2', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDATETIME\b', 'DATETIME2', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bCURRENT_TIMESTAMP\b', 'GETDATE()', result, flags=re.IGNORECASE)
-        result = re.sub(r'`([^`]+)`', r'[\1]', result)
-        result = re.sub(r'\bENUM\s*\([^)]+\)', 'VARCHAR(20)', result, flags=re.IGNORECASE)
-        
-        # MSSQL использует INT, а не INT64
-        result = re.sub(r'\bINT64\b', 'INT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bNUMERIC\b', 'DECIMAL', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bSTRING\b', 'VARCHAR', result, flags=re.IGNORECASE)
-        
-    elif dialect == "sqlite":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'AUTOINCREMENT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'INTEGER', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bVARCHAR\s*\(\s*(\d+)\s*\)', r'TEXT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'REAL', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TEXT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDATETIME\b', 'TEXT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDATE\b', 'TEXT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bENUM\s*\([^)]+\)', 'TEXT', result, flags=re.IGNORECASE)
+    # Общие исправления и замены диалекта - за один проход
+    return get_rule_set("simple", dialect).apply(sql)
+
+# ==================== SQLGlot транспиляция (для сложных запросов) ====================
+
+# Соответствие наших имён диалектов именам sqlglot
+SQLGLOT_DIALECTS = {
+    "mssql": "tsql",
+    "redshift": "redshift",
+    "mysql": "mysql",
+    "postgres": "postgres",
+    "bigquery": "bigquery",
+    "snowflake": "snowflake",
+    "oracle": "oracle",
+    "sqlite": "sqlite"
+}
+
+# sqlglot и классы диалектов загружаются один раз: лениво при первом
+# сложном выражении или заранее через warmup_sqlglot()
+exp = None
+_sqlglot = None
+_dialect_instances: Dict[str, Any] = {}
+
+# Время загрузки в миллисекундах: {"sqlglot": ..., "dialect:postgres": ...}
+SQLGLOT_LOAD_TIMINGS: Dict[str, float] = {}
+
+def load_sqlglot():
+    """Импортирует sqlglot при первом вызове (ImportError пробрасывается)"""
+    global _sqlglot, exp
+    if _sqlglot is None:
+        started = time.perf_counter()
+        with trace_stage("sqlglot.load"):
+            import sqlglot
+            import sqlglot.expressions
+        SQLGLOT_LOAD_TIMINGS["sqlglot"] = round((time.perf_counter() - started) * 1000, 3)
+        exp = sqlglot.expressions
+        _sqlglot = sqlglot
+    return _sqlglot
+
+def get_sqlglot_dialect(dialect: str):
+    """Экземпляр диалекта sqlglot - создаётся один раз на диалект"""
+    instance = _dialect_instances.get(dialect)
+    if instance is None:
+        load_sqlglot()
+        from sqlglot.dialects.dialect import Dialect
         
-    elif dialect == "redshift":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'IDENTITY(1,1)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'INTEGER', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDATETIME\b', 'TIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bCURRENT_TIMESTAMP\b', 'GETDATE()', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bENUM\s*\([^)]+\)', 'VARCHAR(20)', result, flags=re.IGNORECASE)
+        started = time.perf_counter()
+        with trace_stage("sqlglot.load"):
+            instance = Dialect.get_or_raise(SQLGLOT_DIALECTS.get(dialect, dialect))
+        SQLGLOT_LOAD_TIMINGS[f"dialect:{dialect}"] = round((time.perf_counter() - started) * 1000, 3)
+        _dialect_instances[dialect] = instance
+    return instance
+
+def warmup_sqlglot(dialects: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Заранее загружает sqlglot, диалекты и правила пост-обработки.
     
-    return result
+    Пробный разбор и генерация прогревают внутренние кэши sqlglot
+    (токенайзер, генераторы), чтобы первый запрос не платил за них.
+    """
+    dialects = dialects or list(SQLGLOT_DIALECTS)
+    started = time.perf_counter()
+    try:
+        load_sqlglot()
+    except ImportError:
+        return {"loaded": False, "error": "sqlglot not installed"}
+    
+    parsed = parse_with_sqlglot("SELECT a, ROW_NUMBER() OVER (PARTITION BY b ORDER BY c) FROM t", "mysql")
+    for dialect in dialects:
+        get_sqlglot_dialect(dialect)
+        get_datatype_map(dialect)
+        generate_with_sqlglot(parsed, dialect)
+        get_rule_set("simple", dialect)
+    
+    return {"loaded": True, "dialects": dialects,
+            "warmup_ms": round((time.perf_counter() - started) * 1000, 3)}
 
-# ==================== SQLGlot транспиляция (для сложных запросов) ====================
+# Замены типов для генерации через sqlglot: диалект -> [(исходные типы, тип результата,
+# параметры)]. Исходные типы - имена exp.DataType.Type; тип результата выводится
+# как есть. Параметры: None - сохранить точность/длину исходного типа, () - убрать
+# (ширина отображения MySQL, как в INT(11)), кортеж чисел - задать свои.
+_INTEGER_TYPES = ("TINYINT", "UTINYINT", "SMALLINT", "USMALLINT", "MEDIUMINT", "UMEDIUMINT",
+                  "INT", "UINT", "BIGINT", "UBIGINT")
+
+DATATYPE_RULES = {
+    "postgres": [
+        (("TINYINT", "UTINYINT", "SMALLINT", "USMALLINT", "MEDIUMINT", "UMEDIUMINT", "INT"), "INTEGER", ()),
+        (("UINT", "BIGINT"), "BIGINT", ()),
+        (("UBIGINT",), "NUMERIC", (20,)),
+        (("DATETIME",), "TIMESTAMPTZ", None),
+    ],
+    "bigquery": [
+        (_INTEGER_TYPES, "INT64", ()),
+        (("VARCHAR", "CHAR", "NVARCHAR", "NCHAR"), "STRING", ()),
+        (("DECIMAL",), "NUMERIC", ()),
+    ],
+    "oracle": [
+        (("TINYINT", "UTINYINT"), "NUMBER", (3,)),
+        (("SMALLINT", "USMALLINT"), "NUMBER", (5,)),
+        (("MEDIUMINT", "UMEDIUMINT"), "NUMBER", (8,)),
+        (("INT", "UINT"), "NUMBER", (10,)),
+        (("BIGINT",), "NUMBER", (19,)),
+        (("UBIGINT",), "NUMBER", (20,)),
+        (("VARCHAR",), "VARCHAR2", None),
+    ],
+    "snowflake": [
+        (_INTEGER_TYPES, "NUMBER", ()),
+        (("DATETIME",), "TIMESTAMP_NTZ", None),
+    ],
+}
+
+# Таблицы, разрешённые в {exp.DataType.Type: (тип результата, параметры)}
+_datatype_maps: Dict[str, Dict[Any, tuple]] = {}
+
+def get_datatype_map(to_dialect: str) -> Dict[Any, tuple]:
+    """Таблица замен типов для диалекта - строится один раз (при прогреве или первом вызове)"""
+    datatype_map = _datatype_maps.get(to_dialect)
+    if datatype_map is None:
+        load_sqlglot()
+        datatype_type = exp.DataType.Type
+        datatype_map = {
+            datatype_type[source]: (target, params)
+            for sources, target, params in DATATYPE_RULES.get(to_dialect, [])
+            for source in sources
+        }
+        _datatype_maps[to_dialect] = datatype_map
+    return datatype_map
+
+def sqlglot_status() -> Dict[str, Any]:
+    """Состояние загрузки sqlglot - для диагностики"""
+    return {
+        "loaded": _sqlglot is not None,
+        "version": getattr(_sqlglot, "__version__", None),
+        "dialects": sorted(_dialect_instances),
+        "load_ms": dict(SQLGLOT_LOAD_TIMINGS),
+    }
+
+def parse_with_sqlglot(sql: str, from_dialect: str):
+    """Парсит выражение в AST sqlglot (исключения пробрасываются)"""
+    sqlglot = load_sqlglot()
+    read = get_sqlglot_dialect(from_dialect)
+    with trace_stage("sqlglot.parse"), budget_guard():
+        return sqlglot.parse_one(sql, read=read)
+
+# Кэш разобранных AST: (нормализованное выражение, диалект чтения) -> (AST, ошибка).
+# AST в кэше не изменяются: transform() в generate_with_sqlglot работает с копией
+PARSE_CACHE_BYTES = 32 * 1024 * 1024
+
+# Память AST sqlglot примерно пропорциональна длине текста (замер: 60-85 байт на символ)
+AST_BYTES_PER_CHAR = 80
+
+parse_cache = LRUCache(PARSE_CACHE_BYTES)
+
+def parse_cached(sql: str, from_dialect: str, normalized: Optional[str] = None):
+    """parse_with_sqlglot с кэшем; ошибки разбора тоже запоминаются.
+    
+    normalized - текст без различий в пробелах (normalize_statement): одно
+    выражение с разным форматированием разбирается один раз.
+    """
+    key = (sql if normalized is None else normalized, from_dialect)
+    entry = parse_cache.get(key)
+    if entry is None:
+        try:
+            entry = (parse_with_sqlglot(sql, from_dialect), None)
+            size = ENTRY_OVERHEAD_BYTES + len(key[0]) + len(sql) * AST_BYTES_PER_CHAR
+        except Exception as e:
+            entry = (None, e)
+            size = ENTRY_OVERHEAD_BYTES + len(key[0])
+        parse_cache.put(key, entry, size)
+    
+    parsed, error = entry
+    if error is not None:
+        raise error.with_traceback(None)
+    return parsed
+
+def generate_with_sqlglot(parsed, to_dialect: str) -> str:
+    """Трансформирует AST под целевой диалект и генерирует SQL.
+    
+    transform работает с копией, поэтому один AST можно использовать
+    для нескольких целевых диалектов; генератору эта копия отдаётся
+    без повторного копирования.
+    """
+    dialect = get_sqlglot_dialect(to_dialect)
+    
+    # Применяем базовые трансформации для типов данных
+    with trace_stage("sqlglot.transform"), budget_guard():
+        datatype_map = get_datatype_map(to_dialect)
+        transformed = parsed.transform(lambda node: transform_sqlglot_node(node, to_dialect, datatype_map))
+    
+    # Генерируем SQL с форматированием
+    with trace_stage("sqlglot.generate"), budget_guard():
+        result = transformed.sql(dialect=dialect, pretty=True, copy=False)
+    
+    # Пост-обработка
+    with trace_stage("sqlglot.post_process"):
+        return post_process_sqlglot_result(result, to_dialect)
+
+# Начало текста-заглушки sqlglot_fallback - по нему выражение попадает в warnings
+SQLGLOT_FALLBACK_PREFIXES = ("-- ERROR", "-- SQLGlot parse error")
+
+def sqlglot_fallback(sql: str, error: Exception) -> str:
+    """Текст-заглушка с исходным запросом, если sqlglot не справился"""
+    if isinstance(error, ImportError):
+        return f"-- ERROR: sqlglot not installed. Install with: pip install sqlglot\n-- Original query:\n{sql}"
+    error_msg = str(error)
+    if "Parse error" in error_msg:
+        return f"-- SQLGlot parse error. Using fallback conversion.\n-- Original query:\n{sql}"
+    return f"-- ERROR in sqlglot transpilation: {error_msg[:200]}\n-- Original query:\n{sql}"
+
+class SharedParse:
+    """Разбор выражения sqlglot, выполняемый не более одного раза.
+    
+    Используется, когда одно выражение генерируется в несколько диалектов:
+    и AST, и ошибка парсинга запоминаются.
+    """
+    
+    def __init__(self, sql: str, from_dialect: str, normalized: Optional[str] = None):
+        self.sql = sql
+        self.from_dialect = from_dialect
+        self.normalized = normalized
+        self._parsed = None
+        self._error: Optional[Exception] = None
+        self._done = False
+    
+    def get(self):
+        # BudgetExceeded не запоминается: следующий диалект попробует разобрать снова
+        if not self._done:
+            try:
+                self._parsed = parse_cached(self.sql, self.from_dialect, self.normalized)
+            except Exception as e:
+                self._error = e
+            self._done = True
+        if self._error is not None:
+            raise self._error
+        return self._parsed
 
-def transpile_with_sqlglot(sql: str, from_dialect: str, to_dialect: str) -> str:
+def transpile_with_sqlglot(sql: str, from_dialect: str, to_dialect: str,
+                           shared_parse: Optional[SharedParse] = None) -> str:
     """Использует sqlglot для транспиляции сложных запросов"""
     try:
-        import sqlglot
-        import sqlglot.expressions as exp
-        
-        # Настройки для разных диалектов
-        dialect_mapping = {
-            "mssql": "tsql",
-            "redshift": "redshift",
-            "mysql": "mysql",
-            "postgres": "postgres",
-            "bigquery": "bigquery",
-            "snowflake": "snowflake",
-            "oracle": "oracle",
-            "sqlite": "sqlite"
-        }
-        
-        read_dialect = dialect_mapping.get(from_dialect, from_dialect)
-        write_dialect = dialect_mapping.get(to_dialect, to_dialect)
-        
-        # Парсим и трансформируем
-        parsed = sqlglot.parse_one(sql, read=read_dialect)
+        # Парсим (или берём уже разобранный AST) и трансформируем
+        parsed = shared_parse.get() if shared_parse else parse_cached(sql, from_dialect)
         
         if not parsed:
             return sql
         
-        # Применяем базовые трансформации для типов данных
-        transformed = parsed.transform(lambda node: transform_sqlglot_node(node, to_dialect))
-        
-        # Генерируем SQL с форматированием
-        result = transformed.sql(dialect=write_dialect, pretty=True)  # Изменено на pretty=True
-        
-        # Пост-обработка
-        result = post_process_sqlglot_result(result, to_dialect)
+        return generate_with_sqlglot(parsed, to_dialect)
         
-        return result
-        
-    except ImportError:
-        return f"-- ERROR: sqlglot not installed. Install with: pip install sqlglot\n-- Original query:\n{sql}"
     except Exception as e:
-        error_msg = str(e)
-        if "Parse error" in error_msg:
-            return f"-- SQLGlot parse error. Using fallback conversion.\n-- Original query:\n{sql}"
-        else:
-            return f"-- ERROR in sqlglot transpilation: {error_msg[:200]}\n-- Original query:\n{sql}"
+        return sqlglot_fallback(sql, e)
 
 
-def transform_sqlglot_node(node, to_dialect: str):
+def transform_sqlglot_node(node, to_dialect: str, datatype_map: Optional[Dict[Any, tuple]] = None):
     """Трансформирует узлы AST для разных диалектов"""
-    import sqlglot.expressions as exp
-    
     if isinstance(node, exp.DataType):
-        return transform_sqlglot_datatype(node, to_dialect)
+        return transform_sqlglot_datatype(node, to_dialect, datatype_map)
     
     # Для оконных функций добавляем совместимые преобразования
     if isinstance(node, exp.Window):
@@ -389,44 +492,25 @@ def transform_sqlglot_node(node, to_dialect: str):
     
     return node
 
-def transform_sqlglot_datatype(datatype, to_dialect: str):
-    """Трансформирует типы данных через sqlglot"""
-    import sqlglot.expressions as exp
+def transform_sqlglot_datatype(datatype, to_dialect: str, datatype_map: Optional[Dict[Any, tuple]] = None):
+    """Трансформирует типы данных по таблице get_datatype_map (без рендеринга SQL узла)"""
+    if datatype_map is None:
+        datatype_map = get_datatype_map(to_dialect)
     
-    dtype_str = str(datatype).upper()
+    target = datatype_map.get(datatype.this)
+    if target is None:
+        return datatype
     
-    if to_dialect == "postgres":
-        if "INT" in dtype_str and "INTEGER" not in dtype_str:
-            return exp.DataType(this="INTEGER")
-        elif "DATETIME" in dtype_str:
-            return exp.DataType(this="TIMESTAMPTZ")
-            
-    elif to_dialect == "bigquery":
-        if "INT" in dtype_str:
-            return exp.DataType(this="INT64")
-        elif "VARCHAR" in dtype_str or "CHAR" in dtype_str:
-            return exp.DataType(this="STRING")
-        elif "DECIMAL" in dtype_str or "NUMERIC" in dtype_str:
-            return exp.DataType(this="NUMERIC")
-            
-    elif to_dialect == "oracle":
-        if "INT" in dtype_str or "INTEGER" in dtype_str:
-            return exp.DataType.build("NUMBER(10)")
-        elif "VARCHAR" in dtype_str:
-            return exp.DataType.build("VARCHAR2")
-            
-    elif to_dialect == "snowflake":
-        if "INT" in dtype_str:
-            return exp.DataType(this="NUMBER")
-        elif "DATETIME" in dtype_str:
-            return exp.DataType(this="TIMESTAMP_NTZ")
-            
-    return datatype
+    name, params = target
+    if params is None:
+        # Точность и длина исходного типа сохраняются
+        expressions = datatype.args.get("expressions") or []
+    else:
+        expressions = [exp.DataTypeParam(this=exp.Literal.number(param)) for param in params]
+    return exp.DataType(this=name, expressions=expressions, nested=False)
 
 def transform_sqlglot_window(window_node, to_dialect: str):
     """Трансформирует оконные функции для разных диалектов"""
-    import sqlglot.expressions as exp
-    
     # Для некоторых диалектов нужны специальные настройки оконных функций
     if to_dialect == "bigquery":
         # BigQuery требует явного указания WINDOW в некоторых случаях
@@ -439,17 +523,10 @@ def transform_sqlglot_window(window_node, to_dialect: str):
 
 def post_process_sqlglot_result(sql: str, dialect: str) -> str:
     """Пост-обработка результата sqlglot"""
-    # Исправляем форматирование
-    sql = re.sub(r'\s{2,}', ' ', sql)
-    sql = re.sub(r'\s+,', ',', sql)
-    sql = re.sub(r',\s*', ', ', sql)
-    
-    # Убираем двойные точки с запятой
-    sql = re.sub(r'\);+', ');', sql)
+    # Форматирование, кавычки и числовые типы - за один проход
+    sql = get_rule_set("sqlglot_post", dialect).apply(sql)
     
-    # Диалект-специфичные исправления кавычек
     if dialect == "bigquery":
-        sql = re.sub(r'"([^"]+)"', r'`\1`', sql)
         # Убираем FOREIGN KEY комментарии для BigQuery
         lines = sql.split('\n')
         cleaned_lines = []
@@ -458,138 +535,535 @@ def post_process_sqlglot_result(sql: str, dialect: str) -> str:
                 continue  # Пропускаем FOREIGN KEY для BigQuery
             cleaned_lines.append(line)
         sql = '\n'.join(cleaned_lines)
-        
-    elif dialect in ["postgres", "oracle", "redshift"]:
-        sql = re.sub(r'`([^`]+)`', r'"\1"', sql)
-    elif dialect == "mssql":
-        sql = re.sub(r'`([^`]+)`', r'[\1]', sql)
-        sql = re.sub(r'"([^"]+)"', r'[\1]', sql)
-        # Исправляем типы для MSSQL
-        sql = re.sub(r'\bINT64\b', 'INT', sql, flags=re.IGNORECASE)
-        sql = re.sub(r'\bNUMERIC\b', 'DECIMAL', sql, flags=re.IGNORECASE)
-        sql = re.sub(r'\bSTRING\b', 'VARCHAR', sql, flags=re.IGNORECASE)
-    
-    # Исправляем форматирование числовых типов
-    sql = re.sub(r'NUMBER\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMBER(\1,\2)', sql, flags=re.IGNORECASE)
-    sql = re.sub(r'DECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'DECIMAL(\1,\2)', sql, flags=re.IGNORECASE)
-    sql = re.sub(r'NUMERIC\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMERIC(\1,\2)', sql, flags=re.IGNORECASE)
     
     return sql.strip()
 
 # ==================== Гибридный транспилятор ====================
 
-def hybrid_transpile(sql: str, from_dialect: str, to_dialect: str) -> Dict[str, Any]:
-    """Гибридная транспиляция: использует правильный подход для каждого типа запроса"""
-    
-    # Анализируем SQL
-    features = detect_complex_features(sql)
-    warnings = []
-    method_used = {"simple": 0, "sqlglot": 0}
+# Параллельный режим: минимальное число выражений и размер пачки для воркера
+PARALLEL_MIN_STATEMENTS = 200
+PARALLEL_CHUNK_SIZE = 64
+
+# Метод выражения, для которого sqlglot не уложился в бюджет времени
+TIMED_OUT_METHOD = "timed_out"
+
+# Память выражений: одинаковые выражения (в т.ч. между вызовами) транспилируются один раз
+STATEMENT_MEMO_BYTES = 32 * 1024 * 1024
+statement_memo = LRUCache(STATEMENT_MEMO_BYTES)
+
+def transpile_statement(stmt: str, from_dialect: str, to_dialect: str,
+                        complex_statement: Optional[bool] = None,
+                        shared_parse: Optional[SharedParse] = None) -> Tuple[str, str]:
+    """Транспилирует одно выражение, возвращает (результат, метод)"""
+    # Определяем, сложный ли это запрос
+    if complex_statement is None:
+        complex_statement = is_complex(detect_sql_features(stmt))
     
-    # Разбиваем на отдельные выражения
-    statements = split_sql_statements(sql)
-    transpiled_statements = []
+    budget = current_budget() if complex_statement else None
+    if budget is not None:
+        budget.start_statement()
     
-    for stmt in statements:
-        if not stmt.strip():
-            transpiled_statements.append("")
-            continue
-        
-        # Пропускаем пустые ALTER TABLE для BigQuery
-        if to_dialect == "bigquery" and "ALTER TABLE" in stmt.upper() and "ADD FOREIGN KEY" in stmt.upper():
-            continue
-            
-        # Определяем, сложный ли это запрос
-        stmt_features = detect_complex_features(stmt)
-        
-        if stmt_features["is_complex"]:
-            # Используем sqlglot для сложных запросов
-            method_used["sqlglot"] += 1
-            transpiled = transpile_with_sqlglot(stmt, from_dialect, to_dialect)
+    if complex_statement:
+        # Используем sqlglot для сложных запросов
+        method = "sqlglot"
+        try:
+            transpiled = transpile_with_sqlglot(stmt, from_dialect, to_dialect, shared_parse)
             
             # Добавляем комментарий о методе (только для демонстрации)
             if not transpiled.strip().startswith("--"):
                 transpiled = f"-- [Using sqlglot for complex features]\n{transpiled}"
-                
-        else:
-            # Используем простые замены для базовых запросов
-            method_used["simple"] += 1
+        except BudgetExceeded:
+            # Бюджет времени исчерпан - быстрые замены вместо sqlglot
+            method = TIMED_OUT_METHOD
+            with trace_stage("simple"):
+                transpiled = simple_dialect_conversion(stmt, to_dialect)
+            
+    else:
+        # Используем простые замены для базовых запросов
+        method = "simple"
+        with trace_stage("simple"):
             transpiled = simple_dialect_conversion(stmt, to_dialect)
-        
+    
+    with trace_stage("dialect_processing"):
         # Диалект-специфичная пост-обработка
         transpiled = apply_dialect_specific_processing(transpiled, to_dialect)
         
         # Убираем двойные точки с запятой
         transpiled = re.sub(r'\);+', ');', transpiled)
-        
-        transpiled_statements.append(transpiled)
+    
+    return transpiled, method
+
+def prepare_statement(sql: str, tokens: List[Token], statement: Statement, use_memo: bool = True) -> Dict[str, Any]:
+    """Общая для всех целевых диалектов подготовка выражения"""
+    bulk = prepare_bulk_insert(sql, statement.start, statement.end)
+    if bulk is not None:
+        return bulk
+    return _prepare_tokenized(sql, tokens, statement, use_memo)
+
+def prepare_statement_text(stmt: str, use_memo: bool = True) -> Dict[str, Any]:
+    """prepare_statement для текста одного выражения.
+    
+    INSERT ... VALUES только с литералами (дампы) распознаётся до
+    токенизации: такие выражения не разбиваются на токены вовсе.
+    """
+    bulk = prepare_bulk_insert(stmt)
+    if bulk is not None:
+        return bulk
+    with trace_stage("split"):
+        tokens = tokenize(stmt)
+    return _prepare_tokenized(stmt, tokens, Statement(0, len(stmt), 0, len(tokens)), use_memo)
+
+def _prepare_tokenized(sql: str, tokens: List[Token], statement: Statement, use_memo: bool) -> Dict[str, Any]:
+    stmt = sql[statement.start:statement.end]
+    with trace_stage("detect"):
+        features = detect_features(sql, tokens, statement.first_token, statement.last_token)
+    
+    with trace_stage("prepare"):
+        return {
+            "sql": stmt,
+            "features": features,
+            "is_complex": is_complex(features),
+            "alter_foreign_key": bool(features & Feature.ALTER_FOREIGN_KEY),
+            "normalized": normalize_statement(sql, tokens, statement.first_token, statement.last_token)
+                          if use_memo else None,
+            "parse": None,
+        }
+
+def convert_prepared_statement(prepared: Dict[str, Any], from_dialect: str, to_dialect: str,
+                               method_used: Dict[str, Any], use_memo: bool = True,
+                               warnings: Optional[List[str]] = None, index: int = 0) -> Optional[str]:
+    """Транспилирует подготовленное выражение (с мемоизацией); None - выражение пропущено"""
+    # Пропускаем пустые ALTER TABLE для BigQuery
+    if to_dialect == "bigquery" and prepared["alter_foreign_key"]:
+        return None
+    
+    trace = current_trace()
+    started = time.perf_counter_ns() if trace is not None else 0
+    
+    memo_key = None
+    memoized = None
+    if use_memo and prepared["normalized"] is not None:
+        memo_key = (prepared["normalized"], from_dialect, to_dialect)
+        memoized = statement_memo.get(memo_key)
+    
+    if prepared.get("bulk_insert") is not None:
+        # Дамп INSERT ... VALUES: литералы переписываются без токенов и без памяти выражений
+        with trace_stage("bulk_insert"):
+            transpiled = convert_bulk_insert(prepared["sql"], prepared["bulk_insert"], to_dialect)
+        method = "simple"
+        method_used["bulk_insert"] += 1
+        method_used["computed"] += 1
+    elif memoized is not None:
+        transpiled, method = memoized
+        method_used["reused"] += 1
+    else:
+        if prepared["is_complex"] and prepared["parse"] is None:
+            prepared["parse"] = SharedParse(prepared["sql"], from_dialect, prepared["normalized"])
+        transpiled, method = transpile_statement(
+            prepared["sql"], from_dialect, to_dialect,
+            prepared["is_complex"], prepared["parse"]
+        )
+        method_used["computed"] += 1
+        if method == TIMED_OUT_METHOD:
+            # Результат зависит от нагрузки, поэтому в память выражений не попадает
+            method_used[TIMED_OUT_METHOD] += 1
+            method = "simple"
+            if warnings is not None:
+                warnings.append(f"Statement {index + 1}: sqlglot exceeded the time budget, fast conversion used")
+        elif memo_key is not None:
+            statement_memo.put(memo_key, (transpiled, method),
+                               ENTRY_OVERHEAD_BYTES + len(memo_key[0]) + len(transpiled))
+    
+    method_used[method] += 1
+    if trace is not None:
+        trace.add_statement(time.perf_counter_ns() - started, index, to_dialect, method, memoized is not None)
+    if warnings is not None and method == "sqlglot" and transpiled.startswith(SQLGLOT_FALLBACK_PREFIXES):
+        warnings.append(f"Statement {index + 1}: sqlglot could not convert it, original query kept")
+    return transpiled
+
+def iter_prepared_bulk_insert(prepared: Dict[str, Any], to_dialect: str, method_used: Dict[str, Any],
+                              index: int = 0) -> Iterator[str]:
+    """convert_prepared_statement для дампа INSERT ... VALUES, но результат отдаётся блоками
+    (этап bulk_insert в трассировке включает и запись блоков)"""
+    trace = current_trace()
+    started = time.perf_counter_ns() if trace is not None else 0
+    method_used["bulk_insert"] += 1
+    method_used["computed"] += 1
+    method_used["simple"] += 1
+    with trace_stage("bulk_insert"):
+        yield from iter_bulk_insert(prepared["sql"], prepared["bulk_insert"], to_dialect)
+    if trace is not None:
+        trace.add_statement(time.perf_counter_ns() - started, index, to_dialect, "simple", False)
+
+def new_method_counter() -> Dict[str, Any]:
+    return {"simple": 0, "sqlglot": 0, TIMED_OUT_METHOD: 0, "bulk_insert": 0, "computed": 0, "reused": 0}
+
+def finish_method_counter(method_used: Dict[str, Any]) -> str:
+    """Дописывает долю переиспользованных выражений, возвращает основной метод"""
+    processed = method_used["computed"] + method_used["reused"]
+    method_used["reuse_ratio"] = round(method_used["reused"] / processed, 4) if processed else 0.0
     
     # Определяем основной использованный метод
     if method_used["sqlglot"] > method_used["simple"]:
-        primary_method = "sqlglot"
+        return "sqlglot"
+    return "simple"
+
+def convert_statements(statements: List[Dict[str, Any]], from_dialect: str, to_dialects: List[str],
+                       use_memo: bool = True, first_index: int = 0) -> Tuple[Dict[str, tuple], int]:
+    """Последовательно конвертирует выражения во все целевые диалекты.
+    
+    Возвращает ({диалект: (тексты, счётчики методов, предупреждения)},
+    число выражений, разобранных sqlglot).
+    """
+    converted = {}
+    for to_dialect in to_dialects:
+        method_used = new_method_counter()
+        transpiled_statements = []
+        warnings: List[str] = []
+        
+        for offset, prepared in enumerate(statements):
+            transpiled = convert_prepared_statement(prepared, from_dialect, to_dialect, method_used,
+                                                    use_memo, warnings, first_index + offset)
+            if transpiled is not None:
+                transpiled_statements.append(transpiled)
+        
+        converted[to_dialect] = (transpiled_statements, method_used, warnings)
+    
+    return converted, sum(1 for prepared in statements if prepared["parse"] is not None)
+
+# Пул процессов текущего запуска (см. statement_pool), привязан к потоку
+_pool_state = threading.local()
+
+@contextmanager
+def statement_pool(workers: Optional[int] = None) -> Iterator[Any]:
+    """Один пул процессов на всё время блока.
+
+    transpile_many, hybrid_transpile_stream и пакет запросов внутри блока
+    используют этот пул, а не запускают свой. Во вложенном блоке остаётся
+    внешний пул (и его число процессов). Процессы запускаются при первой
+    отправке работы, так что пустой блок почти ничего не стоит.
+    """
+    current = getattr(_pool_state, "executor", None)
+    if current is not None:
+        yield current
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    
+    executor = ProcessPoolExecutor(max_workers=workers)
+    _pool_state.executor = executor
+    try:
+        yield executor
+    finally:
+        _pool_state.executor = None
+        executor.shutdown()
+
+def _worker_context() -> Tuple[Optional[Tuple[Optional[float], Optional[float]]], Optional[int]]:
+    """Бюджет и трассировка текущего запроса для воркеров пула.
+
+    Бюджет - (мс на выражение, срок запроса по time.time()): часы
+    perf_counter разных процессов несравнимы. Трассировка - число
+    самых медленных выражений или None.
+    """
+    budget = current_budget()
+    budget_payload = None
+    if budget is not None:
+        deadline = None
+        if budget.request_deadline is not None:
+            deadline = time.time() + budget.request_deadline - time.perf_counter()
+        budget_payload = (budget.statement_s * 1000 if budget.statement_s else None, deadline)
+    trace = current_trace()
+    return budget_payload, trace.slowest if trace is not None else None
+
+def _convert_statements_chunk(payload: tuple) -> Tuple[Dict[str, tuple], int, Optional[Dict[str, Any]]]:
+    """Точка входа воркера пула процессов: бюджет и трассировка - из родителя"""
+    statements, from_dialect, to_dialects, use_memo, first_index, budget, trace_slowest = payload
+    with ExitStack() as stack:
+        if budget is not None:
+            statement_ms, deadline = budget
+            # Истёкший срок - минимальный бюджет, а не его отсутствие
+            request_ms = max((deadline - time.time()) * 1000, 0.001) if deadline is not None else None
+            stack.enter_context(time_budget(statement_ms, request_ms))
+        trace = stack.enter_context(tracing(trace_slowest)) if trace_slowest is not None else None
+        converted, parsed = convert_statements(statements, from_dialect, to_dialects, use_memo, first_index)
+    return converted, parsed, trace.report() if trace is not None else None
+
+def convert_statements_parallel(statements: List[Dict[str, Any]], from_dialect: str, to_dialects: List[str],
+                                use_memo: bool = True, workers: Optional[int] = None,
+                                chunk_size: int = PARALLEL_CHUNK_SIZE,
+                                first_index: int = 0) -> Tuple[Dict[str, tuple], int]:
+    """То же, что convert_statements, но пачками в пуле процессов.
+    
+    Порядок выражений и предупреждений сохраняется: executor.map отдаёт
+    результаты пачек в порядке отправки. У каждого воркера своя память
+    выражений, поэтому повторы между пачками снова вычисляются. Бюджет
+    времени запроса действует и в воркерах, их этапы и медленные выражения
+    попадают в трассировку. Пул - из statement_pool (внешний или свой).
+    """
+    budget, trace_slowest = _worker_context()
+    chunks = [
+        (statements[start:start + chunk_size], from_dialect, to_dialects, use_memo, first_index + start,
+         budget, trace_slowest)
+        for start in range(0, len(statements), chunk_size)
+    ]
+    
+    merged = {to_dialect: ([], new_method_counter(), []) for to_dialect in to_dialects}
+    parsed_statements = 0
+    trace = current_trace()
+    
+    with statement_pool(workers) as executor:
+        for converted, parsed, report in executor.map(_convert_statements_chunk, chunks):
+            parsed_statements += parsed
+            if report is not None and trace is not None:
+                trace.merge(report)
+            for to_dialect, (texts, method_used, warnings) in converted.items():
+                merged_texts, merged_methods, merged_warnings = merged[to_dialect]
+                merged_texts.extend(texts)
+                merged_warnings.extend(warnings)
+                for method, count in method_used.items():
+                    merged_methods[method] += count
+    
+    return merged, parsed_statements
+
+def transpile_many(sql: str, from_dialect: str, to_dialects: List[str], use_memo: bool = True,
+                   parallel: bool = False, workers: Optional[int] = None,
+                   batching: Optional[BatchOptions] = None, defer_constraints: bool = False) -> Dict[str, Any]:
+    """Транспиляция в несколько диалектов: разбор один раз, генерация N раз.
+    
+    Разбиение на выражения, поиск сложных конструкций и парсинг sqlglot
+    общие для всех целей; для каждого диалекта выполняются только
+    трансформация и генерация. parallel=True распределяет выражения по
+    пулу процессов, если их не меньше PARALLEL_MIN_STATEMENTS; один пул
+    на весь вызов (см. statement_pool).
+    batching - перегруппировать INSERT в пачки по лимитам целевого диалекта.
+    defer_constraints - таблицы в порядке внешних ключей, индексы и внешние
+    ключи - в конце скрипта (см. ddl_dependencies.plan_schema_load).
+    """
+    
+    if defer_constraints:
+        # План зависит от того, что диалект делает с индексами и внешними ключами
+        groups: Dict[Tuple[bool, bool], List[str]] = {}
+        for to_dialect in to_dialects:
+            groups.setdefault(constraint_profile(to_dialect), []).append(to_dialect)
+        if len(groups) > 1:
+            merged = None
+            with statement_pool(workers) if parallel else nullcontext():
+                for group in groups.values():
+                    part = transpile_many(sql, from_dialect, group, use_memo, parallel, workers, batching, True)
+                    if merged is None:
+                        merged = part
+                    else:
+                        merged["results"].update(part["results"])
+                        merged["parsed_statements"] += part["parsed_statements"]
+                        merged["parallel"] = merged["parallel"] or part["parallel"]
+            merged["to_dialects"] = list(to_dialects)
+            return merged
+    
+    # Разбиваем на отдельные выражения; токенизируется каждое отдельно,
+    # чтобы дампы INSERT ... VALUES можно было распознать до токенизации
+    with trace_stage("split"):
+        spans = statement_spans(sql)
+    load_plan = None
+    if defer_constraints and to_dialects:
+        with trace_stage("plan_schema"):
+            plan = plan_schema_load([sql[start:end] for start, end in spans], to_dialects[0])
+        statements = [prepare_statement_text(stmt, use_memo) for stmt in plan.statements]
+        load_plan = load_plan_report(plan)
+    else:
+        statements = [prepare_statement_text(sql[start:end], use_memo) for start, end in spans]
+    
+    # Сводка по скрипту - объединение признаков выражений, без повторного просмотра
+    script_features = Feature.NONE
+    for prepared in statements:
+        script_features |= prepared["features"]
+    features = features_to_dict(script_features)
+    
+    # На маленьких скриптах запуск пула дороже самой работы
+    use_pool = parallel and len(statements) >= PARALLEL_MIN_STATEMENTS and (workers is None or workers > 1)
+    if use_pool:
+        # Этапы внутри процессов пула попадают в трассировку как worker.*
+        with trace_stage("convert_parallel"):
+            converted, parsed_statements = convert_statements_parallel(
+                statements, from_dialect, to_dialects, use_memo, workers
+            )
     else:
-        primary_method = "simple"
+        converted, parsed_statements = convert_statements(statements, from_dialect, to_dialects, use_memo)
+    
+    results = {}
+    for to_dialect in to_dialects:
+        transpiled_statements, method_used, warnings = converted[to_dialect]
+        primary_method = finish_method_counter(method_used)
+        
+        insert_batching = None
+        if batching is not None:
+            with trace_stage("batch_inserts"):
+                transpiled_statements, insert_batching = batch_statements(transpiled_statements, to_dialect, batching)
+        
+        # Собираем результат
+        with trace_stage("assemble"):
+            result_sql = "\n\n".join([s for s in transpiled_statements if s.strip()])
+            
+            # Добавляем финальную точку с запятой если нужно
+            if result_sql.strip() and not result_sql.rstrip().endswith(';'):
+                result_sql = result_sql.rstrip() + ';'
+        
+        results[to_dialect] = {
+            "success": True,
+            "transpiled": [result_sql],
+            "from_dialect": from_dialect,
+            "to_dialect": to_dialect,
+            "features_detected": features,
+            "methods_used": method_used,
+            "primary_method": primary_method,
+            "total_statements": len(statements),
+            "parallel": use_pool,
+            "insert_batching": insert_batching,
+            "load_plan": load_plan,
+            "warnings": warnings,
+            "note": DIALECT_NOTES.get(to_dialect, "Check dialect-specific documentation")
+        }
     
-    # Собираем результат
-    result_sql = "\n\n".join([s for s in transpiled_statements if s.strip()])
+    return {
+        "success": True,
+        "from_dialect": from_dialect,
+        "to_dialects": list(to_dialects),
+        "features_detected": features,
+        "total_statements": len(statements),
+        "parsed_statements": parsed_statements,
+        "parallel": use_pool,
+        "results": results
+    }
+
+def hybrid_transpile(sql: str, from_dialect: str, to_dialect: str, use_memo: bool = True,
+                     parallel: bool = False, workers: Optional[int] = None,
+                     batching: Optional[BatchOptions] = None, defer_constraints: bool = False) -> Dict[str, Any]:
+    """Гибридная транспиляция: использует правильный подход для каждого типа запроса"""
+    return transpile_many(sql, from_dialect, [to_dialect], use_memo, parallel, workers,
+                          batching, defer_constraints)["results"][to_dialect]
+
+def hybrid_transpile_stream(source: IO[str], output: IO[str], from_dialect: str, to_dialect: str,
+                            use_memo: bool = True, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            batching: Optional[BatchOptions] = None, parallel: bool = False,
+                            workers: Optional[int] = None) -> Dict[str, Any]:
+    """Потоковая гибридная транспиляция: читает source блоками и пишет в output.
+    
+    Каждое выражение записывается сразу после конвертации, поэтому память
+    ограничена размером самого большого выражения, а не всего файла.
+    Дамп INSERT ... VALUES пишется блоками по мере конвертации, и его
+    результат целиком в памяти не собирается. С batching результат INSERT
+    собирается целиком (около двух размеров выражения) и добавляется пачка,
+    которая не больше лимита диалекта.
+    parallel=True конвертирует выражения окнами в одном пуле процессов на
+    весь файл; в памяти добавляется окно выражений (PARALLEL_CHUNK_SIZE
+    на процесс, вдвое, но не меньше PARALLEL_MIN_STATEMENTS). Дампы
+    INSERT ... VALUES конвертируются в текущем процессе.
+    Результат тот же, что у hybrid_transpile, но без текста в ответе.
+    """
+    script_features = Feature.NONE
+    method_used = new_method_counter()
+    warnings: List[str] = []
+    total_statements = 0
+    last_written = ""
+    batcher = InsertBatcher(to_dialect, batching) if batching is not None else None
+    use_pool = parallel and (workers is None or workers > 1)
+    window = max(PARALLEL_MIN_STATEMENTS, 2 * PARALLEL_CHUNK_SIZE * (workers or os.cpu_count() or 1))
+    pending: List[Dict[str, Any]] = []
+    pending_start = 0
+    
+    def write(statements: List[str]) -> None:
+        nonlocal last_written
+        for statement in statements:
+            if last_written:
+                output.write("\n\n")
+            output.write(statement)
+            last_written = statement
+    
+    def write_blocks(blocks: Iterator[str]) -> None:
+        """Одно выражение, записанное по частям"""
+        nonlocal last_written
+        if last_written:
+            output.write("\n\n")
+        for block in blocks:
+            output.write(block)
+            if block:
+                last_written = block
+    
+    def emit(transpiled: Optional[str]) -> None:
+        if transpiled is None or not transpiled.strip():
+            return
+        write(batcher.feed(transpiled) if batcher is not None else [transpiled])
+    
+    def flush() -> None:
+        """Конвертирует накопленное окно; маленькое окно (конец файла) - без пула"""
+        if not pending:
+            return
+        if len(pending) >= PARALLEL_MIN_STATEMENTS:
+            with trace_stage("convert_parallel"):
+                converted, _ = convert_statements_parallel(pending, from_dialect, [to_dialect], use_memo,
+                                                           workers, first_index=pending_start)
+        else:
+            converted, _ = convert_statements(pending, from_dialect, [to_dialect], use_memo, pending_start)
+        texts, window_methods, window_warnings = converted[to_dialect]
+        for method, count in window_methods.items():
+            method_used[method] += count
+        warnings.extend(window_warnings)
+        for transpiled in texts:
+            emit(transpiled)
+        pending.clear()
+    
+    with statement_pool(workers) if use_pool else nullcontext():
+        for stmt, _, _ in iter_statements_from_file(source, chunk_size):
+            total_statements += 1
+            prepared = prepare_statement_text(stmt, use_memo)
+            
+            # Сводка по скрипту - объединение признаков выражений
+            script_features |= prepared["features"]
+            
+            if batcher is None and prepared.get("bulk_insert") is not None:
+                flush()
+                write_blocks(iter_prepared_bulk_insert(prepared, to_dialect, method_used, total_statements - 1))
+                continue
+            
+            if use_pool:
+                if not pending:
+                    pending_start = total_statements - 1
+                pending.append(prepared)
+                if len(pending) >= window:
+                    flush()
+                continue
+            
+            emit(convert_prepared_statement(prepared, from_dialect, to_dialect, method_used,
+                                            use_memo, warnings, total_statements - 1))
+        flush()
+    
+    if batcher is not None:
+        write(batcher.finish())
     
     # Добавляем финальную точку с запятой если нужно
-    if result_sql.strip() and not result_sql.rstrip().endswith(';'):
-        result_sql = result_sql.rstrip() + ';'
+    if last_written and not last_written.rstrip().endswith(';'):
+        output.write(';')
+    
+    primary_method = finish_method_counter(method_used)
     
     return {
         "success": True,
-        "transpiled": [result_sql],
         "from_dialect": from_dialect,
         "to_dialect": to_dialect,
-        "features_detected": features,
+        "features_detected": features_to_dict(script_features),
         "methods_used": method_used,
         "primary_method": primary_method,
-        "total_statements": len(statements),
+        "total_statements": total_statements,
+        "parallel": use_pool,
+        "insert_batching": batcher.stats if batcher is not None else None,
         "warnings": warnings,
         "note": DIALECT_NOTES.get(to_dialect, "Check dialect-specific documentation")
     }
 
 
-def split_sql_statements(sql: str) -> List[str]:
+def split_sql_statements(sql: str, tokens: Optional[List[Token]] = None) -> List[str]:
     """Разбивает SQL на отдельные выражения"""
-    statements = []
-    current = ""
-    depth = 0
-    in_quote = False
-    quote_char = None
-    
-    for char in sql + ';':
-        if char in ("'", '"', '`'):
-            if not in_quote:
-                in_quote = True
-                quote_char = char
-            elif quote_char == char:
-                # Проверяем экранированные кавычки
-                if len(current) > 0 and current[-1] == '\\':
-                    pass  # Это экранированная кавычка
-                else:
-                    in_quote = False
-                    quote_char = None
-        
-        if not in_quote:
-            if char == '(':
-                depth += 1
-            elif char == ')':
-                depth -= 1
-        
-        current += char
-        
-        if char == ';' and not in_quote and depth == 0:
-            stmt = current.strip()
-            if stmt and stmt != ';':
-                statements.append(stmt)
-            current = ""
-    
-    if current.strip():
-        statements.append(current.strip())
-    
-    return statements
+    if tokens is None:
+        tokens = tokenize(sql)
+    return [sql[statement.start:statement.end] for statement in split_statements(sql, tokens)]
 
 def apply_dialect_specific_processing(sql: str, dialect: str) -> str:
     """Применяет диалект-специфичную пост-обработку"""
@@ -716,15 +1190,18 @@ def run_all_dialects_demo():
     
     dialects = ["postgres", "bigquery", "snowflake", "oracle", "mssql", "sqlite", "redshift"]
     
+    # Один разбор примера, генерация во все диалекты
+    start_time = time.time()
+    many = transpile_many(COMPLEX_SQL_EXAMPLE, "mysql", dialects)
+    elapsed = time.time() - start_time
+    
+    print(f"⏱️  Общее время: {elapsed:.3f} сек ({many['parsed_statements']} выражений разобрано sqlglot один раз)")
+    
     for dialect in dialects:
+        result = many["results"][dialect]
         print(f"\n🎯 КОНВЕРТАЦИЯ В {dialect.upper()}:")
         print("-" * 40)
         
-        start_time = time.time()
-        result = hybrid_transpile(COMPLEX_SQL_EXAMPLE, "mysql", dialect)
-        elapsed = time.time() - start_time
-        
-        print(f"  Время: {elapsed:.3f} сек")
         print(f"  Методы: {result['methods_used']}")
         print(f"  Основной метод: {result['primary_method']}")
         
@@ -735,65 +1212,104 @@ def run_all_dialects_demo():
         
         print(f"  Сохранено в: {output_file}")
 
-def run_performance_demo():
-    """Запускает демонстрацию производительности"""
-    print("⚡ ДЕМОНСТРАЦИЯ ПРОИЗВОДИТЕЛЬНОСТИ")
-    print("=" * 80)
+# ==================== Конвертация файлов ====================
+
+def convert_file(input_path: str, to_dialect: str, output_path: Optional[str] = None,
+                 from_dialect: str = "mysql", chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 batching: Optional[BatchOptions] = None, parallel: bool = False,
+                 workers: Optional[int] = None) -> Dict[str, Any]:
+    """Потоково конвертирует SQL-файл; без output_path результат идёт в stdout.
     
-    # Простые и сложные тестовые запросы
-    simple_query = "CREATE TABLE test (id INT PRIMARY KEY AUTO_INCREMENT, name VARCHAR(100));"
-    complex_query = """
-WITH cte AS (
-    SELECT 1 as n UNION ALL SELECT n + 1 FROM cte WHERE n < 10
-)
-SELECT n, RANK() OVER (ORDER BY n) as rank FROM cte;
+    Вход отображается в память (mmap) и декодируется блоками, выражения
+    пишутся по мере готовности - память не зависит от размера файла.
     """
+    started = time.perf_counter()
+    with MappedTextReader(input_path) as source:
+        if output_path:
+            with open(output_path, 'w', encoding='utf-8') as output:
+                result = hybrid_transpile_stream(source, output, from_dialect, to_dialect,
+                                                 chunk_size=chunk_size, batching=batching,
+                                                 parallel=parallel, workers=workers)
+        else:
+            result = hybrid_transpile_stream(source, sys.stdout, from_dialect, to_dialect,
+                                             chunk_size=chunk_size, batching=batching,
+                                             parallel=parallel, workers=workers)
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+        input_bytes = source.size
     
-    print("\n📊 СРАВНЕНИЕ СКОРОСТИ:")
-    print("-" * 40)
+    elapsed = time.perf_counter() - started
+    result["input_bytes"] = input_bytes
+    result["elapsed_s"] = round(elapsed, 3)
+    result["mb_per_s"] = round(input_bytes / (1024 * 1024) / elapsed, 2) if elapsed else None
+    return result
+
+def run_convert_file(args: List[str]) -> int:
+    """convert <input.sql> <диалект> [-o out.sql] [--from mysql]; сводка - в stderr"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog="hybrid_transpiler_demo.py convert",
+        description="Потоковая конвертация SQL-файла",
+        epilog="Память: исходный текст самого большого выражения и его результат; дамп INSERT ... VALUES "
+               "пишется блоками, и его результат целиком не собирается. С --batch-inserts результат "
+               "INSERT собирается целиком (около двух размеров выражения) плюс одна пачка."
+    )
+    parser.add_argument("input", help="входной SQL-файл")
+    parser.add_argument("dialect", help="целевой диалект")
+    parser.add_argument("-o", "--output", help="выходной файл (по умолчанию stdout)")
+    parser.add_argument("--from", dest="from_dialect", default="mysql", help="исходный диалект")
+    parser.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_SIZE / (1024 * 1024),
+                        help="размер блока чтения в мегабайтах")
+    parser.add_argument("--batch-inserts", action="store_true",
+                        help="собрать INSERT в пачки по лимитам целевого диалекта")
+    parser.add_argument("--batch-rows", type=int, help="строк в пачке (по умолчанию - лимит диалекта)")
+    parser.add_argument("--batch-kb", type=int, help="размер пачки в КБ (по умолчанию - лимит диалекта)")
+    parser.add_argument("--transaction-rows", type=int, default=0,
+                        help="строк в транзакции (0 - без BEGIN/COMMIT)")
+    parser.add_argument("--parallel", action="store_true",
+                        help="конвертировать выражения в пуле процессов (один пул на файл)")
+    parser.add_argument("--workers", type=int, help="процессов в пуле (по умолчанию - число CPU)")
+    options = parser.parse_args(args)
+    
+    batching = None
+    if options.batch_inserts or options.batch_rows or options.batch_kb or options.transaction_rows:
+        batching = BatchOptions(options.batch_rows, options.batch_kb * 1024 if options.batch_kb else None,
+                                options.transaction_rows)
     
-    # Проверяем наличие sqlglot
     try:
-        import sqlglot
-        sqlglot_available = True
-    except ImportError:
-        sqlglot_available = False
-        print("⚠️  SQLGlot не установлен")
-    
-    if sqlglot_available:
-        # Тест простого запроса
-        print("\n1. ПРОСТОЙ ЗАПРОС (CREATE TABLE):")
-        start_time = time.time()
-        for _ in range(100):
-            simple_dialect_conversion(simple_query, "postgres")
-        simple_time = time.time() - start_time
-        print(f"   Простые замены (100 итераций): {simple_time:.3f} сек")
-        print(f"   Скорость: {100/simple_time:.1f} запросов/сек")
-        
-        # Тест сложного запроса через простые замены (некорректно, но для сравнения)
-        start_time = time.time()
-        for _ in range(100):
-            simple_dialect_conversion(complex_query, "postgres")
-        complex_simple_time = time.time() - start_time
-        
-        # Тест сложного запроса через sqlglot
-        start_time = time.time()
-        for _ in range(100):
-            transpile_with_sqlglot(complex_query, "mysql", "postgres")
-        complex_sqlglot_time = time.time() - start_time
-        
-        print(f"\n2. СЛОЖНЫЙ ЗАПРОС (CTE + оконные функции):")
-        print(f"   Простые замены (100 итераций): {complex_simple_time:.3f} сек")
-        print(f"   SQLGlot (100 итераций): {complex_sqlglot_time:.3f} сек")
-        print(f"\n📈 ВЫВОДЫ:")
-        print(f"   • Простые запросы: простые замены в {complex_sqlglot_time/simple_time:.1f}× быстрее")
-        print(f"   • Сложные запросы: SQLGlot дает корректный результат")
-        print(f"   • Гибридный подход оптимален для смешанных нагрузок")
+        result = convert_file(options.input, options.dialect, options.output, options.from_dialect,
+                              max(int(options.chunk_mb * 1024 * 1024), 4096), batching,
+                              options.parallel or bool(options.workers), options.workers)
+    except BrokenPipeError:
+        # Читатель stdout закрылся раньше (например, | head) - выходим без трассировки
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    
+    print(f"✅ {options.input} -> {options.output or 'stdout'} ({options.dialect})", file=sys.stderr)
+    print(f"  • Всего выражений: {result['total_statements']}", file=sys.stderr)
+    print(f"  • Простые замены: {result['methods_used']['simple']}", file=sys.stderr)
+    print(f"  • SQLGlot преобразования: {result['methods_used']['sqlglot']}", file=sys.stderr)
+    if result["insert_batching"]:
+        stats = result["insert_batching"]
+        print(f"  • INSERT: {stats['inserts']} -> {stats['batches']} пачек ({stats['rows']} строк)", file=sys.stderr)
+    print(f"  • Время: {result['elapsed_s']} сек ({result['mb_per_s']} МБ/с)", file=sys.stderr)
+    for warning in result["warnings"][:10]:
+        print(f"  ⚠️  {warning}", file=sys.stderr)
+    return 0
 
 # ==================== Основная функция ====================
 
 def main():
     """Основная функция демонстрации"""
+    # convert <input.sql> <диалект>: stdout может быть результатом, баннер не печатаем
+    if len(sys.argv) > 3 and sys.argv[1].lower() == "convert" or \
+            len(sys.argv) == 3 and sys.argv[1].lower() == "convert" and os.path.isfile(sys.argv[2]):
+        sys.exit(run_convert_file(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1].lower() == "export":
+        from bulk_export import main as export_main
+        sys.exit(export_main(sys.argv[2:]))
+    
     print("🚀 ГИБРИДНЫЙ SQL ТРАНСПИЛЯТОР - ДЕМОНСТРАЦИЯ")
     print("=" * 60)
     print("Используйте:")
@@ -801,8 +1317,10 @@ def main():
     print("  2. python hybrid_transpiler_demo.py compare        # Сравнить фрагменты преобразования")
     print("  3. python hybrid_transpiler_demo.py full <диалект> # Полная трансформация")
     print("  4. python hybrid_transpiler_demo.py all            # Трансформация во все диалекты")
-    print("  5. python hybrid_transpiler_demo.py perf           # Демонстрация производительности")
+    print("  5. python hybrid_transpiler_demo.py bench [опции]  # Бенчмарк (см. bench --help)")
     print("  6. python hybrid_transpiler_demo.py convert <диалект> # Конвертация и сохранение")
+    print("  7. python hybrid_transpiler_demo.py convert <файл.sql> <диалект> [-o out.sql] [--batch-inserts] # Конвертация файла")
+    print("  8. python hybrid_transpiler_demo.py export <файл.sql> <диалект> -d <каталог> # CSV/TSV и скрипт загрузки")
     print("\nДоступные диалекты: postgres, bigquery, snowflake, oracle, mssql, sqlite, redshift")
     
     if len(sys.argv) > 1:
@@ -824,8 +1342,9 @@ def main():
             show_original_example()
             run_all_dialects_demo()
         
-        elif command == "perf":
-            run_performance_demo()
+        elif command in ("bench", "perf"):
+            from transpiler_bench import main as bench_main
+            bench_main(sys.argv[2:])
         
         elif command == "convert":
             if len(sys.argv) > 2:
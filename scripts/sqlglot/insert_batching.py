@@ -0,0 +1,221 @@
+# ==================== ИМПОРТЫ ====================
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sql_lexer import compile_pattern
+
+# ==================== Лимиты диалектов ====================
+
+class BatchLimits(NamedTuple):
+    """Предел пачки строк в одном INSERT; None - без ограничения"""
+    max_rows: Optional[int]
+    max_bytes: int
+
+class BatchOptions(NamedTuple):
+    """Параметры перегруппировки INSERT; None - лимит диалекта"""
+    max_rows: Optional[int] = None
+    max_bytes: Optional[int] = None
+    transaction_rows: int = 0     # строк в транзакции, 0 - без BEGIN/COMMIT
+
+# Строк в VALUES: SQL Server - не больше 1000, SQLite до 3.8.8 - SQLITE_MAX_COMPOUND_SELECT (500),
+# Snowflake - 16384. Размер текста: BigQuery и Snowflake - около 1 МБ на запрос, SQLite -
+# SQLITE_MAX_SQL_LENGTH старых сборок, Redshift - 16 МБ; для остальных - размер, который
+# не упирается в max_allowed_packet и память разбора.
+# Литералы не занимают связываемых параметров, поэтому лимит переменных SQLite не действует.
+BATCH_LIMITS: Dict[str, BatchLimits] = {
+    "mysql": BatchLimits(None, 4 * 1024 * 1024),
+    "postgres": BatchLimits(None, 8 * 1024 * 1024),
+    "redshift": BatchLimits(None, 8 * 1024 * 1024),
+    "mssql": BatchLimits(1000, 8 * 1024 * 1024),
+    "oracle": BatchLimits(500, 4 * 1024 * 1024),
+    "sqlite": BatchLimits(500, 1000000),
+    "snowflake": BatchLimits(16384, 1000000),
+    "bigquery": BatchLimits(None, 1000000),
+}
+DEFAULT_BATCH_LIMITS = BatchLimits(1000, 1000000)
+
+# Начало и конец транзакции; в Oracle транзакция начинается неявно
+TRANSACTION_STATEMENTS: Dict[str, Tuple[Optional[str], str]] = {
+    "mysql": ("START TRANSACTION;", "COMMIT;"),
+    "postgres": ("BEGIN;", "COMMIT;"),
+    "redshift": ("BEGIN;", "COMMIT;"),
+    "mssql": ("BEGIN TRANSACTION;", "COMMIT TRANSACTION;"),
+    "oracle": (None, "COMMIT;"),
+    "sqlite": ("BEGIN TRANSACTION;", "COMMIT;"),
+    "snowflake": ("BEGIN TRANSACTION;", "COMMIT;"),
+    "bigquery": ("BEGIN TRANSACTION;", "COMMIT TRANSACTION;"),
+}
+
+# ==================== Разбор INSERT целевого диалекта ====================
+
+# INSERT INTO t [(колонки)] VALUES - вместе с комментариями перед выражением.
+# INSERT ... SELECT, ON CONFLICT, RETURNING и т.п. не проходят проверку строк
+_HEADER = re.compile(
+    r"(?P<lead>(?:\s+|--[^\n]*(?:\n|\Z)|/\*[\s\S]*?\*/)*)"
+    r"(?P<header>INSERT\s+INTO\s+[^\s(;']+(?:\s*\([^()';]*\))?)\s*VALUES\s*(?=\()",
+    re.IGNORECASE
+)
+
+# Строки с обратной косой чертой как экранированием; в остальных диалектах - только ''.
+# Закрывающая кавычка не из пары '' - разбор однозначен (см. compile_pattern)
+_BACKSLASH_STRING = r"'[^'\\]*+(?:(?:\\[\s\S]|'')[^'\\]*+)*+'(?!')"
+_STANDARD_STRING = r"'[^']*+(?:''[^']*+)*+'(?!')"
+_BACKSLASH_DIALECTS = ("mysql", "bigquery", "snowflake")
+
+_ROWS_END = compile_pattern(r"\s*+;?+\s*+\Z")
+
+@lru_cache(maxsize=None)
+def _row_patterns(to_dialect: str) -> Tuple["re.Pattern", "re.Pattern"]:
+    """Шаблоны первой и следующих строк VALUES: скобки с литералами
+    и вызовами функций одного уровня вложенности (decode('..', 'hex'))"""
+    string = _BACKSLASH_STRING if to_dialect in _BACKSLASH_DIALECTS else _STANDARD_STRING
+    text = r"""[^'"()]*+"""
+    item = f'{string}|"[^"]*+"'
+    inner = f"{text}(?:(?:{item}){text})*+"
+    row = f"\\({inner}(?:\\({inner}\\){inner})*+\\)"
+    return compile_pattern(f"\\s*+({row})"), compile_pattern(f"\\s*+,\\s*+({row})")
+
+def split_insert_rows(statement: str, to_dialect: str) -> Optional[Tuple[str, str, List[str]]]:
+    """(комментарии перед выражением, заголовок INSERT INTO t (...), строки VALUES)
+    или None, если выражение - не INSERT ... VALUES из одних строк"""
+    header = _HEADER.match(statement)
+    if header is None:
+        return None
+    first, following = _row_patterns(to_dialect)
+    rows = []
+    position = header.end()
+    row = first.match(statement, position)
+    while row is not None:
+        rows.append(row.group(1))
+        position = row.end()
+        row = following.match(statement, position)
+    if not rows or _ROWS_END.match(statement, position) is None:
+        return None
+    return header.group("lead"), header.group("header"), rows
+
+# ==================== Перегруппировка ====================
+
+class InsertBatcher:
+    """Собирает подряд идущие INSERT ... VALUES одной таблицы в пачки.
+
+    Выражения подаются по одному (feed) и возвращаются готовыми к записи,
+    поэтому подходит и для потоковой конвертации. Пачка закрывается при
+    смене таблицы или колонок, любом другом выражении и по лимитам строк
+    и байт; порядок выражений не меняется. Oracle получает INSERT ALL.
+    transaction_rows > 0 - пачки оборачиваются в транзакции примерно
+    такого размера; перед остальными выражениями транзакция закрывается.
+    """
+
+    def __init__(self, to_dialect: str, options: BatchOptions = BatchOptions()):
+        limits = BATCH_LIMITS.get(to_dialect, DEFAULT_BATCH_LIMITS)
+        self.to_dialect = to_dialect
+        self.max_rows = options.max_rows or limits.max_rows
+        self.max_bytes = options.max_bytes or limits.max_bytes
+        self.transaction_rows = options.transaction_rows
+        self.begin, self.commit = TRANSACTION_STATEMENTS.get(to_dialect, ("BEGIN;", "COMMIT;"))
+        self.insert_all = to_dialect == "oracle"
+
+        self.key: Optional[str] = None
+        self.lead = ""
+        self.header = ""
+        self.rows: List[str] = []
+        self.size = 0
+        self.row_overhead = 0
+        self.in_transaction = False
+        self.transaction_size = 0
+        self.stats: Dict[str, Any] = {"inserts": 0, "rows": 0, "batches": 0, "transactions": 0}
+
+    def feed(self, statement: str) -> List[str]:
+        """Выражения, готовые к записи после statement (возможно, ни одного)"""
+        output: List[str] = []
+        parsed = split_insert_rows(statement, self.to_dialect)
+        if parsed is None:
+            self.flush(output)
+            self.end_transaction(output)
+            output.append(statement)
+            return output
+
+        lead, header, rows = parsed
+        key = ' '.join(header.split())
+        lead = lead.strip()
+        if lead or key != self.key:
+            # Комментарий перед INSERT (например, из mysqldump) начинает новую пачку
+            self.flush(output)
+            self.start_batch(key, header, lead)
+
+        self.stats["inserts"] += 1
+        self.stats["rows"] += len(rows)
+        for row in rows:
+            cost = (len(row) if row.isascii() else len(row.encode('utf-8'))) + self.row_overhead
+            if self.rows and (len(self.rows) == self.max_rows or self.size + cost > self.max_bytes):
+                self.flush(output)
+            self.rows.append(row)
+            self.size += cost
+        return output
+
+    def finish(self) -> List[str]:
+        """Последняя пачка и закрытие транзакции"""
+        output: List[str] = []
+        self.flush(output)
+        self.end_transaction(output)
+        return output
+
+    def start_batch(self, key: str, header: str, lead: str) -> None:
+        self.key = key
+        self.header = header
+        self.lead = lead
+        if self.insert_all:
+            self.row_overhead = len(header) + len("  VALUES \n") - len("INSERT ")
+        else:
+            self.row_overhead = len(",\n")
+        self.size = self.base_size()
+
+    def base_size(self) -> int:
+        """Размер пачки без строк"""
+        if self.insert_all:
+            return len("INSERT ALL\nSELECT 1 FROM DUAL;")
+        return len(self.header) + len(" VALUES ;")
+
+    def render(self) -> str:
+        if self.insert_all and len(self.rows) > 1:
+            into = self.header[len("INSERT"):].strip()
+            text = "INSERT ALL\n" + "".join(f"  {into} VALUES {row}\n" for row in self.rows) + "SELECT 1 FROM DUAL;"
+        else:
+            text = f"{self.header} VALUES " + ",\n".join(self.rows) + ";"
+        return f"{self.lead}\n{text}" if self.lead else text
+
+    def flush(self, output: List[str]) -> None:
+        if not self.rows:
+            return
+        if self.transaction_rows > 0 and not self.in_transaction:
+            if self.begin is not None:
+                output.append(self.begin)
+            self.in_transaction = True
+        output.append(self.render())
+        self.stats["batches"] += 1
+        self.transaction_size += len(self.rows)
+        self.rows = []
+        self.lead = ""
+        self.size = self.base_size()
+        if self.transaction_size >= self.transaction_rows:
+            self.end_transaction(output)
+
+    def end_transaction(self, output: List[str]) -> None:
+        if not self.in_transaction:
+            return
+        output.append(self.commit)
+        self.stats["transactions"] += 1
+        self.in_transaction = False
+        self.transaction_size = 0
+
+def batch_statements(statements: List[str], to_dialect: str, options: BatchOptions) -> Tuple[List[str], Dict[str, Any]]:
+    """Перегруппировывает готовые выражения; возвращает (выражения, статистика)"""
+    batcher = InsertBatcher(to_dialect, options)
+    output: List[str] = []
+    for statement in statements:
+        if statement.strip():
+            output.extend(batcher.feed(statement))
+    output.extend(batcher.finish())
+    return output, batcher.stats
@@ -1,9 +1,27 @@
 # ==================== ИМПОРТЫ ====================
 
+import os
 import sys
 import json
-import re  
-from typing import List, Dict, Any
+import signal
+import argparse
+import re
+import time
+from bisect import bisect_right, insort
+from contextlib import nullcontext
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# asyncio, concurrent.futures, importlib.metadata и sqlglot импортируются
+# только в тех режимах, где нужны: одноразовый запуск остаётся быстрым
+from dialect_rules import compile_all_rule_sets, compiled_rule_sets, get_rule_set, rule_hit_counts
+from insert_batching import BatchOptions
+from sql_lexer import line_starts, split_top_level, statement_ends, tokenize
+from transpile_cache import (
+    DEFAULT_RESULT_CACHE_BYTES, estimate_result_size, make_result_key, result_cache
+)
+from transpile_budget import current_budget, time_budget
+from transpile_trace import DEFAULT_TRACE_SLOWEST, trace_stage, tracing
 
 # ==================== КОНСТАНТЫ ====================
 
@@ -26,105 +44,15 @@ def get_indent(line: str) -> int:
 
 def split_columns(sql_part: str) -> List[str]:
     """Разбивает часть SQL с колонками на отдельные колонки"""
-    columns = []
-    current = []
-    depth = 0
-    
-    for char in sql_part:
-        if char == '(':
-            depth += 1
-        elif char == ')':
-            depth -= 1
-        
-        if char == ',' and depth == 0:
-            columns.append(''.join(current).strip())
-            current = []
-        else:
-            current.append(char)
-    
-    if current:
-        columns.append(''.join(current).strip())
-    
-    return columns
+    # Запятые внутри скобок, строк и комментариев не разделяют колонки
+    return [sql_part[start:end] for start, end in split_top_level(sql_part, tokenize(sql_part))]
 
 # ==================== Основные функции замен ====================
 
 def apply_dialect_conversion(sql: str, dialect: str) -> str:
     """Применяет преобразования для конкретного диалекта"""
-    result = sql
-    
-    # Общие замены для форматирования
-    result = re.sub(r'\(\s+', '(', result)
-    result = re.sub(r'\s+\)', ')', result)
-    result = re.sub(r',\s+', ', ', result)
-    result = re.sub(r'\s+', ' ', result)
-    
-    if dialect == "postgres":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'GENERATED BY DEFAULT AS IDENTITY', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'INTEGER', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TIMESTAMPTZ', result, flags=re.IGNORECASE)
-        result = re.sub(r'`([^`]+)`', r'"\1"', result)
-        result = re.sub(r'DECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'DECIMAL(\1,\2)', result, flags=re.IGNORECASE)
-        result = re.sub(r'PRIMARY KEY\s+GENERATED BY DEFAULT AS IDENTITY', 
-                       r'GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY', result, flags=re.IGNORECASE)
-        
-    elif dialect == "snowflake":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'AUTOINCREMENT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'NUMBER', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMBER(\1,\2)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'DEFAULT CURRENT_TIMESTAMP(?!\()', 'DEFAULT CURRENT_TIMESTAMP()', result, flags=re.IGNORECASE)
-        
-    elif dialect == "bigquery":
-        result = re.sub(r'\bAUTO_INCREMENT\b', '', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'INT64', result, flags=re.IGNORECASE)
-        # BigQuery STRING не поддерживает размер в скобках
-        result = re.sub(r'\bSTRING\s*\(\s*\d+\s*\)', 'STRING', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bVARCHAR\s*\(\s*(\d+)\s*\)', r'STRING', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMERIC(\1,\2)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'DEFAULT CURRENT_TIMESTAMP(?!\()', 'DEFAULT CURRENT_TIMESTAMP()', result, flags=re.IGNORECASE)
-        
-        # Убираем FOREIGN KEY для BigQuery
-        result = re.sub(r',?\s*FOREIGN KEY\s*\([^)]+\)\s*REFERENCES\s*\w+\s*\([^)]+\)(\s*ON DELETE\s+\w+)?', 
-                       '', result, flags=re.IGNORECASE)
-        
-        # Убираем лишние запятые после удаления FOREIGN KEY
-        result = re.sub(r',\s*,', ',', result)
-        result = re.sub(r'\(\s*,', '(', result)
-        result = re.sub(r',\s*\)', ')', result)
-        
-    elif dialect == "oracle":
-        result = re.sub(r'\bAUTO_INCREMENT\b', '', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'NUMBER(10)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bVARCHAR\s*\(\s*', 'VARCHAR2(', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'NUMBER(\1,\2)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TIMESTAMP WITH TIME ZONE', result, flags=re.IGNORECASE)
-        result = re.sub(r'DEFAULT CURRENT_TIMESTAMP', 'DEFAULT SYSTIMESTAMP', result, flags=re.IGNORECASE)
-        
-    elif dialect == "mssql":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'IDENTITY(1,1)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'DATETIME2', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bCURRENT_TIMESTAMP\b', 'GETDATE()', result, flags=re.IGNORECASE)
-        result = re.sub(r'`([^`]+)`', r'[\1]', result)
-        result = re.sub(r'IDENTITY\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'IDENTITY(\1,\2)', result, flags=re.IGNORECASE)
-        
-    elif dialect == "sqlite":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'AUTOINCREMENT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'INTEGER', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bVARCHAR\s*\(\s*(\d+)\s*\)', r'TEXT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'REAL', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TEXT', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bDATE\b', 'TEXT', result, flags=re.IGNORECASE)
-        
-    elif dialect == "redshift":
-        result = re.sub(r'\bAUTO_INCREMENT\b', 'IDENTITY(1,1)', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bINT\b', 'INTEGER', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bTIMESTAMP\b', 'TIMESTAMP', result, flags=re.IGNORECASE)
-        result = re.sub(r'\bCURRENT_TIMESTAMP\b', 'GETDATE()', result, flags=re.IGNORECASE)
-        result = re.sub(r'IDENTITY\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', r'IDENTITY(\1,\2)', result, flags=re.IGNORECASE)
-    
-    return result
+    # Форматирование и замены диалекта - один проход скомпилированного набора правил
+    return get_rule_set("compact", dialect).apply(sql)
 
 def format_create_table(sql: str, indent: int) -> List[str]:
     """Форматирует CREATE TABLE с сохранением структуры"""
@@ -158,103 +86,174 @@ def format_create_table(sql: str, indent: int) -> List[str]:
     
     return lines
 
-def process_bigquery_result(sql: str) -> str:
-    """Пост-обработка для BigQuery"""
-    lines = sql.split('\n')
-    new_lines = []
-    in_create_table = False
+# ==================== Правки по диапазонам ====================
+
+# Правка исходного текста: заменить диапазон [start, end) на replacement
+Edit = Tuple[int, int, str]
+
+# Пробелы в начале и в конце строки (перевод строки не входит)
+_LEADING_WS = re.compile(r'[^\S\n]*')
+_TRAILING_WS = re.compile(r'[^\S\n]+$')
+
+_FOREIGN_KEY = re.compile(r'FOREIGN\s+KEY', re.IGNORECASE)
+_SQLITE_FK_PRAGMA = re.compile(r'PRAGMA\s+foreign_keys\s*=\s*ON\s*;', re.IGNORECASE)
+SQLITE_FK_PRAGMA = "-- SQLite requires PRAGMA foreign_keys = ON for FK support\nPRAGMA foreign_keys = ON;\n"
+
+def apply_edits(sql: str, edits: List[Edit]) -> str:
+    """Собирает результат одним join из исходного текста и правок.
     
-    for line in lines:
-        if 'CREATE TABLE' in line.upper():
-            in_create_table = True
-            new_lines.append(line)
-        elif ');' in line:
-            in_create_table = False
-            new_lines.append(line)
-        elif in_create_table and not line.strip():
-            # Пропускаем пустые строки внутри CREATE TABLE
-            continue
-        elif 'FOREIGN KEY' in line.upper():
-            # Пропускаем строки с FOREIGN KEY (они уже удалены)
-            continue
-        else:
-            new_lines.append(line)
+    Правки упорядочены по началу и не пересекаются.
+    """
+    parts = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(sql[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(sql[position:])
+    return ''.join(parts)
+
+class BigQueryLineFilter:
+    """Пост-обработка для BigQuery по строкам результата: пустые строки внутри
+    CREATE TABLE и строки с FOREIGN KEY удаляются"""
     
-    return '\n'.join(new_lines)
+    def __init__(self):
+        self.in_create_table = False
+    
+    def keep(self, line: str) -> bool:
+        upper = line.upper()
+        if 'CREATE TABLE' in upper:
+            self.in_create_table = True
+            return True
+        if ');' in line:
+            self.in_create_table = False
+            return True
+        if self.in_create_table and not line.strip():
+            return False
+        return 'FOREIGN KEY' not in upper
 
-def format_sql_with_original_structure(original_sql: str, dialect: str) -> str:
-    """Форматирует SQL, сохраняя оригинальную структуру"""
-    lines = original_sql.split('\n')
-    result_lines = []
+def original_structure_edits(sql: str, dialect: str) -> List[Edit]:
+    """Правки быстрого пути относительно исходного текста.
+    
+    Пустые строки и комментарии остаются как есть; CREATE TABLE
+    переформатируется целиком (одна правка на блок); в остальных строках
+    отступ сводится к пробелам, пробелы в конце убираются и применяются
+    правила диалекта. Пост-обработка SQLite и BigQuery - тоже правки.
+    """
+    rule_set = get_rule_set("compact", dialect)
+    starts = line_starts(sql)
+    line_count = len(starts)
+    
+    # Строки, на которых заканчиваются выражения (';' вне строк, комментариев и скобок)
+    statement_end_lines = {bisect_right(starts, end - 1) - 1 for end in statement_ends(sql)}
+    
+    def line_bounds(index: int) -> Tuple[int, int, int, int]:
+        """Начало строки, начало и конец текста без пробелов по краям, конец строки"""
+        line_start = starts[index]
+        line_end = starts[index + 1] - 1 if index + 1 < line_count else len(sql)
+        content_start = _LEADING_WS.match(sql, line_start, line_end).end()
+        trailing = _TRAILING_WS.search(sql, content_start, line_end)
+        return line_start, content_start, trailing.start() if trailing else line_end, line_end
+    
+    def block_end(index: int) -> int:
+        while index not in statement_end_lines and index + 1 < line_count:
+            index += 1
+        return index
+    
+    line_filter = BigQueryLineFilter() if dialect == "bigquery" else None
+    edits: List[Edit] = []
+    last_kept_end = None       # конец последней оставленной строки (для BigQuery)
+    last_dropped = False
+    first_code_line: Optional[int] = None
+    
+    def keep_line(index: int, line_start: int, line_end: int) -> None:
+        """Строка остаётся как есть (если её не убирает фильтр BigQuery)"""
+        nonlocal last_kept_end, last_dropped
+        if line_filter is None or line_filter.keep(sql[line_start:line_end]):
+            last_kept_end, last_dropped = line_end, False
+        else:
+            drop_line(index, line_start)
+    
+    def convert_line(index: int) -> None:
+        nonlocal last_kept_end, last_dropped
+        line_start, content_start, content_end, line_end = line_bounds(index)
+        if content_start == content_end:
+            keep_line(index, line_start, line_end)
+            return
+        
+        if line_filter is not None:
+            # Фильтру BigQuery нужен готовый текст строки
+            line = ' ' * (content_start - line_start) + rule_set.apply(sql[content_start:content_end])
+            if line_filter.keep(line):
+                edits.append((line_start, line_end, line))
+                last_kept_end, last_dropped = line_end, False
+            else:
+                drop_line(index, line_start)
+            return
+        
+        if sql.count(' ', line_start, content_start) != content_start - line_start:
+            edits.append((line_start, content_start, ' ' * (content_start - line_start)))
+        rule_set.collect_edits(sql, content_start, content_end, edits)
+        if content_end < line_end:
+            edits.append((content_end, line_end, ''))
+    
+    def drop_line(index: int, line_start: int) -> None:
+        """Удаляет строку вместе с переводом строки после неё"""
+        nonlocal last_dropped
+        if index + 1 < line_count:
+            edits.append((line_start, starts[index + 1], ''))
+        else:
+            edits.append((line_start, len(sql), ''))
+        last_dropped = True
     
     i = 0
-    while i < len(lines):
-        line = lines[i]
-        stripped = line.strip()
+    while i < line_count:
+        line_start, content_start, content_end, line_end = line_bounds(i)
         
         # Сохраняем комментарии и пустые строки
-        if not stripped or stripped.startswith('--'):
-            result_lines.append(line)
+        if content_start == content_end or sql.startswith('--', content_start):
+            keep_line(i, line_start, line_end)
             i += 1
             continue
         
-        # Если это CREATE TABLE
-        if stripped.startswith('CREATE TABLE'):
-            table_block = []
-            table_block.append(line)
-            
-            # Собираем весь блок CREATE TABLE
-            j = i + 1
-            while j < len(lines):
-                next_line = lines[j]
-                table_block.append(next_line)
-                if ';' in next_line:
-                    break
-                j += 1
-            
-            # Объединяем блок
-            table_sql = ' '.join([l.strip() for l in table_block])
-            # Применяем конвертацию
-            converted = apply_dialect_conversion(table_sql, dialect)
-            # Разбиваем обратно с форматированием
-            formatted = format_create_table(converted, get_indent(line))
-            result_lines.extend(formatted)
-            
-            i = j + 1
-            continue
+        if first_code_line is None:
+            first_code_line = line_start
         
-        # Если это SELECT - сохраняем оригинальное форматирование
-        elif stripped.startswith('SELECT'):
-            select_block = []
-            select_block.append(line)
-            
-            # Собираем оригинальный SELECT блок
-            j = i
-            while j < len(lines):
-                if j > i:
-                    select_block.append(lines[j])
-                if lines[j].strip().endswith(';'):
-                    break
-                j += 1
-            
-            # Применяем конвертацию к каждой строке отдельно
-            for select_line in select_block:
-                if select_line.strip():
-                    converted_line = apply_dialect_conversion(select_line.strip(), dialect)
-                    result_lines.append(' ' * get_indent(select_line) + converted_line)
-                else:
-                    result_lines.append(select_line)
-            
+        # CREATE TABLE переформатируется целиком
+        if sql.startswith('CREATE TABLE', content_start):
+            j = block_end(i)
+            table_sql = ' '.join([sql[bounds[1]:bounds[2]] for bounds in map(line_bounds, range(i, j + 1))])
+            formatted = format_create_table(apply_dialect_conversion(table_sql, dialect),
+                                            content_start - line_start)
+            if line_filter is not None:
+                formatted = [line for line in formatted if line_filter.keep(line)]
+            block_line_end = line_bounds(j)[3]
+            edits.append((line_start, block_line_end, '\n'.join(formatted)))
+            last_kept_end, last_dropped = block_line_end, False
             i = j + 1
             continue
         
-        # Другие SQL-выражения
-        else:
-            converted = apply_dialect_conversion(stripped, dialect)
-            result_lines.append(' ' * get_indent(line) + converted)
-            i += 1
+        # SELECT и другие выражения - построчно, с сохранением расположения строк
+        j = block_end(i) if sql.startswith('SELECT', content_start) else i
+        for index in range(i, j + 1):
+            convert_line(index)
+        i = j + 1
+    
+    # Удалённые последние строки не должны оставлять перевод строки в конце
+    if last_dropped:
+        cut = last_kept_end if last_kept_end is not None else 0
+        while edits and edits[-1][0] >= cut and edits[-1][2] == '':
+            edits.pop()
+        edits.append((cut, len(sql), ''))
+    
+    if dialect == "sqlite" and _FOREIGN_KEY.search(sql) and not _SQLITE_FK_PRAGMA.search(sql):
+        insort(edits, (first_code_line or 0, first_code_line or 0, SQLITE_FK_PRAGMA))
     
-    return '\n'.join(result_lines)
+    return edits
+
+def format_sql_with_original_structure(original_sql: str, dialect: str) -> str:
+    """Форматирует SQL, сохраняя оригинальную структуру"""
+    return apply_edits(original_sql, original_structure_edits(original_sql, dialect))
 
 # ==================== Основная функция транспиляции ====================
 
@@ -263,24 +262,13 @@ def transpile_sql_for_dialect(sql: str, from_dialect: str, to_dialect: str) -> D
     try:
         warnings = []
         
-        # Простая конвертация с сохранением форматирования
-        result = format_sql_with_original_structure(sql, to_dialect)
-        
-        # Диалект-специфичные пост-обработки
-        if to_dialect == "sqlite" and "FOREIGN KEY" in result.upper():
-            if "PRAGMA foreign_keys = ON;" not in result:
-                lines = result.split('\n')
-                insert_idx = 0
-                for idx, line in enumerate(lines):
-                    if line.strip() and not line.strip().startswith('--'):
-                        insert_idx = idx
-                        break
-                lines.insert(insert_idx, "-- SQLite requires PRAGMA foreign_keys = ON for FK support")
-                lines.insert(insert_idx + 1, "PRAGMA foreign_keys = ON;")
-                result = '\n'.join(lines)
+        # Замены диалекта и пост-обработки - правки исходного текста
+        with trace_stage("simple.format"):
+            edits = original_structure_edits(sql, to_dialect)
         
-        elif to_dialect == "bigquery":
-            result = process_bigquery_result(result)
+        # Результат собирается один раз
+        with trace_stage("assemble"):
+            result = apply_edits(sql, edits)
         
         return {
             "success": True,
@@ -302,52 +290,1026 @@ def transpile_sql_for_dialect(sql: str, from_dialect: str, to_dialect: str) -> D
             "to_dialect": to_dialect
         }
 
-# ==================== Main Function ====================
+# ==================== Обработка запросов ====================
 
-def main():
-    """Основная функция"""
+SUPPORTED_DIALECTS = [
+    {"name": "mysql", "display_name": "MySQL", "icon": "🐬"},
+    {"name": "postgres", "display_name": "PostgreSQL", "icon": "🐘"},
+    {"name": "snowflake", "display_name": "Snowflake", "icon": "❄️"},
+    {"name": "bigquery", "display_name": "BigQuery", "icon": "☁️"},
+    {"name": "oracle", "display_name": "Oracle", "icon": "🔷"},
+    {"name": "mssql", "display_name": "SQL Server", "icon": "🔶"},
+    {"name": "sqlite", "display_name": "SQLite", "icon": "📱"},
+    {"name": "redshift", "display_name": "Redshift", "icon": "🔴"},
+]
+
+# Код выхода воркера после --max-requests: родитель должен перезапустить процесс
+WORKER_RESTART_EXIT_CODE = 75
+
+@lru_cache(maxsize=None)
+def engine_version(engine: str) -> str:
+    """Версия движка для ключа кэша; для hybrid учитывается версия sqlglot"""
+    if engine != 'hybrid':
+        return engine
+    import importlib.metadata
     try:
-        input_data = json.loads(sys.stdin.read())
-        action = input_data.get('action', 'transpile')
+        return f"hybrid/sqlglot-{importlib.metadata.version('sqlglot')}"
+    except importlib.metadata.PackageNotFoundError:
+        return "hybrid/no-sqlglot"
+
+def get_transpile_function(engine: str):
+    """simple - быстрые замены server.py, hybrid - гибрид с sqlglot для сложных запросов"""
+    if engine == 'simple':
+        return transpile_sql_for_dialect
+    if engine == 'hybrid':
+        from hybrid_transpiler_demo import hybrid_transpile
+        return hybrid_transpile
+    raise ValueError(f"Unknown engine: {engine}")
+
+# Бюджеты времени sqlglot по умолчанию (мс, 0 - без ограничения); задаются флагами CLI,
+# запрос может переопределить их полями statement_budget_ms / request_budget_ms
+TIME_BUDGET_DEFAULTS = {"statement_budget_ms": 0, "request_budget_ms": 0}
+
+def is_cacheable(result: Dict[str, Any]) -> bool:
+    """Результат с выражениями, прерванными по бюджету, зависит от нагрузки - не кэшируется"""
+    return bool(result.get("success")) and not result.get("methods_used", {}).get("timed_out")
+
+def batch_options(input_data: Dict[str, Any]) -> Optional[BatchOptions]:
+    """BatchOptions из полей batch_inserts / batch_rows / batch_bytes / transaction_rows или None"""
+    if not (input_data.get('batch_inserts') or input_data.get('batch_rows') or
+            input_data.get('batch_bytes') or input_data.get('transaction_rows')):
+        return None
+    return BatchOptions(input_data.get('batch_rows'), input_data.get('batch_bytes'),
+                        int(input_data.get('transaction_rows') or 0))
+
+def parallel_options(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Аргументы parallel / workers для transpile_many из полей запроса ({} - без пула процессов)"""
+    workers = input_data.get('workers')
+    if not (input_data.get('parallel') or workers):
+        return {}
+    return {"parallel": True, "workers": int(workers) if workers else None}
+
+def run_transpile(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Транспиляция с кэшем результатов (no_cache: true - в обход кэша).
+    
+    parallel: true / workers: N - выражения конвертируются в пуле процессов
+    (только engine hybrid); на результат и ключ кэша не влияет.
+    batch_inserts: true - INSERT перегруппировываются в пачки (только engine hybrid).
+    defer_constraints: true - порядок таблиц по внешним ключам, индексы и
+    внешние ключи в конце скрипта (только engine hybrid).
+    """
+    sql = input_data.get('sql', '')
+    from_dialect = input_data.get('from_dialect', 'mysql')
+    to_dialect = input_data.get('to_dialect', 'postgres')
+    engine = input_data.get('engine', 'simple')
+    transpile = get_transpile_function(engine)
+    version = engine_version(engine)
+    
+    batching = batch_options(input_data)
+    if batching is not None:
+        if engine != 'hybrid':
+            raise ValueError("batch_inserts requires engine 'hybrid'")
+        # Параметры пачек входят в ключ кэша вместе с версией движка
+        version = f"{version}/{tuple(batching)}"
+        transpile = partial(transpile, batching=batching)
+    if input_data.get('defer_constraints'):
+        if engine != 'hybrid':
+            raise ValueError("defer_constraints requires engine 'hybrid'")
+        version = f"{version}/deferred"
+        transpile = partial(transpile, defer_constraints=True)
+    parallel = parallel_options(input_data)
+    if parallel:
+        if engine != 'hybrid':
+            raise ValueError("parallel requires engine 'hybrid'")
+        transpile = partial(transpile, **parallel)
+    
+    if input_data.get('no_cache'):
+        return {**transpile(sql, from_dialect, to_dialect), "cache": "bypass"}
+    
+    with trace_stage("cache"):
+        key = make_result_key(sql, from_dialect, to_dialect, version)
+        cached = result_cache.get(key)
+    if cached is not None:
+        return {**cached, "cache": "hit"}
+    
+    result = transpile(sql, from_dialect, to_dialect)
+    if is_cacheable(result):
+        result_cache.put(key, result, estimate_result_size(result))
+    return {**result, "cache": "miss"}
+
+def run_transpile_many(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Один SQL во много диалектов: общий разбор, кэш по каждому целевому диалекту"""
+    from hybrid_transpiler_demo import transpile_many
+    
+    sql = input_data.get('sql', '')
+    from_dialect = input_data.get('from_dialect', 'mysql')
+    to_dialects = input_data.get('to_dialects') or []
+    use_cache = not input_data.get('no_cache')
+    version = engine_version('hybrid')
+    batching = batch_options(input_data)
+    if batching is not None:
+        version = f"{version}/{tuple(batching)}"
+    defer_constraints = bool(input_data.get('defer_constraints'))
+    if defer_constraints:
+        version = f"{version}/deferred"
+    
+    results = {}
+    missing = []
+    for to_dialect in to_dialects:
+        cached = result_cache.get(make_result_key(sql, from_dialect, to_dialect, version)) if use_cache else None
+        if cached is not None:
+            results[to_dialect] = {**cached, "cache": "hit"}
+        else:
+            missing.append(to_dialect)
+    
+    if missing:
+        many = transpile_many(sql, from_dialect, missing, batching=batching,
+                              defer_constraints=defer_constraints, **parallel_options(input_data))
+        for to_dialect in missing:
+            result = many["results"][to_dialect]
+            if use_cache and is_cacheable(result):
+                result_cache.put(make_result_key(sql, from_dialect, to_dialect, version),
+                                 result, estimate_result_size(result))
+            results[to_dialect] = {**result, "cache": "miss" if use_cache else "bypass"}
+    
+    return {
+        "success": True,
+        "from_dialect": from_dialect,
+        "to_dialects": to_dialects,
+        "results": {to_dialect: results[to_dialect] for to_dialect in to_dialects}
+    }
+
+def run_transpile_document(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Сессия редактора: document_id + новый текст, транспилируются только изменённые выражения.
+    
+    patch: true и base_revision - в ответе правки списка выражений вместо полного текста.
+    """
+    from transpile_session import transpile_document
+    
+    document_id = input_data.get('document_id')
+    if document_id is None:
+        return {"success": False, "error": "document_id is required"}
+    return transpile_document(
+        str(document_id), input_data.get('sql', ''),
+        input_data.get('from_dialect', 'mysql'), input_data.get('to_dialect', 'postgres'),
+        input_data.get('base_revision'), bool(input_data.get('patch'))
+    )
+
+def close_document_session(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    session_module = sys.modules.get('transpile_session')
+    closed = session_module is not None and session_module.close_document(str(input_data.get('document_id')))
+    return {"success": True, "closed": closed}
+
+# ==================== Прогрев и диагностика ====================
+
+# Модули, состояние загрузки которых показывает diagnostics
+DIAGNOSTIC_MODULES = ["hybrid_transpiler_demo", "sqlglot", "asyncio", "concurrent.futures"]
+
+PROCESS_STARTED = time.perf_counter()
+
+def warmup(dialects: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Заранее компилирует правила и загружает sqlglot с диалектами"""
+    started = time.perf_counter()
+    rule_sets = compile_all_rule_sets()
+    rules_ms = round((time.perf_counter() - started) * 1000, 3)
+    
+    from hybrid_transpiler_demo import warmup_sqlglot
+    return {"rule_sets": rule_sets, "rules_ms": rules_ms, "sqlglot": warmup_sqlglot(dialects)}
+
+def measure_import_time(modules: List[str], top: int = 20) -> Dict[str, Any]:
+    """Разбивка времени импорта в отдельном процессе (python -X importtime).
+    
+    Текущий процесс не подходит: уже загруженные модули повторно не импортируются.
+    """
+    import subprocess
+    
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {name}" for name in modules)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=60
+    )
+    
+    entries = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": round(int(self_us) / 1000, 3),
+            "cumulative_ms": round(int(cumulative_us) / 1000, 3),
+        })
+    
+    roots = [entry for entry in entries if entry["depth"] == 0]
+    entries.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return {
+        "modules": modules,
+        "success": completed.returncode == 0,
+        "total_ms": round(sum(entry["cumulative_ms"] for entry in roots), 3),
+        "imported": len(entries),
+        "slowest": entries[:top],
+    }
+
+def run_diagnostics(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Что загружено в процессе и сколько стоила загрузка.
+    
+    importtime: true - дополнительно разбивка времени импорта
+    (по умолчанию для sqlglot) в отдельном процессе.
+    """
+    result = {
+        "success": True,
+        "pid": os.getpid(),
+        "python": sys.version.split()[0],
+        "uptime_s": round(time.perf_counter() - PROCESS_STARTED, 3),
+        "modules_loaded": {name: name in sys.modules for name in DIAGNOSTIC_MODULES},
+        "rule_sets_compiled": compiled_rule_sets(),
+    }
+    
+    # sqlglot_status не должен сам загружать гибридный модуль
+    hybrid = sys.modules.get("hybrid_transpiler_demo")
+    result["sqlglot"] = hybrid.sqlglot_status() if hybrid else {"loaded": False}
+    
+    if input_data.get('importtime'):
+        result["import_time"] = measure_import_time(input_data.get('modules') or ["sqlglot"],
+                                                    int(input_data.get('top', 20)))
+    return result
+
+def run_traced(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Запрос с трассировкой: к ответу добавляется блок timings.
+    
+    Сериализация замеряется отдельным json.dumps результата, поэтому
+    с trace ответ сериализуется дважды - флаг только для диагностики.
+    """
+    with tracing(int(input_data.get('trace_slowest', DEFAULT_TRACE_SLOWEST))) as trace:
+        result = handle_request({**input_data, "trace": False})
+        with trace_stage("serialize"):
+            json.dumps(result, ensure_ascii=False)
+    return {**result, "timings": trace.report()}
+
+def run_budgeted(input_data: Dict[str, Any], statement_ms: float, request_ms: float) -> Dict[str, Any]:
+    """Запрос с бюджетом времени: сложные выражения, не уложившиеся в него,
+    конвертируются быстрыми заменами, в warnings - предупреждение"""
+    with time_budget(statement_ms, request_ms):
+        return handle_request(input_data)
+
+# ==================== Пакетная транспиляция ====================
+
+# Параметры запроса transpile_batch, которые наследуют элементы без своих значений
+BATCH_ITEM_DEFAULTS = ('from_dialect', 'to_dialect', 'engine', 'no_cache', 'trace',
+                       'batch_inserts', 'batch_rows', 'batch_bytes', 'transaction_rows',
+                       'defer_constraints', 'parallel', 'workers')
+
+def run_transpile_batch(items: Iterable[Any], defaults: Dict[str, Any],
+                        emit: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """Транспилирует элементы {id, sql, from_dialect, to_dialect} по одному.
+    
+    Результат каждого элемента сразу передаётся в emit - вызывающий пишет
+    строку NDJSON, не дожидаясь остальных. Кэш результатов, правила и
+    загруженный sqlglot общие для всех элементов, с parallel / workers в
+    defaults - и пул процессов. Возвращает сводку.
+    """
+    started = time.perf_counter()
+    succeeded = failed = 0
+    pool = nullcontext()
+    if parallel_options(defaults):
+        from hybrid_transpiler_demo import statement_pool
+        pool = statement_pool(parallel_options(defaults)["workers"])
+    
+    with pool:
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                item = {"error": "Batch item must be a JSON object"}
+            item_id = item.get('id', index)
+            if "error" in item:
+                result = {"success": False, "error": item["error"]}
+            else:
+                try:
+                    result = handle_request({**defaults, **item, "action": "transpile"})
+                except Exception as e:
+                    result = {"success": False, "error": f"Server error: {str(e)}"}
+        
+            if result.get("success"):
+                succeeded += 1
+            else:
+                failed += 1
+            emit({"id": item_id, **result})
+    
+    return {
+        "success": failed == 0,
+        "event": "batch_done",
+        "items": succeeded + failed,
+        "succeeded": succeeded,
+        "failed": failed,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+def batch_defaults(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: input_data[key] for key in BATCH_ITEM_DEFAULTS if key in input_data}
+
+def iter_ndjson_items(lines: Iterable[str]) -> Iterable[Any]:
+    """Элементы пакета из NDJSON; строка с ошибкой разбора становится элементом-ошибкой"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield {"id": None, "error": f"Invalid JSON: {str(e)}"}
+
+def handle_request(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Выполняет одно действие (transpile / analyze / supported_dialects / ...).
+    
+    trace: true - добавить в ответ время по этапам и самые медленные выражения.
+    """
+    if input_data.get('trace'):
+        return run_traced(input_data)
+    
+    statement_ms = input_data.get('statement_budget_ms', TIME_BUDGET_DEFAULTS["statement_budget_ms"])
+    request_ms = input_data.get('request_budget_ms', TIME_BUDGET_DEFAULTS["request_budget_ms"])
+    if (statement_ms or request_ms) and current_budget() is None:
+        return run_budgeted(input_data, statement_ms, request_ms)
+    
+    action = input_data.get('action', 'transpile')
+    
+    if action == 'transpile':
+        return run_transpile(input_data)
+    
+    elif action == 'transpile_many':
+        return run_transpile_many(input_data)
+    
+    elif action == 'transpile_document':
+        return run_transpile_document(input_data)
+    
+    elif action == 'close_document':
+        return close_document_session(input_data)
+    
+    elif action == 'transpile_batch':
+        # Без потокового вывода (сокет-сервер) результаты собираются в ответ
+        results = []
+        summary = run_transpile_batch(input_data.get('items') or [], batch_defaults(input_data), results.append)
+        return {**summary, "results": results}
+            
+    elif action == 'analyze':
+        sql = input_data.get('sql', '')
+        has_complex = any(keyword in sql.upper() for keyword in [
+            'CREATE PROCEDURE', 'CREATE FUNCTION', 'CREATE TRIGGER', 'DELIMITER'
+        ])
         
-        if action == 'transpile':
-            result = transpile_sql_for_dialect(
-                input_data.get('sql', ''),
-                input_data.get('from_dialect', 'mysql'),
-                input_data.get('to_dialect', 'postgres')
-            )
+        return {
+            "success": True,
+            "statements": len(sql.split(';')),
+            "lines": len(sql.split('\n')),
+            "has_complex_constructs": has_complex,
+            "note": "Basic SQL analysis"
+        }
+        
+    elif action == 'cache_stats':
+        stats = {"result_cache": result_cache.stats()}
+        # Кэш AST и сессии редактора показываются, только если модули уже загружены
+        hybrid_module = sys.modules.get('hybrid_transpiler_demo')
+        if hybrid_module is not None:
+            stats["parse_cache"] = hybrid_module.parse_cache.stats()
+        session_module = sys.modules.get('transpile_session')
+        if session_module is not None:
+            stats["document_sessions"] = session_module.document_sessions.stats()
+        if input_data.get('clear'):
+            result_cache.clear()
+            if hybrid_module is not None:
+                hybrid_module.parse_cache.clear()
+            if session_module is not None:
+                session_module.document_sessions.clear()
+        return {"success": True, **stats}
+        
+    elif action == 'rule_stats':
+        return {
+            "success": True,
+            "rule_hits": rule_hit_counts(not input_data.get('include_zero', False))
+        }
+        
+    elif action == 'diagnostics':
+        return run_diagnostics(input_data)
+        
+    elif action == 'warmup':
+        return {"success": True, **warmup(input_data.get('dialects'))}
+        
+    elif action == 'supported_dialects':
+        return {
+            "success": True,
+            "dialects": SUPPORTED_DIALECTS
+        }
+    
+    return {"success": False, "error": f"Unknown action: {action}"}
+
+def handle_streaming_request(input_data: Dict[str, Any], emit: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """handle_request для построчных режимов: элементы transpile_batch передаются
+    в emit по мере готовности (с batch_id), сводка возвращается ответом на запрос"""
+    if input_data.get('action') == 'transpile_batch':
+        request_id = input_data.get('id')
+        return run_transpile_batch(input_data.get('items') or [], batch_defaults(input_data),
+                                   lambda item: emit({"batch_id": request_id, **item}))
+    return handle_request(input_data)
+
+def parse_request_line(line: Any) -> Dict[str, Any]:
+    """Запрос из строки NDJSON; ValueError - не JSON или не объект"""
+    input_data = json.loads(line)
+    if not isinstance(input_data, dict):
+        raise ValueError(f"Request must be a JSON object, got {type(input_data).__name__}")
+    return input_data
+
+def write_line(payload: Dict[str, Any]) -> None:
+    """Пишет один JSON-ответ в stdout и сразу сбрасывает буфер"""
+    sys.stdout.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+# ==================== Долгоживущий режим (worker) ====================
+
+def run_worker(max_requests: int = 0) -> int:
+    """Читает NDJSON-запросы из stdin и отвечает одной JSON-строкой на каждый.
+    
+    Запрос: {"id": ..., "action": ..., ...}; ответ содержит тот же id.
+    {"action": "shutdown"} или EOF завершают воркер, SIGTERM/SIGINT дают
+    дописать текущий ответ. После max_requests запросов воркер выходит
+    с WORKER_RESTART_EXIT_CODE, чтобы родитель поднял свежий процесс.
+    """
+    state = {"busy": False, "stop": False}
+    
+    def request_stop(signum, frame):
+        state["stop"] = True
+        if not state["busy"]:
+            # Ожидаем ввод - выходим сразу, прерывая readline
+            raise SystemExit(0)
+    
+    for sig_name in ("SIGTERM", "SIGINT"):
+        if hasattr(signal, sig_name):
+            signal.signal(getattr(signal, sig_name), request_stop)
+    
+    handled = 0
+    write_line({"event": "ready", "pid": os.getpid()})
+    
+    try:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            
+            state["busy"] = True
+            request_id = None
+            try:
+                input_data = parse_request_line(line)
+                request_id = input_data.get('id')
+                
+                if input_data.get('action') == 'shutdown':
+                    write_line({"id": request_id, "success": True, "shutdown": True})
+                    return 0
                 
-        elif action == 'analyze':
-            sql = input_data.get('sql', '')
-            has_complex = any(keyword in sql.upper() for keyword in [
-                'CREATE PROCEDURE', 'CREATE FUNCTION', 'CREATE TRIGGER', 'DELIMITER'
-            ])
+                result = handle_streaming_request(input_data, write_line)
+            except Exception as e:
+                result = {"success": False, "error": f"Server error: {str(e)}"}
             
-            result = {
-                "success": True,
-                "statements": len(sql.split(';')),
-                "lines": len(sql.split('\n')),
-                "has_complex_constructs": has_complex,
-                "note": "Basic SQL analysis"
-            }
+            write_line({"id": request_id, **result})
+            state["busy"] = False
+            handled += 1
             
-        elif action == 'supported_dialects':
-            result = {
-                "success": True,
-                "dialects": [
-                    {"name": "mysql", "display_name": "MySQL", "icon": "🐬"},
-                    {"name": "postgres", "display_name": "PostgreSQL", "icon": "🐘"},
-                    {"name": "snowflake", "display_name": "Snowflake", "icon": "❄️"},
-                    {"name": "bigquery", "display_name": "BigQuery", "icon": "☁️"},
-                    {"name": "oracle", "display_name": "Oracle", "icon": "🔷"},
-                    {"name": "mssql", "display_name": "SQL Server", "icon": "🔶"},
-                    {"name": "sqlite", "display_name": "SQLite", "icon": "📱"},
-                    {"name": "redshift", "display_name": "Redshift", "icon": "🔴"},
-                ]
-            }
+            if state["stop"]:
+                return 0
+            if max_requests and handled >= max_requests:
+                write_line({"event": "restart", "requests_handled": handled})
+                return WORKER_RESTART_EXIT_CODE
+    except SystemExit as e:
+        return e.code or 0
+    
+    return 0
+
+# ==================== Пул воркеров с fork (prefork) ====================
+
+# Код выхода воркера пула, превысившего лимит памяти (--max-memory-mb)
+WORKER_MEMORY_EXIT_CODE = 76
+
+# Воркер, упавший быстрее этого срока, перезапускается с задержкой - защита от цикла падений
+PREFORK_MIN_LIFETIME_S = 1.0
+PREFORK_RESPAWN_DELAY_S = 1.0
+
+PREFORK_READ_CHUNK = 1024 * 1024
+
+def current_rss_bytes() -> int:
+    """Текущий RSS процесса; без /proc - пиковый (ru_maxrss)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def write_fd(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+class PreforkWorker:
+    """Процесс пула: pid, каналы запросов и ответов, текущий запрос"""
+
+    def __init__(self, pid: int, request_fd: int, response_fd: int):
+        self.pid = pid
+        self.request_fd = request_fd
+        self.response_fd = response_fd
+        self.started = time.monotonic()
+        self.pending = bytearray()   # недописанная строка ответа
+        self.request: Optional[Tuple[Any, bytes]] = None   # (id, строка) выполняемого запроса
+        self.handled = 0
+
+    def take_lines(self, chunk: bytes) -> Tuple[bytes, bool]:
+        """Принимает кусок вывода воркера: (готовые строки, запрос завершён).
+
+        Запрос завершается пустой строкой - JSON-ответ её содержать не может.
+        """
+        self.pending += chunk
+        end = self.pending.rfind(b"\n") + 1
+        if not end:
+            return b"", False
+        lines = bytes(self.pending[:end])
+        del self.pending[:end]
+        if lines == b"\n" or lines.endswith(b"\n\n"):
+            return lines[:-1], True
+        return lines, False
+
+def run_prefork_child(request_fd: int, response_fd: int, max_requests: int, max_rss_bytes: int) -> int:
+    """Цикл воркера пула: запрос - строка из канала, ответ - строки и пустая строка.
+
+    Воркер выходит после ответа, если исчерпал max_requests или RSS превысил
+    max_rss_bytes; супервизор поднимает вместо него новый.
+    """
+    def send(payload: Dict[str, Any]) -> None:
+        write_fd(response_fd, (json.dumps(payload, ensure_ascii=False) + "\n").encode('utf-8'))
+
+    handled = 0
+    with os.fdopen(request_fd, 'rb') as requests:
+        for line in requests:
+            request_id = None
+            try:
+                input_data = parse_request_line(line)
+                request_id = input_data.get('id')
+                result = handle_streaming_request(input_data, send)
+            except Exception as e:
+                result = {"success": False, "error": f"Server error: {str(e)}"}
+            write_fd(response_fd, (json.dumps({"id": request_id, **result}, ensure_ascii=False) + "\n\n").encode('utf-8'))
+
+            handled += 1
+            if max_requests and handled >= max_requests:
+                return WORKER_RESTART_EXIT_CODE
+            if max_rss_bytes and current_rss_bytes() > max_rss_bytes:
+                return WORKER_MEMORY_EXIT_CODE
+    return 0
+
+def exit_reason(status: int) -> str:
+    """Причина выхода воркера пула по статусу waitpid"""
+    if os.WIFSIGNALED(status):
+        return f"signal {os.WTERMSIG(status)}"
+    code = os.WEXITSTATUS(status)
+    if code == WORKER_RESTART_EXIT_CODE:
+        return "max_requests"
+    if code == WORKER_MEMORY_EXIT_CODE:
+        return "max_memory"
+    return f"exit code {code}"
+
+def run_prefork_supervisor(workers: int, max_requests: int = 0, max_memory_mb: int = 0) -> int:
+    """Супервизор пула: прогрев один раз, затем fork N воркеров.
+
+    Модули sqlglot, скомпилированные правила и кэши прогрева достаются
+    воркерам copy-on-write, так что прогрев не повторяется в каждом процессе.
+    Запросы NDJSON из stdin раздаются свободным воркерам по каналам, ответы
+    пишутся в stdout в порядке готовности (сопоставляются по id). Воркер,
+    упавший, превысивший лимит памяти или число запросов, заменяется новым;
+    запрос упавшего воркера получает ответ с ошибкой и не повторяется.
+    """
+    import gc
+    import selectors
+    from collections import deque
+
+    print(json.dumps({"event": "warmup", **warmup()}), file=sys.stderr, flush=True)
+    # Объекты прогрева уходят из поколений сборщика: сборка мусора в воркерах
+    # не трогает их заголовки, и страницы остаются общими с супервизором
+    gc.collect()
+    gc.freeze()
+
+    max_rss_bytes = max_memory_mb * 1024 * 1024
+    selector = selectors.DefaultSelector()
+    pool: Dict[int, PreforkWorker] = {}
+    idle: "deque[PreforkWorker]" = deque()
+    queue: "deque[Tuple[Any, bytes]]" = deque()
+    respawn_at: List[float] = []
+    stats = {"respawns": 0, "crashes": 0, "requests": 0}
+    state = {"reading": True}
+    stdin_fd = sys.stdin.fileno()
+    stdin_pending = bytearray()
+
+    def respond(payload: Dict[str, Any]) -> None:
+        sys.stdout.buffer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode('utf-8'))
+        sys.stdout.buffer.flush()
+
+    def spawn() -> PreforkWorker:
+        request_read, request_write = os.pipe()
+        response_read, response_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                # Завершение пула - закрытие каналов супервизором; сигналы терминала его не обходят
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_IGN)
+                # Чужие каналы закрываются, иначе воркеры не увидят EOF друг друга
+                os.close(request_write)
+                os.close(response_read)
+                for other in pool.values():
+                    os.close(other.request_fd)
+                    os.close(other.response_fd)
+                code = run_prefork_child(request_read, response_write, max_requests, max_rss_bytes)
+            finally:
+                os._exit(code)
+        os.close(request_read)
+        os.close(response_write)
+        worker = PreforkWorker(pid, request_write, response_read)
+        pool[worker.pid] = worker
+        selector.register(response_read, selectors.EVENT_READ, worker)
+        idle.append(worker)
+        return worker
+
+    def retire(worker: PreforkWorker) -> None:
+        """Воркер закрыл канал ответов: забираем статус и планируем замену"""
+        selector.unregister(worker.response_fd)
+        os.close(worker.response_fd)
+        os.close(worker.request_fd)
+        del pool[worker.pid]
+        if worker in idle:
+            idle.remove(worker)
+        _, status = os.waitpid(worker.pid, 0)
+        reason = exit_reason(status)
+
+        crashed = reason not in ("max_requests", "max_memory")
+        if crashed:
+            stats["crashes"] += 1
+        if worker.request is not None:
+            if crashed:
+                respond({"id": worker.request[0], "success": False,
+                         "error": f"Worker {worker.pid} crashed ({reason})"})
+            else:
+                # Плановый выход после ответа: запрос попал в канал, но не начинался
+                queue.appendleft(worker.request)
+
+        delay = PREFORK_RESPAWN_DELAY_S if crashed and time.monotonic() - worker.started < PREFORK_MIN_LIFETIME_S else 0
+        respawn_at.append(time.monotonic() + delay)
+        print(json.dumps({"event": "worker_exit", "pid": worker.pid, "reason": reason,
+                          "requests_handled": worker.handled, "respawn_delay_s": delay}),
+              file=sys.stderr, flush=True)
+
+    def dispatch() -> None:
+        while queue and idle:
+            worker = idle.popleft()
+            worker.request = queue.popleft()
+            try:
+                write_fd(worker.request_fd, worker.request[1])
+            except BrokenPipeError:
+                # Воркер уже вышел: ответ об ошибке придёт при закрытии его канала
+                pass
+
+    def accept(line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            input_data = parse_request_line(line)
+        except ValueError as e:
+            respond({"id": None, "success": False, "error": f"Server error: {str(e)}"})
+            return
+        request_id = input_data.get('id')
+        action = input_data.get('action')
+        if action == 'shutdown':
+            # Новые запросы не принимаются, начатые и очередь дорабатываются
+            state["reading"] = False
+            respond({"id": request_id, "success": True, "shutdown": True})
+        elif action == 'pool_stats':
+            respond({"id": request_id, "success": True, **stats,
+                     "workers": [{"pid": worker.pid, "busy": worker.request is not None, "requests_handled": worker.handled}
+                                 for worker in pool.values()],
+                     "queued": len(queue)})
         else:
-            result = {"success": False, "error": f"Unknown action: {action}"}
+            queue.append((request_id, line if line.endswith(b"\n") else line + b"\n"))
+
+    def request_stop(signum, frame):
+        state["reading"] = False
+
+    for sig_name in ("SIGTERM", "SIGINT"):
+        if hasattr(signal, sig_name):
+            signal.signal(getattr(signal, sig_name), request_stop)
+
+    for _ in range(workers):
+        spawn()
+    selector.register(stdin_fd, selectors.EVENT_READ, None)
+    respond({"event": "ready", "pid": os.getpid(), "workers": [worker.pid for worker in pool.values()]})
+
+    while state["reading"] or queue or any(worker.request is not None for worker in pool.values()):
+        if not state["reading"] and stdin_fd in selector.get_map():
+            selector.unregister(stdin_fd)
+
+        now = time.monotonic()
+        while respawn_at and min(respawn_at) <= now:
+            respawn_at.remove(min(respawn_at))
+            spawn()
+            stats["respawns"] += 1
+        # Таймаут нужен для отложенных перезапусков и для проверки флага остановки после сигнала
+        timeout = max(min(respawn_at) - now, 0) if respawn_at else 1.0
+
+        for key, _ in selector.select(min(timeout, 1.0)):
+            worker = key.data
+            if worker is None:
+                chunk = os.read(stdin_fd, PREFORK_READ_CHUNK)
+                if not chunk:
+                    state["reading"] = False
+                    accept(bytes(stdin_pending))
+                    continue
+                stdin_pending += chunk
+                end = stdin_pending.rfind(b"\n") + 1
+                if end:
+                    for line in bytes(stdin_pending[:end]).splitlines(keepends=True):
+                        accept(line)
+                    del stdin_pending[:end]
+                continue
+
+            chunk = os.read(worker.response_fd, PREFORK_READ_CHUNK)
+            if not chunk:
+                retire(worker)
+                continue
+            lines, finished = worker.take_lines(chunk)
+            if lines:
+                sys.stdout.buffer.write(lines)
+                sys.stdout.buffer.flush()
+            if finished:
+                worker.request = None
+                worker.handled += 1
+                stats["requests"] += 1
+                # Исчерпавший лимит воркер сейчас выйдет - запросы ему не отдаются
+                if not max_requests or worker.handled < max_requests:
+                    idle.append(worker)
+        dispatch()
+
+    # Воркеры завершаются, увидев EOF в канале запросов
+    for worker in list(pool.values()):
+        selector.unregister(worker.response_fd)
+        os.close(worker.request_fd)
+        os.close(worker.response_fd)
+        os.waitpid(worker.pid, 0)
+    selector.close()
+    return 0
+
+# ==================== Сокет-сервер (asyncio) ====================
+
+# Лимит длины одной NDJSON-строки (по умолчанию asyncio - всего 64 КБ)
+SOCKET_LINE_LIMIT = 256 * 1024 * 1024
+
+async def serve_connection(reader: "asyncio.StreamReader", writer: "asyncio.StreamWriter",
+                           executor: "Executor", semaphore: "asyncio.Semaphore",
+                           request_timeout: float, stop_event: "asyncio.Event") -> None:
+    """Обслуживает одно соединение: NDJSON-запросы, ответы в порядке готовности.
+    
+    Запросы одного соединения выполняются параллельно, поэтому клиент
+    сопоставляет ответы по id.
+    """
+    import asyncio
+    
+    loop = asyncio.get_running_loop()
+    write_lock = asyncio.Lock()
+    pending = set()
+    
+    async def respond(payload: Dict[str, Any]) -> None:
+        async with write_lock:
+            writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode('utf-8'))
+            await writer.drain()
+    
+    async def process(input_data: Dict[str, Any]) -> None:
+        request_id = input_data.get('id')
+        # Слот семафора освобождается, когда работа в executor действительно
+        # закончилась, а не по таймауту - иначе очередь executor растёт без границ
+        await semaphore.acquire()
+        future = loop.run_in_executor(executor, handle_request, input_data)
+        future.add_done_callback(lambda _: semaphore.release())
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), request_timeout)
+        except asyncio.TimeoutError:
+            result = {"success": False, "error": f"Request timed out after {request_timeout} s"}
+        except Exception as e:
+            result = {"success": False, "error": f"Server error: {str(e)}"}
+        await respond({"id": request_id, **result})
+    
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                await respond({"id": None, "success": False, "error": "Request line too long"})
+                break
+            if not line:
+                break
+            if not line.strip():
+                continue
+            
+            try:
+                input_data = parse_request_line(line)
+            except ValueError as e:
+                await respond({"id": None, "success": False, "error": f"Server error: {str(e)}"})
+                continue
+            
+            if input_data.get('action') == 'shutdown':
+                await respond({"id": input_data.get('id'), "success": True, "shutdown": True})
+                stop_event.set()
+                break
+            
+            task = asyncio.create_task(process(input_data))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
         
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        writer.close()
+
+async def run_socket_server(socket_path: Optional[str], host: str, port: Optional[int],
+                            max_concurrency: int, request_timeout: float, workers: int,
+                            warmup_workers: bool = False) -> None:
+    """asyncio-сервер на Unix-сокете или localhost TCP.
+    
+    Транспиляция выполняется в executor (потоки при workers=0, иначе пул
+    процессов), поэтому цикл событий продолжает принимать соединения.
+    В режиме пула процессов у каждого процесса свой кэш; при warmup_workers
+    каждый процесс пула прогревается при старте.
+    """
+    import asyncio
+    from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+    
+    executor: Executor = ProcessPoolExecutor(max_workers=workers, initializer=warmup if warmup_workers else None) \
+        if workers > 0 else ThreadPoolExecutor(max_workers=max_concurrency)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    stop_event = asyncio.Event()
+    
+    def on_connection(reader, writer):
+        return serve_connection(reader, writer, executor, semaphore, request_timeout, stop_event)
+    
+    if socket_path:
+        server = await asyncio.start_unix_server(on_connection, path=socket_path, limit=SOCKET_LINE_LIMIT)
+        address = socket_path
+    else:
+        server = await asyncio.start_server(on_connection, host=host, port=port, limit=SOCKET_LINE_LIMIT)
+        address = f"{host}:{port}"
+    
+    loop = asyncio.get_running_loop()
+    for sig_name in ("SIGTERM", "SIGINT"):
+        if hasattr(signal, sig_name):
+            try:
+                loop.add_signal_handler(getattr(signal, sig_name), stop_event.set)
+            except NotImplementedError:
+                pass  # Windows: сигналы в цикле событий не поддерживаются
+    
+    print(json.dumps({"event": "listening", "address": address, "pid": os.getpid()}), file=sys.stderr, flush=True)
+    
+    async with server:
+        await stop_event.wait()
+    
+    # Дожидаемся уже начатой работы, очередь отменяем
+    executor.shutdown(wait=True, cancel_futures=True)
+    if socket_path and os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+def run_socket_client(socket_path: Optional[str], host: str, port: Optional[int]) -> None:
+    """Локальный клиент для замеров: шлёт NDJSON из stdin одним соединением,
+    печатает ответы и сводку по задержкам в stderr."""
+    import socket
+    
+    if socket_path:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(socket_path)
+    else:
+        connection = socket.create_connection((host, port))
+    
+    stream = connection.makefile('rwb')
+    latencies = []
+    started = time.perf_counter()
+    
+    for line in sys.stdin.buffer:
+        if not line.strip():
+            continue
+        sent = time.perf_counter()
+        stream.write(line if line.endswith(b"\n") else line + b"\n")
+        stream.flush()
+        response = stream.readline()
+        latencies.append(time.perf_counter() - sent)
+        sys.stdout.write(response.decode('utf-8'))
+    
+    total = time.perf_counter() - started
+    connection.close()
+    
+    if latencies:
+        latencies.sort()
+        print(json.dumps({
+            "requests": len(latencies),
+            "total_s": round(total, 4),
+            "avg_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3),
+        }), file=sys.stderr)
+
+# ==================== Main Function ====================
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="SQL transpiler server")
+    parser.add_argument("--worker", action="store_true",
+                        help="долгоживущий режим: NDJSON-запросы из stdin")
+    parser.add_argument("--max-requests", type=int, default=0,
+                        help="перезапуск воркера после N запросов (0 - без ограничения)")
+    parser.add_argument("--prefork", type=int, default=0,
+                        help="пул из N воркеров (fork после прогрева), NDJSON-запросы из stdin")
+    parser.add_argument("--max-memory-mb", type=int, default=0,
+                        help="перезапуск воркера пула, если его RSS превысил лимит (0 - без ограничения)")
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_RESULT_CACHE_BYTES // (1024 * 1024),
+                        help="лимит кэша результатов в мегабайтах")
+    parser.add_argument("--session-mb", type=int,
+                        help="лимит памяти сессий редактора (transpile_document) в мегабайтах, по умолчанию 64")
+    parser.add_argument("--serve", action="store_true",
+                        help="asyncio-сервер на --socket или --port")
+    parser.add_argument("--client", action="store_true",
+                        help="локальный клиент к --socket / --port (NDJSON из stdin)")
+    parser.add_argument("--socket", help="путь к Unix-сокету")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--max-concurrency", type=int, default=8,
+                        help="максимум одновременно выполняемых запросов")
+    parser.add_argument("--request-timeout", type=float, default=30.0,
+                        help="таймаут запроса в секундах")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="размер пула процессов (0 - потоки в одном процессе)")
+    parser.add_argument("--batch", action="store_true",
+                        help="пакетный режим: элементы {id, sql, ...} в NDJSON из stdin, результат - по строке на элемент")
+    parser.add_argument("--from-dialect", default="mysql",
+                        help="диалект по умолчанию для --batch")
+    parser.add_argument("--to-dialect",
+                        help="целевой диалект по умолчанию для --batch")
+    parser.add_argument("--statement-budget-ms", type=float, default=0,
+                        help="бюджет sqlglot на одно выражение, затем быстрые замены (0 - без ограничения)")
+    parser.add_argument("--request-budget-ms", type=float, default=0,
+                        help="бюджет sqlglot на весь запрос (0 - без ограничения)")
+    parser.add_argument("--warmup", action="store_true",
+                        help="загрузить sqlglot и скомпилировать правила до первого запроса")
+    args = parser.parse_args()
+    result_cache.resize(args.cache_mb * 1024 * 1024)
+    TIME_BUDGET_DEFAULTS.update(statement_budget_ms=args.statement_budget_ms,
+                                request_budget_ms=args.request_budget_ms)
+    if args.session_mb is not None:
+        # Модуль сессий тянет гибридный транспилятор - загружается только по требованию
+        from transpile_session import document_sessions
+        document_sessions.resize(args.session_mb * 1024 * 1024)
+    
+    if args.warmup and (args.worker or args.serve or args.batch):
+        print(json.dumps({"event": "warmup", **warmup()}), file=sys.stderr, flush=True)
+    
+    if (args.serve or args.client) and not (args.socket or args.port):
+        parser.error("--serve/--client требуют --socket или --port")
+    
+    if args.serve:
+        import asyncio
+        asyncio.run(run_socket_server(args.socket, args.host, args.port, args.max_concurrency,
+                                      args.request_timeout, args.workers, args.warmup))
+        return
+    
+    if args.client:
+        run_socket_client(args.socket, args.host, args.port)
+        return
+    
+    if args.prefork:
+        if not hasattr(os, 'fork'):
+            parser.error("--prefork требует os.fork (Linux / macOS)")
+        sys.exit(run_prefork_supervisor(args.prefork, args.max_requests, args.max_memory_mb))
+    
+    if args.worker:
+        sys.stdin.reconfigure(encoding='utf-8')
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.exit(run_worker(args.max_requests))
+    
+    if args.batch:
+        sys.stdin.reconfigure(encoding='utf-8')
+        sys.stdout.reconfigure(encoding='utf-8')
+        defaults = {"from_dialect": args.from_dialect}
+        if args.to_dialect:
+            defaults["to_dialect"] = args.to_dialect
+        summary = run_transpile_batch(iter_ndjson_items(sys.stdin), defaults, write_line)
+        write_line(summary)
+        sys.exit(0 if summary["success"] else 1)
+    
+    try:
+        input_data = json.loads(sys.stdin.read())
+        if input_data.get('action') == 'transpile_batch':
+            # Одноразовый запуск тоже отдаёт результаты построчно
+            write_line(run_transpile_batch(input_data.get('items') or [],
+                                           batch_defaults(input_data), write_line))
+            return
+        result = handle_request(input_data)
         print(json.dumps(result, ensure_ascii=False))
         
     except Exception as e:
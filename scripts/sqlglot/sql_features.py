@@ -0,0 +1,219 @@
+# ==================== ИМПОРТЫ ====================
+
+from enum import IntFlag
+from typing import Dict, List, Optional, Tuple
+
+from sql_lexer import COMMENT, OP, PUNCT, WORD, WS, Token
+
+# ==================== Признаки ====================
+
+class Feature(IntFlag):
+    """Признаки SQL-конструкций выражения; объединяются через |"""
+    NONE = 0
+    WINDOW_FUNCTIONS = 1 << 0
+    CTE = 1 << 1
+    RECURSIVE = 1 << 2
+    ROLLUP = 1 << 3
+    PIVOT = 1 << 4
+    CASE_WHEN = 1 << 5
+    SUBQUERIES = 1 << 6
+    JSON_FUNCTIONS = 1 << 7
+    STRING_FUNCTIONS = 1 << 8
+    DATE_FUNCTIONS = 1 << 9
+    AGGREGATE_FUNCTIONS = 1 << 10
+    # Служебный: ALTER TABLE ... ADD FOREIGN KEY (в ответ API не входит)
+    ALTER_FOREIGN_KEY = 1 << 11
+
+_ALL_FEATURES = (1 << 12) - 1
+
+# Конструкции, которые простые замены не переводят - такие выражения идут в sqlglot
+COMPLEX_FEATURES = (Feature.WINDOW_FUNCTIONS | Feature.CTE | Feature.RECURSIVE
+                    | Feature.ROLLUP | Feature.PIVOT)
+
+# Имена признаков в ответе API (как у прежнего detect_complex_features)
+FEATURE_NAMES = [
+    ("has_window_functions", Feature.WINDOW_FUNCTIONS),
+    ("has_cte", Feature.CTE),
+    ("has_recursive", Feature.RECURSIVE),
+    ("has_rollup", Feature.ROLLUP),
+    ("has_pivot", Feature.PIVOT),
+    ("has_case_when", Feature.CASE_WHEN),
+    ("has_subqueries", Feature.SUBQUERIES),
+    ("has_json_functions", Feature.JSON_FUNCTIONS),
+    ("has_string_functions", Feature.STRING_FUNCTIONS),
+    ("has_date_functions", Feature.DATE_FUNCTIONS),
+    ("has_aggregate_functions", Feature.AGGREGATE_FUNCTIONS),
+]
+
+# ==================== Таблицы ключевых слов ====================
+
+# Функции: признак засчитывается, если за словом следует '('
+_FUNCTION_WORDS: Dict[str, int] = {
+    **dict.fromkeys(["OVER", "ROW_NUMBER", "RANK", "DENSE_RANK", "PERCENT_RANK", "NTILE", "CUME_DIST",
+                     "LEAD", "LAG", "FIRST_VALUE", "LAST_VALUE", "NTH_VALUE"], int(Feature.WINDOW_FUNCTIONS)),
+    **dict.fromkeys(["ROLLUP", "CUBE"], int(Feature.ROLLUP)),
+    **dict.fromkeys(["CONCAT", "SUBSTRING"], int(Feature.STRING_FUNCTIONS)),
+    **dict.fromkeys(["YEAR", "MONTH"], int(Feature.DATE_FUNCTIONS)),
+    **dict.fromkeys(["SUM", "AVG", "COUNT", "MAX", "MIN"], int(Feature.AGGREGATE_FUNCTIONS)),
+}
+
+# Слова, значимые сами по себе
+_PLAIN_WORDS = {
+    **dict.fromkeys(["PIVOT", "UNPIVOT"], Feature.PIVOT),
+    "CASE": Feature.CASE_WHEN,
+    "LIKE": Feature.STRING_FUNCTIONS,
+    **dict.fromkeys(["DATE_ADD", "DATE_SUB", "DATEDIFF"], Feature.DATE_FUNCTIONS),
+}
+
+# Пары слов подряд (пробелы и комментарии между ними не важны)
+_WORD_PAIRS = {
+    ("PARTITION", "BY"): Feature.WINDOW_FUNCTIONS,
+    ("ORDER", "BY"): Feature.WINDOW_FUNCTIONS,
+    ("WITH", "ROLLUP"): Feature.ROLLUP,
+    ("GROUPING", "SETS"): Feature.ROLLUP,
+    ("WITH", "RECURSIVE"): Feature.CTE | Feature.RECURSIVE,
+}
+
+# Служебные пары для ALTER TABLE ... ADD FOREIGN KEY
+_ALTER_TABLE = 1 << 30
+_ADD_FOREIGN = 1 << 31
+_SERVICE_PAIRS = {("ALTER", "TABLE"): _ALTER_TABLE, ("ADD", "FOREIGN"): _ADD_FOREIGN}
+
+# Слово -> (признак самого слова, признак пары с предыдущим словом)
+_WORD_TABLE: Dict[str, Tuple[int, Dict[str, int]]] = {}
+for (_first, _second), _flag in list(_WORD_PAIRS.items()) + list(_SERVICE_PAIRS.items()):
+    _WORD_TABLE.setdefault(_second, (0, {}))[1][_first] = int(_flag)
+for _word, _flag in _PLAIN_WORDS.items():
+    _WORD_TABLE[_word] = (int(_flag), _WORD_TABLE.get(_word, (0, {}))[1])
+
+_WORD_PREFIXES = (("JSON_", int(Feature.JSON_FUNCTIONS)), ("REGEXP_", int(Feature.STRING_FUNCTIONS)))
+
+# Слова после '(', с которых начинается подзапрос (как у прежнего детектора: "(FROM", "(WHERE", "(HAVING")
+_SUBQUERY_WORDS = {"SELECT", "FROM", "WHERE", "HAVING"}
+
+# Признаки как int: операции IntFlag в цикле заметно дороже
+_SUBQUERIES = int(Feature.SUBQUERIES)
+_CTE = int(Feature.CTE)
+_JSON = int(Feature.JSON_FUNCTIONS)
+_ALTER_FOREIGN_KEY = int(Feature.ALTER_FOREIGN_KEY)
+
+_JSON_OPERATORS = {"->", "->>", "#>", "#>>"}
+
+# То же для features_to_dict
+_FEATURE_NAME_BITS = [(name, int(flag)) for name, flag in FEATURE_NAMES]
+_COMPLEX_BITS = int(COMPLEX_FEATURES)
+
+# ==================== Детектор ====================
+
+def detect_features(sql: str, tokens: List[Token], first: int = 0, last: Optional[int] = None) -> Feature:
+    """Признаки конструкций за один проход по токенам диапазона [first, last).
+
+    Строки, идентификаторы в кавычках и комментарии не просматриваются,
+    поэтому ключевые слова внутри них признаков не дают. Токены уже есть
+    после разбиения на выражения, так что повторно текст не сканируется.
+
+    Отличия от поиска подстрок detect_sql_features (transpiler_bench.py --detector):
+    слова и операторы в строках и комментариях (LIKE, PIVOT, '->') не
+    считаются; подзапрос "(SELECT" находится и с пробелом или переводом
+    строки после скобки. На маршрут в sqlglot (is_complex) из этого влияет
+    только PIVOT/UNPIVOT в комментарии.
+    """
+    flags = 0
+    previous = ""        # предыдущий значимый токен: слово, "(" или ""
+    with_seen = False
+    word_table = _WORD_TABLE
+    function_words = _FUNCTION_WORDS
+    subquery_words = _SUBQUERY_WORDS
+    ws, word_kind, punct, op, comment = WS, WORD, PUNCT, OP, COMMENT
+
+    for kind, start, end in tokens[first:last]:
+        if kind == ws:
+            continue
+        if kind == word_kind:
+            word = sql[start:end].upper()
+            entry = word_table.get(word)
+            if entry is not None:
+                flags |= entry[0] | entry[1].get(previous, 0)
+            elif word in subquery_words:
+                if previous == "(":
+                    flags |= _SUBQUERIES
+            elif word == "WITH":
+                with_seen = True
+            elif "_" in word:
+                for prefix, flag in _WORD_PREFIXES:
+                    if word.startswith(prefix):
+                        flags |= flag
+            previous = word
+
+        elif kind == punct:
+            if sql[start] == "(":
+                if previous:
+                    flags |= function_words.get(previous, 0)
+                    # WITH имя AS ( - начало CTE
+                    if previous == "AS" and with_seen:
+                        flags |= _CTE
+                previous = "("
+            else:
+                previous = ""
+
+        elif kind == op:
+            if end - start > 1 and sql[start:end] in _JSON_OPERATORS:
+                flags |= _JSON
+            previous = ""
+
+        elif kind != comment:
+            previous = ""
+
+    if flags & _ALTER_TABLE and flags & _ADD_FOREIGN:
+        flags |= _ALTER_FOREIGN_KEY
+    return Feature(flags & _ALL_FEATURES)
+
+# ==================== Поиск подстрок (без токенов) ====================
+
+# Признак -> подстроки в тексте в верхнем регистре (как у прежнего detect_complex_features)
+_SUBSTRINGS: List[Tuple[int, Tuple[str, ...]]] = [
+    (int(Feature.WINDOW_FUNCTIONS), ("OVER(", "ROW_NUMBER()", "RANK()", "DENSE_RANK()", "LEAD(", "LAG(",
+                                     "FIRST_VALUE(", "LAST_VALUE(", "PARTITION BY", "ORDER BY")),
+    (int(Feature.RECURSIVE), ("WITH RECURSIVE",)),
+    (int(Feature.ROLLUP), ("WITH ROLLUP", "GROUPING SETS")),
+    (int(Feature.PIVOT), ("PIVOT",)),
+    (int(Feature.CASE_WHEN), ("CASE",)),
+    (_SUBQUERIES, ("(SELECT", "(FROM", "(WHERE", "(HAVING")),
+    (_JSON, ("JSON_", "->", "#>")),
+    (int(Feature.STRING_FUNCTIONS), ("CONCAT(", "SUBSTRING(", "REGEXP_", "LIKE")),
+    (int(Feature.DATE_FUNCTIONS), ("DATE_ADD", "DATE_SUB", "DATEDIFF", "YEAR(", "MONTH(")),
+    (int(Feature.AGGREGATE_FUNCTIONS), ("SUM(", "AVG(", "COUNT(", "MAX(", "MIN(")),
+]
+
+def detect_sql_features(sql: str) -> Feature:
+    """Признаки произвольного текста поиском подстрок, без токенизации.
+
+    Для вызовов, где токенов нет (отдельное выражение, заголовок INSERT):
+    токенизация ради одного детектора медленнее самого поиска в разы.
+    Ключевые слова в строках и комментариях здесь тоже засчитываются;
+    там, где токены уже есть, используется detect_features.
+    """
+    sql_upper = sql.upper()
+    flags = 0
+    for flag, needles in _SUBSTRINGS:
+        for needle in needles:
+            if needle in sql_upper:
+                flags |= flag
+                break
+    if "WITH" in sql_upper and ("RECURSIVE" in sql_upper or "AS (" in sql_upper):
+        flags |= _CTE
+    if "ALTER TABLE" in sql_upper and "ADD FOREIGN KEY" in sql_upper:
+        flags |= _ALTER_FOREIGN_KEY
+    return Feature(flags)
+
+# ==================== Результат ====================
+
+def is_complex(flags: Feature) -> bool:
+    return bool(flags & COMPLEX_FEATURES)
+
+def features_to_dict(flags: Feature) -> Dict[str, bool]:
+    """Признаки в формате ответа API: {"has_...": bool, ..., "is_complex": bool}"""
+    value = int(flags)
+    features = {name: bool(value & flag) for name, flag in _FEATURE_NAME_BITS}
+    features["is_complex"] = bool(value & _COMPLEX_BITS)
+    return features
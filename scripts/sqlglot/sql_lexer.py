@@ -0,0 +1,404 @@
+# ==================== ИМПОРТЫ ====================
+
+import codecs
+import mmap
+import re
+import sys
+from typing import IO, Iterator, List, NamedTuple, Optional, Tuple
+
+# ==================== Виды токенов ====================
+
+WS = "ws"
+COMMENT = "comment"
+STRING = "string"    # '...' - строковый литерал
+QUOTED = "quoted"    # `...` и "..." - идентификаторы в кавычках
+NUMBER = "number"
+WORD = "word"        # ключевые слова и идентификаторы
+PUNCT = "punct"      # ( ) , ;
+OP = "op"
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Прочитанные страницы отображённого файла отдаются ОС каждые N байт
+MAPPED_RELEASE_BYTES = 16 * 1024 * 1024
+
+# Захватывающие квантификаторы (*+, ++, ?+, {m,n}+) есть в re начиная с Python 3.11
+POSSESSIVE_QUANTIFIERS = sys.version_info >= (3, 11)
+
+def strip_possessive(pattern: str) -> str:
+    """Шаблон без '+' после квантификаторов (вне классов символов и экранирования)"""
+    parts = []
+    position = 0
+    length = len(pattern)
+    in_class = False
+    while position < length:
+        char = pattern[position]
+        parts.append(char)
+        position += 1
+        if char == '\\':
+            parts.append(pattern[position:position + 1])
+            position += 1
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+            # ']' сразу после '[' или '[^' - обычный символ
+            for literal in '^]':
+                if pattern[position:position + 1] == literal:
+                    parts.append(literal)
+                    position += 1
+        elif char in '*+?}' and pattern[position:position + 1] == '+' and pattern[position - 2:position] != '(?':
+            position += 1
+    return ''.join(parts)
+
+def compile_pattern(pattern: str, flags: int = 0) -> "re.Pattern":
+    """re.compile для шаблонов с захватывающими квантификаторами.
+
+    Такие шаблоны пишутся с однозначным разбором (развёрнутые циклы,
+    взаимоисключающие альтернативы), поэтому захват только отсекает
+    возвраты и память под них на больших дампах. На Python до 3.11
+    квантификаторы становятся жадными - совпадения те же.
+    """
+    if not POSSESSIVE_QUANTIFIERS:
+        pattern = strip_possessive(pattern)
+    return re.compile(pattern, flags)
+
+# Шаблоны строк и комментариев общие для лексера и правил замен:
+# внутри них правила диалектов ничего не переписывают
+STRING_PATTERN = r"'[^'\\]*(?:(?:\\[\s\S]|'')[^'\\]*)*(?:'|\Z)"
+LINE_COMMENT_PATTERN = r'--[^\n]*'
+BLOCK_COMMENT_PATTERN = r'/\*[\s\S]*?(?:\*/|\Z)'
+PROTECTED_PATTERN = f'{STRING_PATTERN}|{LINE_COMMENT_PATTERN}(?:\\n|\\Z)|{BLOCK_COMMENT_PATTERN}'
+
+_TOKEN_PATTERN = re.compile('|'.join([
+    r'(?P<ws>\s+)',
+    f'(?P<comment>{LINE_COMMENT_PATTERN}|{BLOCK_COMMENT_PATTERN})',
+    f'(?P<string>{STRING_PATTERN})',
+    r'(?P<quoted>`[^`]*(?:``[^`]*)*(?:`|\Z)|"[^"\\]*(?:(?:\\[\s\S]|"")[^"\\]*)*(?:"|\Z))',
+    r'(?P<number>0[xX][0-9A-Fa-f]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)',
+    r'(?P<word>[^\W\d]\w*)',
+    r'(?P<punct>[(),;])',
+    r'(?P<op>->>|->|#>>|#>|::|<=|>=|<>|!=|\|\||[\s\S])',
+]))
+
+QUOTED_PATTERN = r'`[^`]*(?:``[^`]*)*(?:`|\Z)|"[^"\\]*(?:(?:\\[\s\S]|"")[^"\\]*)*(?:"|\Z)'
+
+# Строки и идентификаторы в кавычках внутри группы: кавычка-разделитель
+# не может закрыть литерал, иначе 'a''b' разбирался бы двумя способами
+_GROUP_ITEM = (r"'[^'\\]*+(?:(?:\\[\s\S]|'')[^'\\]*+)*+(?:'(?!')|\Z)"
+               r'|`[^`]*+(?:``[^`]*+)*+(?:`(?!`)|\Z)|"[^"\\]*+(?:(?:\\[\s\S]|"")[^"\\]*+)*+(?:"(?!")|\Z)'
+               r"|-(?!-)|/(?!\*)")
+_GROUP_TEXT = r"""[^'"`()/-]*+"""
+
+# Упрощённый шаблон для потокового разбиения: значимы только строки,
+# комментарии и ( ) ; - остальной текст поглощается длинными отрезками.
+# Скобки без вложенных скобок и комментариев (строки VALUES в дампах)
+# поглощаются целиком вместе с запятой после них - глубина та же
+_SPLIT_PATTERN = compile_pattern('|'.join([
+    r'(?P<ws>\s+)',
+    f'(?P<comment>{LINE_COMMENT_PATTERN}|{BLOCK_COMMENT_PATTERN})',
+    f'(?P<string>{STRING_PATTERN})',
+    f'(?P<quoted>{QUOTED_PATTERN})',
+    f"(?P<group>\\({_GROUP_TEXT}(?:(?:{_GROUP_ITEM}){_GROUP_TEXT})*+\\)(?:\\s*+,)?+)",
+    r'(?P<punct>[();])',
+    r'(?P<op>[^\s\'"`();/-]+|[\s\S])',
+]))
+
+_LEADING_SPACE = re.compile(r'\s*')
+
+class Token(NamedTuple):
+    """Токен: вид и диапазон [start, end) в исходном тексте"""
+    kind: str
+    start: int
+    end: int
+
+class Statement(NamedTuple):
+    """Выражение: диапазон символов и диапазон индексов токенов [first, last)"""
+    start: int
+    end: int
+    first_token: int
+    last_token: int
+
+# ==================== Лексер ====================
+
+def iter_tokens(sql: str, pos: int = 0) -> Iterator[Token]:
+    """Лениво разбивает SQL на токены начиная с позиции pos"""
+    for match in _TOKEN_PATTERN.finditer(sql, pos):
+        yield Token(match.lastgroup, match.start(), match.end())
+
+def tokenize(sql: str) -> List[Token]:
+    """Разбивает SQL на токены (один проход по тексту)"""
+    return list(iter_tokens(sql))
+
+def is_code(token: Token) -> bool:
+    """Значимый токен - не пробелы и не комментарий"""
+    return token.kind != WS and token.kind != COMMENT
+
+# ==================== Разбор по токенам ====================
+
+def split_statements(sql: str, tokens: List[Token]) -> List[Statement]:
+    """Делит поток токенов на выражения по ';' вне скобок, строк и комментариев.
+
+    Выражение включает предшествующие комментарии и завершающую ';',
+    пробелы по краям не входят в диапазон.
+    """
+    statements = []
+    depth = 0
+    first: Optional[int] = None
+
+    for index, token in enumerate(tokens):
+        kind = token.kind
+        if kind == WS:
+            continue
+        if first is None:
+            first = index
+
+        if kind == PUNCT:
+            char = sql[token.start]
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth = max(depth - 1, 0)
+            elif char == ';' and depth == 0:
+                statements.append(Statement(tokens[first].start, token.end, first, index + 1))
+                first = None
+
+    if first is not None:
+        last = len(tokens)
+        while last > first and tokens[last - 1].kind == WS:
+            last -= 1
+        statements.append(Statement(tokens[first].start, tokens[last - 1].end, first, last))
+
+    return statements
+
+def split_top_level(sql: str, tokens: List[Token], separator: str = ',',
+                    first: int = 0, last: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Делит диапазон токенов по разделителю на нулевой глубине скобок.
+
+    Возвращает диапазоны символов частей (без пробелов по краям).
+    """
+    if last is None:
+        last = len(tokens)
+
+    parts = []
+    depth = 0
+    part_start: Optional[int] = None
+    part_end = 0
+
+    for token in tokens[first:last]:
+        if token.kind == WS:
+            continue
+        if token.kind == PUNCT:
+            char = sql[token.start]
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            elif char == separator and depth == 0:
+                if part_start is not None:
+                    parts.append((part_start, part_end))
+                part_start = None
+                continue
+        if part_start is None:
+            part_start = token.start
+        part_end = token.end
+
+    if part_start is not None:
+        parts.append((part_start, part_end))
+
+    return parts
+
+def code_words(sql: str, tokens: List[Token], first: int = 0, last: Optional[int] = None) -> List[str]:
+    """Слова (ключевые слова и идентификаторы) в верхнем регистре, без строк и комментариев"""
+    if last is None:
+        last = len(tokens)
+    return [sql[t.start:t.end].upper() for t in tokens[first:last] if t.kind == WORD]
+
+def normalize_statement(sql: str, tokens: List[Token], first: int = 0, last: Optional[int] = None) -> str:
+    """Текст выражения без различий в пробелах - для ключей мемоизации.
+
+    Пробелы между токенами сводятся к одному, строки и комментарии
+    сохраняются как есть; после однострочного комментария остаётся перевод строки.
+    """
+    if last is None:
+        last = len(tokens)
+    parts = []
+    for token in tokens[first:last]:
+        if token.kind == WS:
+            continue
+        text = sql[token.start:token.end]
+        parts.append(text + '\n' if token.kind == COMMENT and text.startswith('--') else text)
+    return ' '.join(parts)
+
+def statement_ends(sql: str) -> List[int]:
+    """Концы выражений - те же, что у split_statements, но без списка токенов.
+
+    Используется упрощённый шаблон потокового разбиения: значимы только
+    строки, комментарии и ( ) ;, остальной текст проходит длинными отрезками.
+    """
+    ends = []
+    depth = 0
+    pending_end: Optional[int] = None   # конец последнего значимого текста после ';'
+
+    for match in _SPLIT_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind == WS:
+            continue
+        if kind == PUNCT:
+            char = sql[match.start()]
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth = max(depth - 1, 0)
+            elif depth == 0:
+                ends.append(match.end())
+                pending_end = None
+                continue
+        pending_end = match.end()
+
+    if pending_end is not None:
+        ends.append(pending_end)
+    return ends
+
+def statement_spans(sql: str) -> List[Tuple[int, int]]:
+    """Диапазоны выражений - те же, что у split_statements, но без списка токенов"""
+    spans = []
+    start = 0
+    for end in statement_ends(sql):
+        start = _LEADING_SPACE.match(sql, start).end()
+        spans.append((start, end))
+        start = end
+    return spans
+
+def line_starts(sql: str) -> List[int]:
+    """Позиции начала строк - для перевода смещений в номера строк через bisect"""
+    starts = [0]
+    position = sql.find('\n')
+    while position != -1:
+        starts.append(position + 1)
+        position = sql.find('\n', position + 1)
+    return starts
+
+# ==================== Потоковое разбиение ====================
+
+def iter_statements_from_file(source: IO[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[str, int, int]]:
+    """Потоково делит SQL из файла на выражения: (текст, начало, конец).
+
+    Смещения - позиции символов от начала потока. В памяти держится
+    только текущее незавершённое выражение и прочитанный блок; если
+    выражение больше блока, размер чтения растёт вдвое, поэтому общее
+    время остаётся линейным.
+    """
+    buffer = ''
+    buffer_offset = 0      # позиция buffer[0] в потоке
+    scan_pos = 0           # откуда продолжать разбор токенов
+    stmt_start: Optional[int] = None
+    stmt_end = 0           # конец последнего значимого токена выражения
+    depth = 0
+    read_size = chunk_size
+    eof = False
+
+    while not eof:
+        chunk = source.read(read_size)
+        eof = not chunk
+        buffer += chunk
+        buffer_length = len(buffer)
+        resume_at = buffer_length
+
+        for match in _SPLIT_PATTERN.finditer(buffer, scan_pos):
+            # Токен у конца буфера может продолжиться в следующем блоке
+            if not eof and match.end() == buffer_length:
+                resume_at = match.start()
+                break
+
+            kind = match.lastgroup
+            if kind == WS:
+                continue
+            if stmt_start is None:
+                stmt_start = match.start()
+            stmt_end = match.end()
+
+            if kind == PUNCT:
+                char = buffer[match.start()]
+                if char == '(':
+                    depth += 1
+                elif char == ')':
+                    depth = max(depth - 1, 0)
+                elif char == ';' and depth == 0:
+                    yield buffer[stmt_start:stmt_end], buffer_offset + stmt_start, buffer_offset + stmt_end
+                    stmt_start = None
+
+        if eof:
+            break
+
+        # Отбрасываем обработанную часть буфера
+        cut = min(stmt_start, resume_at) if stmt_start is not None else resume_at
+        buffer = buffer[cut:]
+        buffer_offset += cut
+        scan_pos = resume_at - cut
+        if stmt_start is not None:
+            stmt_start -= cut
+            stmt_end -= cut
+
+        read_size = max(chunk_size, len(buffer))
+
+    if stmt_start is not None:
+        yield buffer[stmt_start:stmt_end], buffer_offset + stmt_start, buffer_offset + stmt_end
+
+class MappedTextReader:
+    """Текстовое чтение файла через mmap с пошаговым декодированием.
+
+    Даёт read(size) для iter_statements_from_file: страницы файла
+    подгружаются ОС по мере чтения и отдаются обратно после обработки,
+    поэтому RSS не растёт с размером файла. Многобайтовый символ на
+    границе блоков декодер дочитывает сам.
+    """
+
+    def __init__(self, path: str, encoding: str = "utf-8-sig", errors: str = "strict"):
+        self._file = open(path, "rb")
+        self._position = 0
+        self._released = 0
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors)
+        try:
+            self._map: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл отобразить нельзя
+            self._map = None
+        if self._map is not None and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self.size = len(self._map) if self._map is not None else 0
+
+    def read(self, size: int = DEFAULT_CHUNK_SIZE) -> str:
+        """До size байт исходного файла в виде текста; '' - конец файла"""
+        while self._position < self.size:
+            chunk = self._map[self._position:self._position + size]
+            self._position += len(chunk)
+            self._release_pages()
+            text = self._decoder.decode(chunk, final=self._position >= self.size)
+            if text:
+                return text
+        return self._decoder.decode(b"", final=True)
+
+    def _release_pages(self) -> None:
+        if self._position - self._released < MAPPED_RELEASE_BYTES or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        # Границы madvise должны быть выровнены по странице
+        end = self._position - self._position % mmap.PAGESIZE
+        self._map.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+        self._released = end
+
+    @property
+    def position(self) -> int:
+        """Сколько байт файла уже прочитано"""
+        return self._position
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "MappedTextReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,7 @@
+# ==================== ИМПОРТЫ ====================
+
+import os
+import sys
+
+# Модули скриптов импортируют друг друга напрямую (запуск из scripts/sqlglot)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,99 @@
+# ==================== ИМПОРТЫ ====================
+
+import io
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from bulk_export import export_bulk_load
+
+# ==================== Порядок загрузки ====================
+
+def load_lines(output_dir, prefix):
+    with open(os.path.join(output_dir, "load.sql"), encoding="utf-8") as script:
+        return [line for line in script.read().splitlines() if line.startswith(prefix)]
+
+def test_files_follow_plan_order_of_their_use_database(tmp_path):
+    # В базе b те же имена стоят глубже в графе - порядок файлов задаёт база a
+    dump = "\n".join([
+        "USE a;",
+        "CREATE TABLE x (id INT PRIMARY KEY, y_id INT, FOREIGN KEY (y_id) REFERENCES y(id));",
+        "CREATE TABLE y (id INT PRIMARY KEY);",
+        "INSERT INTO x VALUES (1, 1);",
+        "INSERT INTO y VALUES (1);",
+        "USE b;",
+        "CREATE TABLE y (id INT PRIMARY KEY, x_id INT, FOREIGN KEY (x_id) REFERENCES x(id));",
+        "CREATE TABLE x (id INT PRIMARY KEY, z_id INT, FOREIGN KEY (z_id) REFERENCES z(id));",
+        "CREATE TABLE z (id INT PRIMARY KEY);",
+    ])
+    result = export_bulk_load(io.StringIO(dump), str(tmp_path), "postgres", defer_constraints=True)
+    assert result["load_plan"]["cycles"] == []
+    assert result["load_plan"]["load_levels"] == [["a.y", "b.z"], ["a.x", "b.x"], ["b.y"]]
+    assert load_lines(str(tmp_path), "\\copy") == [
+        "\\copy y FROM 'y.csv' WITH (FORMAT csv)",
+        "\\copy x FROM 'x.csv' WITH (FORMAT csv)",
+    ]
+
+# ==================== SQL-файлы данных ====================
+
+# INSERT users с "dq" не проходит быстрый путь и попадает в SQL-файл данных
+USERS = [
+    "CREATE TABLE `users` (`id` int NOT NULL, `name` varchar(20), PRIMARY KEY (`id`));",
+    "INSERT INTO `users` VALUES (1,\"dq\"),(2,'b');",
+]
+ORDERS = [
+    "CREATE TABLE `orders` (`id` int NOT NULL, `user_id` int, PRIMARY KEY (`id`), "
+    "FOREIGN KEY (`user_id`) REFERENCES `users`(`id`));",
+    "INSERT INTO `orders` VALUES (10,1),(11,2);",
+]
+
+def export_dump(statements, output_dir, to_dialect, **options):
+    return export_bulk_load(io.StringIO("\n".join(statements)), str(output_dir), to_dialect, **options)
+
+@pytest.mark.parametrize("to_dialect", ["postgres", "redshift", "snowflake", "bigquery", "sqlite"])
+def test_data_file_runs_right_after_its_table(tmp_path, to_dialect):
+    result = export_dump(USERS + ORDERS + ["UPDATE t SET a = 1;"], tmp_path, to_dialect)
+    assert result["data_files"] == ["users.data.sql", "t.data.sql"]
+    with open(os.path.join(str(tmp_path), result["load_script"]), encoding="utf-8") as script:
+        text = script.read()
+    assert text.index("users.data.sql") < text.index("orders.csv") < text.index("t.data.sql")
+
+def test_plan_order_puts_parent_data_before_child_files(tmp_path):
+    result = export_dump(ORDERS + USERS, tmp_path, "postgres", defer_constraints=True)
+    assert load_lines(str(tmp_path), "\\") == [
+        "\\i schema.sql",
+        "\\i users.data.sql",
+        "\\copy \"orders\" FROM 'orders.csv' WITH (FORMAT csv)",
+        "\\i constraints.sql",
+    ]
+    assert result["tables"] == {"orders.csv": {"table": "orders", "rows": 2}}
+
+def test_statement_with_unknown_table_runs_after_all_files(tmp_path):
+    result = export_dump(["DELETE t1, t2 FROM t1 JOIN t2;"], tmp_path, "postgres")
+    assert result["data_files"] == ["data.sql"]
+    with pytest.raises(ValueError, match="before INSERT rows of orders"):
+        export_dump(["DELETE t1, t2 FROM t1 JOIN t2;"] + ORDERS, tmp_path / "again", "postgres")
+
+@pytest.mark.skipif(shutil.which("sqlite3") is None, reason="нужен sqlite3")
+@pytest.mark.parametrize("statements, defer_constraints", [(USERS + ORDERS, False), (ORDERS + USERS, True)])
+def test_sqlite_load_script_loads_every_row(tmp_path, statements, defer_constraints):
+    export_dump(statements, tmp_path, "sqlite", defer_constraints=defer_constraints)
+    database = str(tmp_path / "target.db")
+    with open(os.path.join(str(tmp_path), "load.sql"), encoding="utf-8") as script:
+        loaded = subprocess.run(["sqlite3", database], stdin=script, cwd=str(tmp_path),
+                                capture_output=True, text=True, timeout=60)
+    # .bail on не останавливается на ошибках строк .import - проверяем и stderr, и число строк
+    assert loaded.returncode == 0 and loaded.stderr == "", loaded.stderr
+    counts = subprocess.run(["sqlite3", database, "SELECT COUNT(*) FROM users; SELECT COUNT(*) FROM orders;"],
+                            capture_output=True, text=True, timeout=60)
+    assert counts.stdout.split() == ["2", "2"]
+
+# ==================== Скрипты загрузки ====================
+
+def test_snowflake_put_uses_absolute_paths_for_relative_output_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    export_bulk_load(io.StringIO("INSERT INTO t VALUES (1);"), "out", "snowflake")
+    puts = load_lines("out", "PUT")
+    assert puts == [f"PUT 'file://{(tmp_path / 'out' / 't.csv').as_posix()}' @<stage> AUTO_COMPRESS = TRUE;"]
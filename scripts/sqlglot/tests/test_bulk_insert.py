@@ -0,0 +1,100 @@
+# ==================== ИМПОРТЫ ====================
+
+import sqlite3
+
+import pytest
+
+import bulk_insert
+from bulk_insert import (convert_bulk_insert, decode_mysql_string, iter_bulk_insert, iter_row_values,
+                         match_bulk_insert, prepare_bulk_insert)
+
+# ==================== Данные ====================
+
+# Строки с удвоенной кавычкой, \' , \\ , \n, \% и \0; hex двух видов, TRUE/FALSE, экспонента
+SOURCE = ("INSERT INTO `t` (`a`, `b`, `c`, `d`) VALUES "
+          "('it''s', 'a\\'b', 'back\\\\slash\\n', NULL),(TRUE, 0xABC, X'0F', -1.5e3),  "
+          "('50\\%', '', FALSE, 'x\\0y');")
+
+ROW_VALUES = [
+    ["it's", "a'b", "back\\slash\n", None],
+    [1, b"\x0a\xbc", b"\x0f", -1500.0],
+    ["50\\%", "", 0, "x\0y"],
+]
+
+# Значения VALUES в целевом диалекте (заголовок проверяется отдельно)
+EXPECTED_VALUES = {
+    "mysql": SOURCE[SOURCE.index(" VALUES ") + 8:].replace("),  (", "), ("),
+    "postgres": ("('it''s', 'a''b', 'back\\slash\n', NULL),(TRUE, decode('0ABC', 'hex'), decode('0F', 'hex'), -1.5e3), "
+                 "('50\\%', '', FALSE, 'x\0y');"),
+    "sqlite": ("('it''s', 'a''b', 'back\\slash\n', NULL),(TRUE, X'0ABC', X'0F', -1.5e3), "
+               "('50\\%', '', FALSE, 'x\0y');"),
+    "oracle": ("('it''s', 'a''b', 'back\\slash\n', NULL),(1, HEXTORAW('0ABC'), HEXTORAW('0F'), -1.5e3), "
+               "('50\\%', '', 0, 'x\0y');"),
+    "mssql": ("('it''s', 'a''b', 'back\\slash\n', NULL),(1, 0x0ABC, 0x0F, -1.5e3), "
+              "('50\\%', '', 0, 'x\0y');"),
+    "redshift": ("('it''s', 'a''b', 'back\\slash\n', NULL),(TRUE, FROM_HEX('0ABC'), FROM_HEX('0F'), -1.5e3), "
+                 "('50\\%', '', FALSE, 'x\0y');"),
+    "snowflake": ("('it''s', 'a\\'b', 'back\\\\slash\\n', NULL),"
+                  "(TRUE, TO_BINARY('0ABC', 'HEX'), TO_BINARY('0F', 'HEX'), -1.5e3), "
+                  "('50\\\\%', '', FALSE, 'x\\0y');"),
+    "bigquery": ("('it\\'s', 'a\\'b', 'back\\\\slash\\n', NULL),(TRUE, FROM_HEX('0ABC'), FROM_HEX('0F'), -1.5e3), "
+                 "('50\\\\%', '', FALSE, 'x\\x00y');"),
+}
+
+# ==================== Литералы по диалектам ====================
+
+@pytest.mark.parametrize("dialect", sorted(EXPECTED_VALUES))
+def test_literal_escaping_per_dialect(dialect):
+    header_end = match_bulk_insert(SOURCE)
+    assert header_end is not None
+    converted = convert_bulk_insert(SOURCE, header_end, dialect)
+    _, values = converted.split(" VALUES ", 1)
+    assert values == EXPECTED_VALUES[dialect]
+
+def test_sqlite_loads_the_same_values():
+    # sqlite3 не принимает текст запроса с символом \0
+    source = SOURCE.replace("'x\\0y'", "'x\\ty'")
+    converted = convert_bulk_insert(source, match_bulk_insert(source), "sqlite")
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE t (a, b, c, d)")
+    connection.execute(converted)
+    expected = ROW_VALUES[:2] + [ROW_VALUES[2][:3] + ["x\ty"]]
+    assert [list(row) for row in connection.execute("SELECT a, b, c, d FROM t ORDER BY rowid")] == expected
+
+def test_decode_mysql_string():
+    assert decode_mysql_string("'a\\'b''c\\\\d\\n\\%\\Z'") == "a'b'c\\d\n\\%\x1a"
+
+def test_header_gets_dialect_rules_and_values_keyword():
+    sql = "INSERT INTO `t` (`a`) VALUE (1);"
+    assert convert_bulk_insert(sql, match_bulk_insert(sql), "postgres") == 'INSERT INTO "t" ("a") VALUES (1);'
+
+# ==================== Распознавание ====================
+
+@pytest.mark.parametrize("sql", [
+    "INSERT INTO t VALUES (1, NOW());",
+    "INSERT INTO t SELECT * FROM u;",
+    "INSERT INTO t VALUES (1, @v);",
+    "UPDATE t SET a = 1;",
+])
+def test_non_literal_inserts_are_not_bulk(sql):
+    assert match_bulk_insert(sql) is None
+    assert prepare_bulk_insert(sql) is None
+
+def test_iter_row_values_and_error_offset():
+    sql = "INSERT INTO t VALUES (1, 'a,b'), (-2.5, NULL);"
+    header_end = match_bulk_insert(sql)
+    assert list(iter_row_values(sql, header_end)) == [["1", "'a,b'"], ["-2.5", "NULL"]]
+    broken = "INSERT INTO t VALUES (1, 'a'), (2, b);"
+    with pytest.raises(ValueError):
+        list(iter_row_values(broken, broken.index(" (")))
+
+# ==================== Потоковая выдача ====================
+
+def test_iter_bulk_insert_blocks_join_to_convert(monkeypatch):
+    monkeypatch.setattr(bulk_insert, "_JOIN_BLOCK_PARTS", 4)
+    sql = "INSERT INTO t (a, b) VALUES " + ", ".join(f"({i}, 'it\\'s {i}', TRUE)" for i in range(50)) + ";"
+    header_end = match_bulk_insert(sql)
+    blocks = list(iter_bulk_insert(sql, header_end, "mssql"))
+    assert len(blocks) > 10
+    assert ''.join(blocks) == convert_bulk_insert(sql, header_end, "mssql")
+    assert blocks[0] == "INSERT INTO t (a, b) VALUES"
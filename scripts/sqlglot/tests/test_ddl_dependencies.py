@@ -0,0 +1,115 @@
+# ==================== ИМПОРТЫ ====================
+
+import re
+
+from ddl_dependencies import DEFERRED_COMMENT, load_plan_report, plan_schema_load
+
+# ==================== Данные ====================
+
+# orders <-> invoices - цикл (ссылка в колонке и на уровне таблицы), две части скрипта по USE
+SCRIPT = [
+    "USE shop;",
+    "DROP TABLE IF EXISTS orders;",
+    "CREATE TABLE orders (id INT PRIMARY KEY, customer_id INT REFERENCES customers(id), "
+    "KEY idx_c (customer_id), FOREIGN KEY (id) REFERENCES invoices(order_id));",
+    "CREATE TABLE customers (id INT PRIMARY KEY, name VARCHAR(10));",
+    "CREATE TABLE invoices (order_id INT PRIMARY KEY, "
+    "CONSTRAINT fk_o FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE);",
+    "INSERT INTO customers VALUES (1, 'a');",
+    "CREATE INDEX idx_name ON customers (name);",
+    "USE audit;",
+    "CREATE TABLE log (id INT, customer_id INT, FOREIGN KEY (customer_id) REFERENCES shop.customers(id));",
+    "ALTER TABLE log ADD FOREIGN KEY (id) REFERENCES log(id);",
+]
+
+_FOREIGN_KEY = re.compile(r"\b(?:REFERENCES|FOREIGN\s+KEY)\b", re.IGNORECASE)
+
+def created_table(stmt):
+    match = re.match(r"CREATE TABLE (\w+)", stmt)
+    return match.group(1) if match else None
+
+# ==================== Циклы внешних ключей ====================
+
+def test_cycle_is_reported_and_broken_by_deferred_foreign_keys():
+    plan = plan_schema_load(SCRIPT, "postgres")
+    assert plan.cycles == [["shop.orders", "shop.invoices"]]
+    assert plan.order.index("shop.customers") < plan.order.index("shop.orders")
+
+    main, deferred = plan.segments[0]
+    creates = [stmt for stmt in main if stmt.startswith("CREATE TABLE")]
+    assert [created_table(stmt) for stmt in creates] == ["customers", "orders", "invoices"]
+    assert not any(_FOREIGN_KEY.search(stmt) for stmt in creates)
+    assert deferred[0].startswith(DEFERRED_COMMENT + "\n")
+    assert [stmt.replace(DEFERRED_COMMENT + "\n", "") for stmt in deferred] == [
+        "CREATE INDEX idx_name ON customers (name);",
+        "CREATE INDEX `idx_c` ON orders (customer_id);",
+        "ALTER TABLE orders ADD FOREIGN KEY (customer_id) REFERENCES customers(id);",
+        "ALTER TABLE orders ADD FOREIGN KEY (id) REFERENCES invoices(order_id);",
+        "ALTER TABLE invoices ADD CONSTRAINT fk_o FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE;",
+    ]
+
+def test_data_and_drop_keep_their_place_relative_to_creates():
+    main, _ = plan_schema_load(SCRIPT, "postgres").segments[0]
+    assert main[:2] == ["USE shop;", "DROP TABLE IF EXISTS orders;"]
+    assert main[-1] == "INSERT INTO customers VALUES (1, 'a');"
+
+def test_report_counts():
+    assert load_plan_report(plan_schema_load(SCRIPT, "postgres")) == {
+        "order": ["shop.customers", "shop.orders", "shop.invoices", "audit.log"],
+        "load_levels": [["shop.customers"], ["shop.orders", "shop.invoices", "audit.log"]],
+        "cycles": [["shop.orders", "shop.invoices"]],
+        "deferred_indexes": 2,
+        "deferred_foreign_keys": 5,
+        "dropped_indexes": 0,
+    }
+
+# ==================== Части скрипта по USE ====================
+
+def test_use_segments_are_planned_separately():
+    plan = plan_schema_load(SCRIPT, "postgres")
+    assert len(plan.segments) == 2
+    main, deferred = plan.segments[1]
+    assert main == ["USE audit;", "CREATE TABLE log (id INT, customer_id INT);"]
+    assert [stmt.replace(DEFERRED_COMMENT + "\n", "") for stmt in deferred] == [
+        "ALTER TABLE log ADD FOREIGN KEY (id) REFERENCES log(id);",
+        "ALTER TABLE log ADD FOREIGN KEY (customer_id) REFERENCES shop.customers(id);",
+    ]
+    # Отложенные выражения первой части выполняются до переключения базы
+    statements = plan.statements
+    assert statements.index("USE audit;") > max(
+        index for index, stmt in enumerate(statements) if "REFERENCES invoices" in stmt)
+
+def test_same_table_names_in_different_databases_are_separate():
+    plan = plan_schema_load([
+        "USE a;",
+        "CREATE TABLE x (id INT, y_id INT REFERENCES y(id));",
+        "CREATE TABLE y (id INT PRIMARY KEY);",
+        "USE b;",
+        "CREATE TABLE y (id INT PRIMARY KEY, x_id INT REFERENCES x(id));",
+        "CREATE TABLE x (id INT PRIMARY KEY);",
+    ], "sqlite")
+    assert plan.cycles == []
+    assert plan.levels == [["a.y", "b.x"], ["a.x", "b.y"]]
+    assert [created_table(stmt) for stmt in plan.segments[0][0] if stmt.startswith("CREATE")] == ["y", "x"]
+    assert [created_table(stmt) for stmt in plan.segments[1][0] if stmt.startswith("CREATE")] == ["x", "y"]
+
+def test_script_without_use_is_one_segment():
+    plan = plan_schema_load(SCRIPT[1:7], "postgres")
+    assert plan.order == ["customers", "orders", "invoices"]
+    assert len(plan.segments) == 1
+    assert plan.statements[0] == "DROP TABLE IF EXISTS orders;"
+    assert plan.deferred_foreign_keys == 3
+
+# ==================== Профили диалектов ====================
+
+def test_inline_foreign_key_dialect_keeps_references():
+    plan = plan_schema_load(SCRIPT, "sqlite")
+    assert plan.deferred_foreign_keys == 0
+    assert plan.cycles == [["shop.orders", "shop.invoices"]]
+    creates = [stmt for stmt in plan.statements if stmt.startswith("CREATE TABLE orders")]
+    assert len(creates) == 1 and "REFERENCES customers(id)" in creates[0]
+
+def test_dialect_without_indexes_drops_them():
+    plan = plan_schema_load(SCRIPT, "bigquery")
+    assert (plan.deferred_indexes, plan.dropped_indexes) == (0, 2)
+    assert not any("CREATE INDEX" in stmt for stmt in plan.statements)
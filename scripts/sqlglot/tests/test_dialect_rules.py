@@ -0,0 +1,96 @@
+# ==================== ИМПОРТЫ ====================
+
+import re
+import threading
+
+import pytest
+
+from dialect_rules import (DIALECT_RULES, LAYOUT_COMPACT, LAYOUT_SQLGLOT, LAYOUT_TIDY, NUMERIC_FORMAT_RULES,
+                           SQLGLOT_POST_RULES, CompiledRuleSet, Rule, get_rule_set)
+
+# ==================== Эталон: правила по одному ====================
+
+def apply_one_by_one(rules, sql):
+    """Прежняя схема: отдельный re.sub на каждое правило, по порядку"""
+    for rule in rules:
+        sql = re.sub(rule.pattern, rule.replacement, sql, flags=re.IGNORECASE if rule.ignore_case else 0)
+    return sql
+
+# Прежний порядок этапов: сначала форматирование, затем правила диалекта
+LEGACY_ORDER = {
+    "compact": lambda dialect: LAYOUT_COMPACT + DIALECT_RULES.get(dialect, []),
+    "simple": lambda dialect: LAYOUT_TIDY + DIALECT_RULES.get(dialect, []),
+    "sqlglot_post": lambda dialect: LAYOUT_SQLGLOT + SQLGLOT_POST_RULES.get(dialect, []) + NUMERIC_FORMAT_RULES,
+}
+
+# Типичные выражения без строк и комментариев, где прежняя схема не портила данные
+STATEMENTS = [
+    "CREATE TABLE `users` (\n  `id` INT PRIMARY KEY AUTO_INCREMENT,\n  name VARCHAR(100) NOT NULL,\n"
+    "  price DECIMAL(10, 2),\n  created DATETIME,\n  updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP\n);",
+    "SELECT  a,   b FROM `t`   WHERE x = 1;;",
+    "INSERT INTO t (a, b) VALUES (1, 2);",
+    "CREATE TABLE o (id INT, status ENUM(1, 2), total NUMERIC(12, 4), amount NUMBER(8, 2));",
+    "ALTER TABLE o ADD COLUMN flag INT;",
+    # Ключевые слова через несколько пробелов и переводы строк
+    "CREATE TABLE e (\n  id INT PRIMARY   KEY\n  AUTO_INCREMENT,\n  created TIMESTAMP DEFAULT   CURRENT_TIMESTAMP,\n"
+    "  updated TIMESTAMP DEFAULT\nCURRENT_TIMESTAMP ON   UPDATE\n  CURRENT_TIMESTAMP,\n"
+    "  uid INT,\n  FOREIGN   KEY (uid) REFERENCES users(id) ON\n  DELETE CASCADE\n);",
+    "CREATE TABLE f (FOREIGN\n KEY (uid) REFERENCES users(id), id INT);",
+]
+
+DIALECTS = sorted(set(DIALECT_RULES) | {"mysql"})
+
+@pytest.mark.parametrize("stage", sorted(LEGACY_ORDER))
+@pytest.mark.parametrize("dialect", DIALECTS)
+def test_compiled_rule_set_matches_one_by_one(stage, dialect):
+    rule_set = get_rule_set(stage, dialect)
+    legacy_rules = LEGACY_ORDER[stage](dialect)
+    for sql in STATEMENTS:
+        assert rule_set.apply(sql) == apply_one_by_one(legacy_rules, sql), sql
+
+# ==================== Строки и комментарии ====================
+
+@pytest.mark.parametrize("dialect", DIALECTS)
+def test_strings_and_comments_are_not_rewritten(dialect):
+    rule_set = get_rule_set("simple", dialect)
+    sql = "SELECT 'INT  AUTO_INCREMENT', x -- DATETIME  INT\nFROM t /* `quoted`  INT */;"
+    result = rule_set.apply(sql)
+    assert "'INT  AUTO_INCREMENT'" in result
+    assert "-- DATETIME  INT\n" in result
+    assert "/* `quoted`  INT */" in result
+
+def test_first_rule_wins_at_the_same_position():
+    rule_set = CompiledRuleSet("test", [Rule("long", r"\bAB\b", "x"), Rule("short", r"\bA", "y")])
+    assert rule_set.apply("AB A") == "x y"
+
+def test_collect_edits_matches_apply():
+    rule_set = get_rule_set("simple", "postgres")
+    sql = STATEMENTS[0]
+    edits = []
+    rule_set.collect_edits(sql, 0, len(sql), edits)
+    rebuilt, position = [], 0
+    for start, end, replacement in edits:
+        rebuilt.append(sql[position:start])
+        rebuilt.append(replacement)
+        position = end
+    rebuilt.append(sql[position:])
+    assert ''.join(rebuilt) == rule_set.apply(sql)
+
+# ==================== Счётчики срабатываний ====================
+
+def test_hit_counters_are_exact_under_threads():
+    rule_set = CompiledRuleSet("threads", [Rule("int", r"\bINT\b", "INTEGER")])
+    sql = "a INT, b INT"
+
+    def work():
+        for _ in range(500):
+            rule_set.apply(sql)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert rule_set.hit_counts() == {"int": 8 * 500 * 2}
+    rule_set.reset_hits()
+    assert rule_set.hit_counts() == {"int": 0}
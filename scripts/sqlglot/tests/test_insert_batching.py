@@ -0,0 +1,89 @@
+# ==================== ИМПОРТЫ ====================
+
+import sqlite3
+
+import pytest
+
+from insert_batching import BATCH_LIMITS, BatchOptions, InsertBatcher, batch_statements, split_insert_rows
+
+# ==================== Данные ====================
+
+def inserts(count, per_statement, table="t", text="v"):
+    """INSERT по per_statement строк; значения - номер строки и текст"""
+    statements = []
+    for start in range(0, count, per_statement):
+        rows = ", ".join(f"({i}, '{text}''{i}')" for i in range(start, min(start + per_statement, count)))
+        statements.append(f"INSERT INTO {table} (id, name) VALUES {rows};")
+    return statements
+
+def batch_rows(batch, dialect):
+    parsed = split_insert_rows(batch, dialect)
+    assert parsed is not None, batch
+    return parsed[2]
+
+# ==================== Лимиты ====================
+
+@pytest.mark.parametrize("dialect", ["mssql", "sqlite", "oracle"])
+def test_row_limit_of_dialect(dialect):
+    limit = BATCH_LIMITS[dialect].max_rows
+    statements = inserts(limit * 2 + 7, 100)
+    batches, stats = batch_statements(statements, dialect, BatchOptions())
+    if dialect == "oracle":
+        counts = [batch.count(" VALUES ") for batch in batches]
+        assert all(batch.startswith("INSERT ALL\n") for batch in batches)
+    else:
+        counts = [len(batch_rows(batch, dialect)) for batch in batches]
+    assert counts == [limit, limit, 7]
+    assert stats == {"inserts": len(statements), "rows": limit * 2 + 7, "batches": 3, "transactions": 0}
+
+def test_explicit_row_limit_overrides_dialect():
+    batches, _ = batch_statements(inserts(25, 4), "postgres", BatchOptions(max_rows=10))
+    assert [len(batch_rows(batch, "postgres")) for batch in batches] == [10, 10, 5]
+
+@pytest.mark.parametrize("dialect", ["postgres", "oracle"])
+def test_byte_limit_is_never_exceeded(dialect):
+    max_bytes = 300
+    statements = inserts(200, 13, text="значение")
+    batches, stats = batch_statements(statements, dialect, BatchOptions(max_bytes=max_bytes))
+    assert stats["rows"] == 200
+    assert len(batches) > 1
+    for batch in batches:
+        assert len(batch.encode("utf-8")) <= max_bytes
+
+def test_row_larger_than_limit_gets_its_own_batch():
+    big = "INSERT INTO t (id, name) VALUES (1, '" + "x" * 500 + "');"
+    statements = inserts(3, 3) + [big] + inserts(2, 2)
+    batches, _ = batch_statements(statements, "postgres", BatchOptions(max_bytes=200))
+    assert [len(batch_rows(batch, "postgres")) for batch in batches] == [3, 1, 2]
+
+# ==================== Порядок и границы пачек ====================
+
+def test_other_statements_and_tables_close_the_batch():
+    statements = (inserts(3, 1) + ["UPDATE t SET name = 'x';"] + inserts(2, 1)
+                  + inserts(2, 1, table="u") + ["-- dump\nINSERT INTO u (id, name) VALUES (9, 'z');"])
+    batches, stats = batch_statements(statements, "postgres", BatchOptions())
+    assert [batch.split(" VALUES")[0].split("\n")[-1] for batch in batches] == [
+        "INSERT INTO t (id, name)", "UPDATE t SET name = 'x';", "INSERT INTO t (id, name)",
+        "INSERT INTO u (id, name)", "INSERT INTO u (id, name)",
+    ]
+    assert batches[-1].startswith("-- dump\n")
+    assert stats["batches"] == 4
+
+def test_transactions_wrap_batches():
+    batcher = InsertBatcher("postgres", BatchOptions(max_rows=2, transaction_rows=4))
+    output = []
+    for statement in inserts(6, 1) + ["SELECT 1;"]:
+        output.extend(batcher.feed(statement))
+    output.extend(batcher.finish())
+    kinds = ["rows" if text.startswith("INSERT") else text for text in output]
+    assert kinds == ["BEGIN;", "rows", "rows", "COMMIT;", "BEGIN;", "rows", "COMMIT;", "SELECT 1;"]
+    assert batcher.stats["transactions"] == 2
+
+def test_batched_script_loads_the_same_rows_into_sqlite():
+    statements = inserts(1234, 17)
+    batches, _ = batch_statements(statements, "sqlite", BatchOptions(transaction_rows=600))
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    connection.execute("CREATE TABLE t (id INTEGER, name TEXT)")
+    connection.executescript("\n".join(batches))
+    rows = connection.execute("SELECT id, name FROM t ORDER BY rowid").fetchall()
+    assert rows == [(i, f"v'{i}") for i in range(1234)]
@@ -0,0 +1,80 @@
+# ==================== ИМПОРТЫ ====================
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from server import WORKER_RESTART_EXIT_CODE, parse_request_line, run_prefork_child
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py")
+
+# ==================== Разбор строки запроса ====================
+
+def test_parse_request_line_accepts_objects_only():
+    assert parse_request_line('{"id": 1}') == {"id": 1}
+    assert parse_request_line(b'{"id": 2}\n') == {"id": 2}
+    for line in ["[1]", '"text"', "3", "null"]:
+        with pytest.raises(ValueError, match="JSON object"):
+            parse_request_line(line)
+    with pytest.raises(ValueError):
+        parse_request_line("not json")
+
+# ==================== Воркер пула ====================
+
+def run_child(lines, max_requests=0):
+    """Запускает цикл воркера пула на каналах; (код выхода, ответы)"""
+    request_read, request_write = os.pipe()
+    response_read, response_write = os.pipe()
+    os.write(request_write, "".join(line + "\n" for line in lines).encode("utf-8"))
+    os.close(request_write)
+    code = run_prefork_child(request_read, response_write, max_requests, 0)
+    os.close(response_write)
+    with os.fdopen(response_read, "rb") as responses:
+        text = responses.read().decode("utf-8")
+    # Ответ на запрос завершается пустой строкой, элементы пачки - по строке
+    return code, [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def test_prefork_child_replies_to_bad_lines_and_keeps_serving():
+    code, responses = run_child([
+        "not json",
+        "[1]",
+        '{"id": 1, "engine": "unknown", "sql": "SELECT 1"}',
+        '{"id": 2, "sql": "SELECT 1"}',
+    ])
+    assert code == 0
+    assert [(response["id"], response["success"]) for response in responses] == [
+        (None, False), (None, False), (1, False), (2, True)]
+    assert "JSON object" in responses[1]["error"]
+    assert "Unknown engine" in responses[2]["error"]
+
+def test_prefork_child_exits_for_restart_after_max_requests():
+    code, responses = run_child(['{"id": 1, "sql": "SELECT 1"}', '{"id": 2, "sql": "SELECT 2"}'], max_requests=1)
+    assert code == WORKER_RESTART_EXIT_CODE
+    assert [response["id"] for response in responses] == [1]
+
+def test_prefork_child_streams_batch_items_before_the_summary():
+    _, responses = run_child(['{"id": "b", "action": "transpile_batch", "items": [{"sql": "SELECT 1"}, 5]}'])
+    assert [response.get("batch_id") for response in responses] == ["b", "b", None]
+    assert responses[1]["success"] is False
+    assert responses[2]["id"] == "b" and responses[2]["failed"] == 1
+
+# ==================== Супервизор ====================
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="prefork требует os.fork")
+def test_prefork_supervisor_survives_invalid_requests():
+    requests = ['[1]', 'not json', '"text"', '{"id": 1, "sql": "SELECT 1"}', '{"id": 2, "action": "shutdown"}']
+    completed = subprocess.run(
+        [sys.executable, SERVER, "--prefork", "2"], input="".join(line + "\n" for line in requests),
+        capture_output=True, text=True, timeout=60, cwd=os.path.dirname(SERVER)
+    )
+    assert completed.returncode == 0, completed.stderr
+    responses = [json.loads(line) for line in completed.stdout.splitlines() if line.strip()]
+    assert responses[0]["event"] == "ready"
+    errors = [response for response in responses[1:] if response.get("id") is None]
+    assert len(errors) == 3 and not any(response["success"] for response in errors)
+    by_id = {response["id"]: response for response in responses[1:] if response.get("id") is not None}
+    assert by_id[1]["success"] and by_id[1]["transpiled"] == ["SELECT 1"]
+    assert by_id[2]["shutdown"] is True
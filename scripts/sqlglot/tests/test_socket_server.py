@@ -0,0 +1,87 @@
+# ==================== ИМПОРТЫ ====================
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+from server import serve_connection
+from transpile_cache import LRUCache
+
+# ==================== Сокет-сервер ====================
+
+def exchange(lines, request_timeout=10.0, limit=64 * 1024):
+    """Отправляет строки на локальный сервер, читает ответы до закрытия соединения"""
+    async def scenario():
+        executor = ThreadPoolExecutor(max_workers=4)
+        semaphore = asyncio.Semaphore(4)
+        stop_event = asyncio.Event()
+
+        def on_connection(reader, writer):
+            return serve_connection(reader, writer, executor, semaphore, request_timeout, stop_event)
+
+        listener = await asyncio.start_server(on_connection, host="127.0.0.1", port=0, limit=limit)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write("".join(line + "\n" for line in lines).encode("utf-8"))
+            await writer.drain()
+            writer.write_eof()
+            data = await asyncio.wait_for(reader.read(), 30)
+            writer.close()
+        executor.shutdown(wait=True)
+        return [json.loads(line) for line in data.decode("utf-8").splitlines()], stop_event.is_set()
+
+    return asyncio.run(scenario())
+
+def test_socket_replies_to_invalid_lines_and_keeps_serving():
+    responses, stopped = exchange(["not json", "[1]", "", '{"id": 7, "sql": "SELECT 1"}'])
+    assert not stopped
+    assert [(response["id"], response["success"]) for response in responses] == [(None, False), (None, False), (7, True)]
+    assert "JSON object" in responses[1]["error"]
+
+def test_socket_rejects_too_long_line_and_closes():
+    responses, _ = exchange(['{"id": 1, "sql": "' + "x" * 2048 + '"}', '{"id": 2, "sql": "SELECT 1"}'], limit=1024)
+    assert responses == [{"id": None, "success": False, "error": "Request line too long"}]
+
+def test_socket_reports_timeout_and_handler_errors(monkeypatch):
+    def handle_request(input_data):
+        if input_data["id"] == "slow":
+            time.sleep(0.5)
+        if input_data["id"] == "boom":
+            raise RuntimeError("boom")
+        return {"success": True}
+
+    monkeypatch.setattr(server, "handle_request", handle_request)
+    responses, _ = exchange(['{"id": "slow"}', '{"id": "boom"}', '{"id": "ok"}'], request_timeout=0.1)
+    by_id = {response["id"]: response for response in responses}
+    assert by_id["slow"] == {"id": "slow", "success": False, "error": "Request timed out after 0.1 s"}
+    assert by_id["boom"] == {"id": "boom", "success": False, "error": "Server error: boom"}
+    assert by_id["ok"] == {"id": "ok", "success": True}
+
+def test_socket_shutdown_answers_and_sets_stop_event():
+    responses, stopped = exchange(['{"id": 3, "action": "shutdown"}', '{"id": 4, "sql": "SELECT 1"}'])
+    assert stopped
+    assert responses == [{"id": 3, "success": True, "shutdown": True}]
+
+# ==================== Кэш под потоками ====================
+
+def test_lru_cache_keeps_size_and_counters_consistent_under_threads():
+    cache = LRUCache(max_bytes=50 * 10)
+
+    def work(offset):
+        for i in range(2000):
+            key = (offset + i) % 120
+            if cache.get(key) is None:
+                cache.put(key, key, 10)
+
+    threads = [threading.Thread(target=work, args=(n * 7,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.hits + cache.misses == 8 * 2000
+    assert len(cache) <= 50
+    assert cache.current_bytes == 10 * len(cache)
@@ -0,0 +1,38 @@
+# ==================== ИМПОРТЫ ====================
+
+from hybrid_transpiler_demo import COMPLEX_SQL_EXAMPLE, detect_complex_features
+from sql_features import Feature, detect_features, detect_sql_features, is_complex
+from sql_lexer import split_statements, tokenize
+
+# ==================== Поиск подстрок и проход по токенам ====================
+
+# Выражения без строк и комментариев: оба детектора дают одни признаки
+STATEMENTS = [
+    "SELECT id, ROW_NUMBER() OVER (PARTITION BY dept ORDER BY salary) FROM employees;",
+    "WITH RECURSIVE t AS (SELECT 1) SELECT * FROM t;",
+    "WITH c AS (SELECT a FROM b) SELECT COUNT(a) FROM c;",
+    "SELECT dept, SUM(x) FROM t GROUP BY dept WITH ROLLUP;",
+    "SELECT CASE WHEN a > 1 THEN CONCAT(a, b) END FROM t WHERE x IN (SELECT y FROM z);",
+    "SELECT JSON_EXTRACT(doc, '$.a'), doc->>'b' FROM t;",
+    "SELECT YEAR(created), DATEDIFF(a, b) FROM t;",
+    "ALTER TABLE orders ADD FOREIGN KEY (uid) REFERENCES users(id);",
+    "CREATE TABLE t (id INT PRIMARY KEY, name VARCHAR(10));",
+]
+
+def test_substring_detector_matches_token_detector_on_plain_statements():
+    for sql in STATEMENTS:
+        assert detect_sql_features(sql) == detect_features(sql, tokenize(sql)), sql
+
+def test_token_detector_skips_strings_and_comments():
+    sql = "SELECT 'PIVOT ->' FROM t -- LIKE\n;"
+    assert detect_sql_features(sql) & (Feature.PIVOT | Feature.JSON_FUNCTIONS | Feature.STRING_FUNCTIONS)
+    assert detect_features(sql, tokenize(sql)) == Feature.NONE
+
+def test_complex_example_is_routed_to_sqlglot_by_both_detectors():
+    features = detect_complex_features(COMPLEX_SQL_EXAMPLE)
+    assert features["is_complex"] and features["has_cte"] and features["has_window_functions"]
+    tokens = tokenize(COMPLEX_SQL_EXAMPLE)
+    for span in split_statements(COMPLEX_SQL_EXAMPLE, tokens):
+        text = COMPLEX_SQL_EXAMPLE[span.start:span.end]
+        assert is_complex(detect_sql_features(text)) == is_complex(
+            detect_features(COMPLEX_SQL_EXAMPLE, tokens, span.first_token, span.last_token))
@@ -0,0 +1,80 @@
+# ==================== ИМПОРТЫ ====================
+
+import io
+import re
+
+import pytest
+
+import sql_lexer
+from sql_lexer import (compile_pattern, iter_statements_from_file, split_statements, statement_spans,
+                       strip_possessive, tokenize)
+
+# ==================== Данные ====================
+
+SCRIPT = """-- заголовок; не конец выражения
+CREATE TABLE t (id INT, name VARCHAR(10) DEFAULT ';');
+INSERT INTO t VALUES (1, 'a;b'), (2, 'it''s; ok'), (3, 'c\\';d');
+/* блочный ; комментарий */ SELECT (SELECT 1; ) AS x FROM t;
+SELECT `a;b`, "c;d" FROM t WHERE x = '(' ;
+SELECT 'незавершённое выражение без точки с запятой'
+"""
+
+# ==================== Разбиение на выражения ====================
+
+def split_texts(sql):
+    return [(sql[s.start:s.end], s.start, s.end) for s in split_statements(sql, tokenize(sql))]
+
+def test_split_statements_ignores_separators_in_strings_comments_and_parens():
+    texts = [text for text, _, _ in split_texts(SCRIPT)]
+    assert len(texts) == 5
+    assert texts[0].startswith("-- заголовок") and texts[0].endswith("';');")
+    assert texts[1].endswith("'c\\';d');")
+    assert texts[2].startswith("/* блочный") and texts[2].endswith("FROM t;")
+    assert texts[4] == "SELECT 'незавершённое выражение без точки с запятой'"
+
+def test_statement_spans_match_split_statements():
+    assert [(start, end) for _, start, end in split_texts(SCRIPT)] == statement_spans(SCRIPT)
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16, 61, 4096])
+def test_iter_statements_from_file_matches_full_split(chunk_size):
+    # Мелкие блоки режут строки, комментарии и скобки VALUES на границе чтения
+    streamed = list(iter_statements_from_file(io.StringIO(SCRIPT), chunk_size))
+    assert streamed == split_texts(SCRIPT)
+
+def test_statement_crossing_chunk_boundary_keeps_offsets():
+    head = "SELECT 1;\n"
+    long_statement = "INSERT INTO t VALUES " + ", ".join(f"({i}, 'v;{i}')" for i in range(200)) + ";"
+    sql = head + long_statement + "\nSELECT 2;"
+    streamed = list(iter_statements_from_file(io.StringIO(sql), 64))
+    assert [text for text, _, _ in streamed] == ["SELECT 1;", long_statement, "SELECT 2;"]
+    for text, start, end in streamed:
+        assert sql[start:end] == text
+
+def test_unterminated_string_at_end_of_stream():
+    sql = "SELECT 1; SELECT 'abc;"
+    assert [text for text, _, _ in iter_statements_from_file(io.StringIO(sql), 4)] == ["SELECT 1;", "SELECT 'abc;"]
+
+# ==================== Захватывающие квантификаторы ====================
+
+@pytest.mark.parametrize("pattern, expected", [
+    (r"a*+b++c?+", r"a*b+c?"),
+    (r"x{2,3}+y", r"x{2,3}y"),
+    (r"[*+]+\++", r"[*+]+\++"),
+    (r"[]*+]*+", r"[]*+]*"),
+    (r"(?:a|b)*+d", r"(?:a|b)*d"),
+    (r"a+b", r"a+b"),
+])
+def test_strip_possessive(pattern, expected):
+    assert strip_possessive(pattern) == expected
+
+def test_compile_pattern_without_possessive_support(monkeypatch):
+    monkeypatch.setattr(sql_lexer, "POSSESSIVE_QUANTIFIERS", False)
+    pattern = compile_pattern(r"'[^']*+'(?!')")
+    assert "*+" not in pattern.pattern
+    assert pattern.match("'abc'").group() == "'abc'"
+
+def test_split_pattern_matches_the_same_without_possessive_quantifiers():
+    # Шаблон для Python < 3.11 должен давать те же совпадения
+    greedy = re.compile(strip_possessive(sql_lexer._SPLIT_PATTERN.pattern))
+    expected = [(m.lastgroup, m.span()) for m in sql_lexer._SPLIT_PATTERN.finditer(SCRIPT)]
+    assert [(m.lastgroup, m.span()) for m in greedy.finditer(SCRIPT)] == expected
@@ -0,0 +1,93 @@
+# ==================== ИМПОРТЫ ====================
+
+import pytest
+
+from hybrid_transpiler_demo import hybrid_transpile, parse_cache, statement_memo
+from transpile_budget import time_budget
+from transpile_session import close_document, document_sessions, transpile_document
+
+# ==================== Данные ====================
+
+BASE = """CREATE TABLE users (id INT PRIMARY KEY AUTO_INCREMENT, name VARCHAR(100), created DATETIME);
+SELECT id, ROW_NUMBER() OVER (PARTITION BY name ORDER BY created) AS rn FROM users;
+INSERT INTO users (name) VALUES ('a;b'), ('c');
+-- комментарий; с точкой с запятой
+SELECT name FROM users WHERE id IN (SELECT id FROM users WHERE name LIKE 'a%');
+"""
+
+# Последовательные версии документа: правка в середине, в начале, незакрытая
+# строка и комментарий (окно расширяется), удаление и дописывание в конец
+EDITS = [
+    BASE,
+    BASE.replace("VARCHAR(100)", "VARCHAR(200)"),
+    "SELECT 1;\n" + BASE.replace("VARCHAR(100)", "VARCHAR(200)"),
+    "SELECT 1;\n" + BASE.replace("('a;b')", "('a;b"),
+    "SELECT 1;\n" + BASE.replace("('a;b')", "('a;b')").replace("-- комментарий", "/* комментарий"),
+    "SELECT 1;\n" + BASE,
+    BASE.split("INSERT")[0],
+    BASE.split("INSERT")[0] + "WITH t AS (SELECT 1 AS x) SELECT x FROM t",
+]
+
+@pytest.fixture(autouse=True)
+def fresh_sessions():
+    document_sessions.clear()
+    yield
+    document_sessions.clear()
+
+def full_transpile(sql, to_dialect):
+    return hybrid_transpile(sql, "mysql", to_dialect)["transpiled"][0]
+
+# ==================== Инкрементальный результат ====================
+
+@pytest.mark.parametrize("to_dialect", ["postgres", "bigquery"])
+def test_incremental_output_matches_full_transpile(to_dialect):
+    for revision, sql in enumerate(EDITS, 1):
+        result = transpile_document("doc", sql, "mysql", to_dialect)
+        assert result["revision"] == revision
+        assert result["transpiled"][0] == full_transpile(sql, to_dialect), sql
+
+def test_only_edited_statements_are_converted():
+    transpile_document("doc", BASE, "mysql", "postgres")
+    result = transpile_document("doc", BASE.replace("VARCHAR(100)", "VARCHAR(200)"), "mysql", "postgres")
+    assert result["incremental"]["converted_statements"] == 1
+    assert result["incremental"]["reused_statements"] == result["total_statements"] - 1
+
+def test_patches_rebuild_the_statement_list():
+    statements = transpile_document("doc", EDITS[0], "mysql", "postgres")["statements"]
+    for revision, sql in enumerate(EDITS[1:], 1):
+        result = transpile_document("doc", sql, "mysql", "postgres", base_revision=revision, patch=True)
+        assert "transpiled" not in result
+        # Операции применяются с конца
+        for operation in reversed(result["patch"]):
+            statements[operation["start"]:operation["end"]] = operation["statements"]
+        assert statements == transpile_document(f"check-{revision}", sql, "mysql", "postgres")["statements"]
+
+def test_stale_base_revision_returns_full_text():
+    transpile_document("doc", BASE, "mysql", "postgres")
+    result = transpile_document("doc", EDITS[1], "mysql", "postgres", base_revision=7, patch=True)
+    assert "patch" not in result
+    assert result["transpiled"][0] == full_transpile(EDITS[1], "postgres")
+
+def test_dialect_change_starts_a_new_session():
+    transpile_document("doc", BASE, "mysql", "postgres")
+    result = transpile_document("doc", BASE, "mysql", "sqlite")
+    assert result["revision"] == 1
+    assert result["incremental"]["reused_statements"] == 0
+    assert close_document("doc") and not close_document("doc")
+
+# ==================== Бюджет времени ====================
+
+def test_budget_fallback_is_retranspiled_on_next_call():
+    # Из памяти выражений результат пришёл бы без sqlglot и без бюджета
+    statement_memo.clear()
+    parse_cache.clear()
+    with time_budget(0.0001, None):
+        first = transpile_document("doc", BASE, "mysql", "postgres")
+    assert first["methods_used"]["timed_out"] > 0
+    assert first["transpiled"][0] != full_transpile(BASE, "postgres")
+
+    # Правка в другом выражении: прерванные по бюджету всё равно транспилируются заново
+    edited = BASE.replace("('c')", "('d')")
+    second = transpile_document("doc", edited, "mysql", "postgres")
+    assert second["methods_used"]["timed_out"] == 0
+    assert second["transpiled"][0] == full_transpile(edited, "postgres")
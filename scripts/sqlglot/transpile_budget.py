@@ -0,0 +1,94 @@
+# ==================== ИМПОРТЫ ====================
+
+import signal
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, Optional
+
+# ==================== КОНСТАНТЫ ====================
+
+_NO_GUARD = nullcontext()
+
+# Бюджет привязан к потоку, как и трассировка этапов
+_state = threading.local()
+
+# ==================== Бюджет времени ====================
+
+class BudgetExceeded(BaseException):
+    """Выражение не уложилось в бюджет времени.
+
+    Наследуется от BaseException (как asyncio.CancelledError), чтобы
+    обработчики `except Exception` в sqlglot и в нашем коде её не поглощали.
+    """
+
+class TimeBudget:
+    """Бюджет на одно выражение sqlglot и на весь запрос (в секундах).
+
+    В главном потоке работа sqlglot прерывается таймером SIGALRM; в других
+    потоках (сокет-сервер) сигнал недоступен, и бюджет проверяется
+    кооперативно - перед разбором, трансформацией и генерацией.
+    """
+
+    def __init__(self, statement_s: Optional[float] = None, request_s: Optional[float] = None):
+        self.statement_s = statement_s
+        self.request_deadline = time.perf_counter() + request_s if request_s else None
+        self.statement_deadline: Optional[float] = None
+        self.preemptive = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def request_expired(self) -> bool:
+        return self.request_deadline is not None and time.perf_counter() >= self.request_deadline
+
+    def start_statement(self) -> None:
+        """Начинает отсчёт для очередного выражения (с учётом остатка бюджета запроса)"""
+        deadline = self.request_deadline
+        if self.statement_s:
+            statement_deadline = time.perf_counter() + self.statement_s
+            deadline = statement_deadline if deadline is None else min(deadline, statement_deadline)
+        self.statement_deadline = deadline
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Выполняет блок в пределах бюджета выражения; иначе BudgetExceeded"""
+        deadline = self.statement_deadline
+        if deadline is None:
+            yield
+            return
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise BudgetExceeded()
+        if not self.preemptive:
+            yield
+            return
+
+        def on_alarm(signum, frame):
+            raise BudgetExceeded()
+
+        previous = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, remaining)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+def current_budget() -> Optional[TimeBudget]:
+    """Бюджет текущего запроса или None"""
+    return getattr(_state, "budget", None)
+
+def budget_guard():
+    """Контекст для вызова sqlglot; без бюджета - пустой контекст"""
+    budget = getattr(_state, "budget", None)
+    return budget.guard() if budget is not None else _NO_GUARD
+
+@contextmanager
+def time_budget(statement_ms: Optional[float] = None, request_ms: Optional[float] = None) -> Iterator[TimeBudget]:
+    """Включает бюджет времени для кода внутри блока в текущем потоке"""
+    previous = getattr(_state, "budget", None)
+    budget = TimeBudget(statement_ms / 1000 if statement_ms else None,
+                        request_ms / 1000 if request_ms else None)
+    _state.budget = budget
+    try:
+        yield budget
+    finally:
+        _state.budget = previous
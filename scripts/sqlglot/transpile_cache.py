@@ -0,0 +1,116 @@
+# ==================== ИМПОРТЫ ====================
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# ==================== КОНСТАНТЫ ====================
+
+# Версия правил конвертации: увеличивать при изменении результата транспиляции,
+# чтобы старые записи кэша не использовались
+ENGINE_VERSION = "1"
+
+DEFAULT_RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Примерные накладные расходы на одну запись (ключ, dict, служебные поля)
+ENTRY_OVERHEAD_BYTES = 256
+
+# ==================== LRU-кэш ====================
+
+class LRUCache:
+    """LRU-кэш, ограниченный суммарным размером записей в байтах.
+
+    Операции под блокировкой: кэши общие для потоков сокет-сервера (--workers 0).
+    """
+
+    def __init__(self, max_bytes: int):
+        self._lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        """Добавляет запись; записи крупнее всего кэша не сохраняются"""
+        with self._lock:
+            if size > self.max_bytes:
+                return
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            self._evict()
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Удаляет запись и возвращает её значение (None, если записи нет)"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def resize(self, max_bytes: int) -> None:
+        """Меняет лимит; при уменьшении лишние записи вытесняются"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        """Вытесняет старые записи до лимита; вызывается под блокировкой"""
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+# ==================== Кэш результатов транспиляции ====================
+
+def make_result_key(sql: str, from_dialect: str, to_dialect: str, engine: str) -> bytes:
+    """Ключ по содержимому: хеш SQL, пары диалектов и версии движка"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{engine}\0{ENGINE_VERSION}\0{from_dialect}\0{to_dialect}\0".encode('utf-8'))
+    digest.update(sql.encode('utf-8', 'surrogatepass'))
+    return digest.digest()
+
+def estimate_result_size(result: Dict[str, Any]) -> int:
+    """Оценка размера результата: текст транспиляции плюс накладные расходы"""
+    return ENTRY_OVERHEAD_BYTES + sum(len(text) for text in result.get("transpiled", []))
+
+result_cache = LRUCache(DEFAULT_RESULT_CACHE_BYTES)
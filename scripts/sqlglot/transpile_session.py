@@ -0,0 +1,283 @@
+# ==================== ИМПОРТЫ ====================
+
+import hashlib
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from hybrid_transpiler_demo import (DIALECT_NOTES, SQLGLOT_FALLBACK_PREFIXES, TIMED_OUT_METHOD,
+                                    convert_prepared_statement, finish_method_counter, new_method_counter,
+                                    prepare_statement)
+from sql_features import Feature, features_to_dict
+from sql_lexer import PUNCT, WS, Statement, Token, split_statements, tokenize
+from transpile_cache import ENTRY_OVERHEAD_BYTES, LRUCache
+from transpile_trace import trace_stage
+
+# ==================== КОНСТАНТЫ ====================
+
+DEFAULT_SESSION_CACHE_BYTES = 64 * 1024 * 1024
+
+# Префикс и суффикс двух версий текста сравниваются блоками такого размера
+_COMPARE_BLOCK = 4096
+
+# ==================== Состояние документа ====================
+
+class StatementEntry(NamedTuple):
+    """Транспилированное выражение документа; transpiled=None - выражение пропущено"""
+    fingerprint: bytes
+    transpiled: Optional[str]
+    method: Optional[str]
+    features: int
+    fallback: bool           # sqlglot не смог конвертировать, оставлен исходный текст
+    timed_out: bool          # sqlglot не уложился в бюджет - при следующей правке выражение транспилируется заново
+
+class DocumentSession(NamedTuple):
+    """Последняя версия документа: текст, границы выражений и их результаты"""
+    from_dialect: str
+    to_dialect: str
+    revision: int
+    text: str
+    starts: List[int]
+    ends: List[int]
+    entries: List[StatementEntry]
+    output_chars: int
+
+    def size(self) -> int:
+        return ENTRY_OVERHEAD_BYTES * (1 + len(self.entries)) + len(self.text) + self.output_chars
+
+# Сессии редактора: document_id -> DocumentSession, вытесняются по объёму
+document_sessions = LRUCache(DEFAULT_SESSION_CACHE_BYTES)
+
+# ==================== Сравнение версий текста ====================
+
+def common_prefix_length(old: str, new: str) -> int:
+    """Длина общего префикса: сравнение срезов блоками, внутри блока - делением пополам"""
+    limit = min(len(old), len(new))
+    length = 0
+    while length < limit:
+        step = min(length + _COMPARE_BLOCK, limit)
+        if old[length:step] == new[length:step]:
+            length = step
+            continue
+        low, high = length, step
+        while high - low > 1:
+            middle = (low + high) // 2
+            if old[low:middle] == new[low:middle]:
+                low = middle
+            else:
+                high = middle
+        return low
+    return length
+
+def common_suffix_length(old: str, new: str, limit: int) -> int:
+    """Длина общего суффикса, не больше limit (чтобы не пересекаться с префиксом)"""
+    old_len, new_len = len(old), len(new)
+    length = 0
+    while length < limit:
+        step = min(length + _COMPARE_BLOCK, limit)
+        if old[old_len - step:old_len - length] == new[new_len - step:new_len - length]:
+            length = step
+            continue
+        low, high = length, step
+        while high - low > 1:
+            middle = (low + high) // 2
+            if old[old_len - middle:old_len - low] == new[new_len - middle:new_len - low]:
+                low = middle
+            else:
+                high = middle
+        return low
+    return length
+
+def fingerprint(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+def _ends_at_top_level(window: str, tokens: List[Token], statements: List[Statement]) -> bool:
+    """Заканчивается ли окно завершённым выражением (';' вне скобок, строк и комментариев).
+
+    Только тогда разбор окна совпадает с разбором всего текста и следующее
+    за окном выражение можно не перечитывать.
+    """
+    last = len(tokens)
+    while last and tokens[last - 1].kind == WS:
+        last -= 1
+    if not last:
+        return True
+    if not statements or statements[-1].last_token != last:
+        return False
+    statement = statements[-1]
+    final = tokens[last - 1]
+    if final.kind != PUNCT or window[final.start] != ';':
+        return False
+    depth = 0
+    for token in tokens[statement.first_token:last - 1]:
+        if token.kind == PUNCT:
+            char = window[token.start]
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth = max(depth - 1, 0)
+    return depth == 0
+
+# ==================== Инкрементальная транспиляция ====================
+
+def _relex_window(text: str, session: DocumentSession, prefix: int, suffix: int
+                  ) -> Tuple[int, int, int, str, List[Token], List[Statement]]:
+    """Находит выражения, затронутые правкой, и заново разбирает только их.
+
+    Выражения, целиком лежащие в общем префиксе или суффиксе старой и новой
+    версий, не меняются. Если правка оставила незакрытую строку, комментарий
+    или скобку, окно расширяется на следующие выражения.
+    Возвращает (первое и следующее за последним старые выражения окна,
+    начало окна в новом тексте, текст окна, его токены и выражения).
+    """
+    starts, ends = session.starts, session.ends
+    count = len(starts)
+    delta = len(text) - len(session.text)
+
+    # Последнее выражение может быть без ';' - дописанный после него текст его продолжает
+    first = min(bisect_left(ends, prefix), max(count - 1, 0))
+    window_start = ends[first - 1] if first else 0
+    stop = bisect_left(starts, len(session.text) - suffix, first)
+
+    extra = 1
+    while True:
+        window_end = starts[stop] + delta if stop < count else len(text)
+        window = text[window_start:window_end]
+        tokens = tokenize(window)
+        statements = split_statements(window, tokens)
+        if stop == count or _ends_at_top_level(window, tokens, statements):
+            return first, stop, window_start, window, tokens, statements
+        stop = min(count, stop + extra)
+        extra *= 2
+
+def _convert_statement(window: str, tokens: List[Token], statement: Statement, statement_fingerprint: bytes,
+                       from_dialect: str, to_dialect: str, method_used: Dict[str, Any],
+                       index: int) -> StatementEntry:
+    prepared = prepare_statement(window, tokens, statement)
+    counter = new_method_counter()
+    transpiled = convert_prepared_statement(prepared, from_dialect, to_dialect, counter, index=index)
+    for key, value in counter.items():
+        method_used[key] += value
+
+    method = None
+    if transpiled is not None:
+        method = "sqlglot" if counter["sqlglot"] else "simple"
+    return StatementEntry(
+        statement_fingerprint, transpiled, method, int(prepared["features"]),
+        method == "sqlglot" and transpiled.startswith(SQLGLOT_FALLBACK_PREFIXES),
+        bool(counter[TIMED_OUT_METHOD])
+    )
+
+def assemble_document(entries: List[StatementEntry]) -> str:
+    """Полный текст результата - как у hybrid_transpile"""
+    result_sql = "\n\n".join([entry.transpiled for entry in entries
+                              if entry.transpiled is not None and entry.transpiled.strip()])
+    if result_sql.strip() and not result_sql.rstrip().endswith(';'):
+        result_sql = result_sql.rstrip() + ';'
+    return result_sql
+
+def transpile_document(document_id: str, sql: str, from_dialect: str, to_dialect: str,
+                       base_revision: Optional[int] = None, patch: bool = False) -> Dict[str, Any]:
+    """Транспиляция документа редактора с повторным использованием прошлой версии.
+
+    Заново разбираются и транспилируются только выражения, которые затронула
+    правка, так что время ответа зависит от размера правки, а не документа.
+    patch=True с base_revision, равной ревизии сессии, возвращает вместо
+    полного текста правки списка statements: операции {start, end, statements}
+    заменяют элементы [start, end) прошлой ревизии и применяются с конца.
+    Результаты, полученные быстрыми заменами из-за бюджета времени, в сессии
+    не закрепляются: такие выражения входят в окно следующего вызова.
+    """
+    session = document_sessions.get(document_id)
+    if session is None or (session.from_dialect, session.to_dialect) != (from_dialect, to_dialect):
+        session = DocumentSession(from_dialect, to_dialect, 0, "", [], [], [], 0)
+
+    with trace_stage("session.diff"):
+        prefix = common_prefix_length(session.text, sql)
+        suffix = common_suffix_length(session.text, sql, min(len(session.text), len(sql)) - prefix)
+    timed_out = [index for index, entry in enumerate(session.entries) if entry.timed_out]
+    if timed_out:
+        # Окно расширяется до выражений, для которых sqlglot не уложился в бюджет
+        prefix = min(prefix, session.starts[timed_out[0]])
+        suffix = min(suffix, len(session.text) - session.ends[timed_out[-1]])
+    with trace_stage("session.relex"):
+        first, stop, window_start, window, tokens, statements = _relex_window(sql, session, prefix, suffix)
+
+    # Выражения окна, которые не изменились (например, соседи правки), берутся из сессии
+    previous = {entry.fingerprint: entry for entry in session.entries[first:stop] if not entry.timed_out}
+    method_used = new_method_counter()
+    window_entries = []
+    converted = 0
+    for offset, statement in enumerate(statements):
+        statement_fingerprint = fingerprint(window[statement.start:statement.end])
+        entry = previous.get(statement_fingerprint)
+        if entry is None:
+            entry = _convert_statement(window, tokens, statement, statement_fingerprint,
+                                       from_dialect, to_dialect, method_used, first + offset)
+            converted += 1
+        window_entries.append(entry)
+
+    delta = len(sql) - len(session.text)
+    entries = session.entries[:first] + window_entries + session.entries[stop:]
+    removed_chars = sum(len(entry.transpiled or "") for entry in session.entries[first:stop])
+    added_chars = sum(len(entry.transpiled or "") for entry in window_entries)
+    updated = DocumentSession(
+        from_dialect, to_dialect, session.revision + 1, sql,
+        session.starts[:first] + [window_start + s.start for s in statements]
+        + [position + delta for position in session.starts[stop:]],
+        session.ends[:first] + [window_start + s.end for s in statements]
+        + [position + delta for position in session.ends[stop:]],
+        entries,
+        session.output_chars - removed_chars + added_chars,
+    )
+    document_sessions.put(document_id, updated, updated.size())
+
+    features = Feature.NONE
+    for entry in entries:
+        features |= entry.features
+    warnings = [f"Statement {index + 1}: sqlglot could not convert it, original query kept"
+                for index, entry in enumerate(entries) if entry.fallback]
+
+    result = {
+        "success": True,
+        "document_id": document_id,
+        "revision": updated.revision,
+        "from_dialect": from_dialect,
+        "to_dialect": to_dialect,
+        "features_detected": features_to_dict(Feature(features)),
+        "total_statements": len(entries),
+        "incremental": {
+            "relexed_chars": len(window),
+            "reparsed_statements": len(statements),
+            "converted_statements": converted,
+            "reused_statements": len(entries) - converted,
+        },
+        "warnings": warnings,
+        "note": DIALECT_NOTES.get(to_dialect, "Check dialect-specific documentation"),
+    }
+
+    if patch and session.revision and base_revision == session.revision:
+        old_fingerprints = [entry.fingerprint for entry in session.entries[first:stop]]
+        new_fingerprints = [entry.fingerprint for entry in window_entries]
+        matcher = SequenceMatcher(None, old_fingerprints, new_fingerprints, autojunk=False)
+        result["base_revision"] = base_revision
+        result["patch"] = [
+            {"start": first + old_start, "end": first + old_end,
+             "statements": [entry.transpiled for entry in window_entries[new_start:new_end]]}
+            for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes()
+            if tag != "equal"
+        ]
+        return result
+
+    with trace_stage("assemble"):
+        result["transpiled"] = [assemble_document(entries)]
+    result["statements"] = [entry.transpiled for entry in entries]
+    method_used["simple"] = sum(1 for entry in entries if entry.method == "simple")
+    method_used["sqlglot"] = sum(1 for entry in entries if entry.method == "sqlglot")
+    result["methods_used"] = method_used
+    result["primary_method"] = finish_method_counter(method_used)
+    return result
+
+def close_document(document_id: str) -> bool:
+    """Удаляет сессию документа; False - сессии не было"""
+    return document_sessions.pop(document_id) is not None
@@ -0,0 +1,107 @@
+# ==================== ИМПОРТЫ ====================
+
+import heapq
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# ==================== КОНСТАНТЫ ====================
+
+DEFAULT_TRACE_SLOWEST = 10
+
+_NO_STAGE = nullcontext()
+
+# Трассировка привязана к потоку: сокет-сервер выполняет запросы в пуле потоков
+_state = threading.local()
+
+# ==================== Трассировка этапов ====================
+
+class StageTrace:
+    """Время этапов одного запроса (perf_counter_ns) и самые медленные выражения.
+
+    Этапы не вложены друг в друга, поэтому их сумма близка к общему времени;
+    разница - код между этапами (сборка результата, счётчики). Исключение -
+    этапы воркеров пула процессов (worker.*, см. merge): они идут внутри
+    convert_parallel и суммируются по всем процессам.
+    """
+
+    def __init__(self, slowest: int = DEFAULT_TRACE_SLOWEST):
+        self.started = time.perf_counter_ns()
+        self.stages: Dict[str, List[int]] = {}   # этап -> [наносекунды, вызовы]
+        self.slowest = slowest
+        # Куча из slowest самых долгих выражений: (ns, порядковый номер, данные)
+        self._statements: List[Tuple[int, int, Dict[str, Any]]] = []
+        self._sequence = 0
+
+    def add(self, stage: str, elapsed_ns: int) -> None:
+        totals = self.stages.get(stage)
+        if totals is None:
+            self.stages[stage] = [elapsed_ns, 1]
+        else:
+            totals[0] += elapsed_ns
+            totals[1] += 1
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter_ns() - started)
+
+    def add_statement(self, elapsed_ns: int, index: int, to_dialect: str, method: str, reused: bool) -> None:
+        """Учитывает выражение; хранится только slowest самых долгих"""
+        if self.slowest <= 0:
+            return
+        self._sequence += 1
+        entry = (elapsed_ns, self._sequence,
+                 {"index": index, "to_dialect": to_dialect, "engine": method, "reused": reused})
+        if len(self._statements) < self.slowest:
+            heapq.heappush(self._statements, entry)
+        elif elapsed_ns > self._statements[0][0]:
+            heapq.heapreplace(self._statements, entry)
+
+    def merge(self, report: Dict[str, Any], prefix: str = "worker.") -> None:
+        """Добавляет отчёт трассировки другого процесса: этапы с префиксом и медленные выражения"""
+        for name, stage in report["stages"].items():
+            totals = self.stages.setdefault(prefix + name, [0, 0])
+            totals[0] += stage["ns"]
+            totals[1] += stage["calls"]
+        for statement in report["slowest_statements"]:
+            self.add_statement(statement["ns"], statement["index"], statement["to_dialect"],
+                               statement["engine"], statement["reused"])
+
+    def report(self) -> Dict[str, Any]:
+        total_ns = time.perf_counter_ns() - self.started
+        return {
+            "total_ns": total_ns,
+            "stages": {
+                name: {"ns": ns, "calls": calls, "share": round(ns / total_ns, 4) if total_ns else 0.0}
+                for name, (ns, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0])
+            },
+            "slowest_statements": [
+                {**details, "ns": elapsed_ns}
+                for elapsed_ns, _, details in sorted(self._statements, reverse=True)
+            ],
+        }
+
+def current_trace() -> Optional[StageTrace]:
+    """Трассировка текущего запроса или None, если она не включена"""
+    return getattr(_state, "trace", None)
+
+def trace_stage(name: str):
+    """Контекст замера этапа; без трассировки - пустой контекст"""
+    trace = getattr(_state, "trace", None)
+    return trace.stage(name) if trace is not None else _NO_STAGE
+
+@contextmanager
+def tracing(slowest: int = DEFAULT_TRACE_SLOWEST) -> Iterator[StageTrace]:
+    """Включает трассировку для кода внутри блока в текущем потоке"""
+    previous = getattr(_state, "trace", None)
+    trace = StageTrace(slowest)
+    _state.trace = trace
+    try:
+        yield trace
+    finally:
+        _state.trace = previous
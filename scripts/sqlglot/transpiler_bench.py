@@ -0,0 +1,411 @@
+# ==================== ИМПОРТЫ ====================
+
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from hybrid_transpiler_demo import (
+    COMPLEX_SQL_EXAMPLE, hybrid_transpile, load_sqlglot, statement_memo, transpile_statement
+)
+from server import transpile_sql_for_dialect
+from sql_features import detect_features, detect_sql_features, features_to_dict
+from sql_lexer import code_words, split_statements, tokenize
+from transpile_cache import ENGINE_VERSION
+
+# ==================== КОНСТАНТЫ ====================
+
+TARGET_DIALECTS = ["postgres", "snowflake", "bigquery", "oracle", "mssql", "sqlite", "redshift"]
+ENGINES = ["simple", "hybrid"]
+SCENARIOS = ["schema", "select", "insert", "complex"]
+
+# Размер корпуса: число таблиц схемы, SELECT-запросов, INSERT-выражений
+# и повторов COMPLEX_SQL_EXAMPLE
+SIZES = {
+    "small": {"schema": 10, "select": 200, "insert": 100, "complex": 1},
+    "medium": {"schema": 1000, "select": 2000, "insert": 1000, "complex": 10},
+    "large": {"schema": 50000, "select": 20000, "insert": 10000, "complex": 50},
+}
+
+DEFAULT_SEED = 42
+DEFAULT_REPEATS = 5
+INSERT_ROWS_PER_STATEMENT = 50
+
+COLUMN_TYPES = [
+    "INT", "BIGINT", "SMALLINT", "TINYINT(1)", "VARCHAR(255)", "VARCHAR(64)", "TEXT",
+    "DECIMAL(10,2)", "DOUBLE", "DATE", "DATETIME", "TIMESTAMP", "BOOLEAN", "JSON",
+    "ENUM('new','active','archived')", "BLOB",
+]
+
+# ==================== Генерация корпуса ====================
+
+def generate_schema(tables: int, rng: random.Random) -> str:
+    """CREATE TABLE для заданного числа таблиц: типы MySQL, внешние ключи, индексы"""
+    parts = []
+    for index in range(tables):
+        columns = ["    id INT PRIMARY KEY AUTO_INCREMENT"]
+        for column in range(rng.randint(3, 8)):
+            column_type = rng.choice(COLUMN_TYPES)
+            nullability = " NOT NULL" if rng.random() < 0.4 else ""
+            columns.append(f"    c{column}_{column_type.split('(')[0].lower()} {column_type}{nullability}")
+
+        constraints = []
+        if index and rng.random() < 0.3:
+            parent = rng.randrange(index)
+            columns.append("    parent_id INT")
+            constraints.append(f"    FOREIGN KEY (parent_id) REFERENCES t{parent:05d}(id) ON DELETE CASCADE")
+        if rng.random() < 0.3:
+            constraints.append(f"    INDEX idx_t{index:05d}_c0 ({columns[1].split()[0]})")
+
+        columns.append("    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+        body = ",\n".join(columns + constraints)
+        parts.append(f"CREATE TABLE t{index:05d} (\n{body}\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;")
+    return "\n\n".join(parts)
+
+def generate_select_script(count: int, rng: random.Random) -> str:
+    """Смесь SELECT: простые выборки, JOIN, агрегаты, оконные функции и CTE"""
+    templates = [
+        (0.55, "SELECT id, name, created_at FROM t{a} WHERE status = 'active' AND id > {n} ORDER BY id LIMIT 100;"),
+        (0.20, "SELECT a.id, b.name FROM t{a} a\nJOIN t{b} b ON a.parent_id = b.id\nWHERE a.price > {n}.50;"),
+        (0.12, "SELECT category, COUNT(*) AS cnt, AVG(price) AS avg_price FROM t{a}\n"
+               "WHERE created_at >= '2024-01-01' GROUP BY category HAVING COUNT(*) > {n};"),
+        (0.08, "SELECT id, ROW_NUMBER() OVER (PARTITION BY category ORDER BY price DESC) AS rn FROM t{a};"),
+        (0.05, "WITH recent AS (\n    SELECT id, price FROM t{a} WHERE created_at > NOW() - INTERVAL 7 DAY\n)\n"
+               "SELECT id, SUM(price) FROM recent GROUP BY id;"),
+    ]
+    weights = [weight for weight, _ in templates]
+    parts = []
+    for _ in range(count):
+        template = rng.choices(templates, weights)[0][1]
+        parts.append(template.format(a=f"{rng.randrange(1000):05d}", b=f"{rng.randrange(1000):05d}",
+                                     n=rng.randrange(10000)))
+    return "\n".join(parts)
+
+def _random_literal(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.1:
+        return "NULL"
+    if kind < 0.35:
+        return str(rng.randrange(-100000, 100000))
+    if kind < 0.5:
+        return f"{rng.uniform(0, 10000):.2f}"
+    if kind < 0.6:
+        return rng.choice(["TRUE", "FALSE"])
+    if kind < 0.75:
+        return f"'{rng.randrange(2000, 2026)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00'"
+    if kind < 0.8:
+        return "0x" + "".join(rng.choice("0123456789ABCDEF") for _ in range(16))
+    text = "".join(rng.choice("abcdefghij klmn") for _ in range(rng.randint(3, 40)))
+    # Экранирование в стиле mysqldump
+    return "'" + text.replace("a", "\\'", 1).replace("b", "\\n", 1) + "'"
+
+def generate_insert_dump(count: int, rng: random.Random) -> str:
+    """INSERT ... VALUES в стиле mysqldump, по INSERT_ROWS_PER_STATEMENT строк"""
+    parts = []
+    for index in range(count):
+        width = rng.randint(3, 8)
+        columns = ", ".join(f"`c{column}`" for column in range(width))
+        rows = ",".join(
+            "(" + ",".join(_random_literal(rng) for _ in range(width)) + ")"
+            for _ in range(INSERT_ROWS_PER_STATEMENT)
+        )
+        parts.append(f"INSERT INTO `t{index % 1000:05d}` ({columns}) VALUES {rows};")
+    return "\n".join(parts)
+
+def generate_corpus(size: str, seed: int = DEFAULT_SEED, scenarios: Optional[List[str]] = None) -> Dict[str, str]:
+    """Корпус сценариев заданного размера; одинаковый seed - одинаковый текст"""
+    counts = SIZES[size]
+    generators = {
+        "schema": generate_schema,
+        "select": generate_select_script,
+        "insert": generate_insert_dump,
+        "complex": lambda count, rng: "\n\n".join([COMPLEX_SQL_EXAMPLE] * count),
+    }
+    corpus = {}
+    for scenario in scenarios or SCENARIOS:
+        # Отдельный генератор на сценарий: состав корпуса не зависит от набора сценариев
+        corpus[scenario] = generators[scenario](counts[scenario], random.Random(f"{seed}:{scenario}"))
+    return corpus
+
+# ==================== Измерения ====================
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """Перцентиль по ближайшему рангу (значения отсортированы)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def latency_summary(latencies_ns: List[int]) -> Dict[str, float]:
+    """p50/p95/p99/max в микросекундах"""
+    values = sorted(latencies_ns)
+    return {
+        "count": len(values),
+        "total_ms": round(sum(values) / 1e6, 3),
+        "p50_us": round(percentile(values, 50) / 1000, 2),
+        "p95_us": round(percentile(values, 95) / 1000, 2),
+        "p99_us": round(percentile(values, 99) / 1000, 2),
+        "max_us": round(values[-1] / 1000, 2) if values else 0.0,
+    }
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS процесса (None, если модуль resource недоступен)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def time_call(function: Callable[[], Any]) -> int:
+    """Время одного вызова в наносекундах с отключённым сборщиком мусора"""
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter_ns()
+        function()
+        return time.perf_counter_ns() - started
+    finally:
+        gc.enable()
+
+def script_runner(engine: str, sql: str, to_dialect: str) -> Callable[[], Any]:
+    """Транспиляция всего скрипта выбранным движком, без кэшей и мемоизации"""
+    if engine == "simple":
+        return lambda: transpile_sql_for_dialect(sql, "mysql", to_dialect)
+    return lambda: hybrid_transpile(sql, "mysql", to_dialect, use_memo=False)
+
+def statement_latencies(engine: str, statements: List[str], to_dialect: str) -> Dict[str, List[int]]:
+    """Время каждого выражения; для hybrid - с разбивкой по методу (simple / sqlglot)"""
+    latencies: Dict[str, List[int]] = {"all": []}
+    gc.collect()
+    gc.disable()
+    try:
+        for statement in statements:
+            started = time.perf_counter_ns()
+            if engine == "simple":
+                transpile_sql_for_dialect(statement, "mysql", to_dialect)
+                method = "simple"
+            else:
+                _, method = transpile_statement(statement, "mysql", to_dialect)
+            elapsed = time.perf_counter_ns() - started
+            latencies["all"].append(elapsed)
+            latencies.setdefault(method, []).append(elapsed)
+    finally:
+        gc.enable()
+    return latencies
+
+def bench_case(scenario: str, sql: str, statements: List[str], engine: str, to_dialect: str,
+               repeats: int) -> Dict[str, Any]:
+    """Один замер: прогрев, repeats прогонов скрипта, затем время по выражениям"""
+    run = script_runner(engine, sql, to_dialect)
+    run()  # прогрев: компиляция правил, загрузка диалектов sqlglot
+
+    script_ns = sorted(time_call(run) for _ in range(repeats))
+    median_s = percentile(script_ns, 50) / 1e9
+    latencies = statement_latencies(engine, statements, to_dialect)
+
+    return {
+        "scenario": scenario,
+        "engine": engine,
+        "to_dialect": to_dialect,
+        "statements": len(statements),
+        "bytes": len(sql.encode("utf-8")),
+        "repeats": repeats,
+        "script_ms": {"min": round(script_ns[0] / 1e6, 3), "median": round(median_s * 1000, 3),
+                      "max": round(script_ns[-1] / 1e6, 3)},
+        "throughput": {
+            "statements_per_s": round(len(statements) / median_s, 1) if median_s else None,
+            "mb_per_s": round(len(sql.encode("utf-8")) / (1024 * 1024) / median_s, 3) if median_s else None,
+        },
+        "latency": latency_summary(latencies.pop("all")),
+        "methods": {method: latency_summary(values) for method, values in sorted(latencies.items())},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_benchmark(size: str = "small", targets: Optional[List[str]] = None,
+                  engines: Optional[List[str]] = None, scenarios: Optional[List[str]] = None,
+                  repeats: int = DEFAULT_REPEATS, seed: int = DEFAULT_SEED,
+                  progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Прогоняет корпус по всем сочетаниям сценарий x движок x целевой диалект.
+
+    Пиковый RSS - накопленный максимум процесса к концу замера, поэтому
+    он зависит от порядка сценариев; крупные сценарии идут последними.
+    """
+    targets = targets or TARGET_DIALECTS
+    engines = engines or ENGINES
+
+    started = time.perf_counter()
+    corpus = generate_corpus(size, seed, scenarios)
+    generation_s = time.perf_counter() - started
+
+    try:
+        sqlglot_version = load_sqlglot().__version__
+    except ImportError:
+        sqlglot_version = None
+
+    results = []
+    for scenario, sql in corpus.items():
+        statements = [sql[s.start:s.end] for s in split_statements(sql, tokenize(sql))]
+        for engine in engines:
+            for to_dialect in targets:
+                statement_memo.clear()
+                case = bench_case(scenario, sql, statements, engine, to_dialect, repeats)
+                results.append(case)
+                if progress:
+                    progress(case)
+
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "size": size,
+            "seed": seed,
+            "repeats": repeats,
+            "corpus_generation_s": round(generation_s, 3),
+            "engine_version": ENGINE_VERSION,
+            "sqlglot": sqlglot_version,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+# ==================== Детектор конструкций ====================
+
+def legacy_detection_pass(sql: str, spans: List[Any], tokens: List[Any]) -> None:
+    """Прежняя работа конвейера: детектор по всему скрипту, по каждому выражению
+    и отдельный список слов для проверки ALTER TABLE ... ADD FOREIGN KEY"""
+    detect_sql_features(sql)
+    for span in spans:
+        detect_sql_features(sql[span.start:span.end])
+        ' '.join(code_words(sql, tokens, span.first_token, span.last_token))
+
+def bench_detector(size: str = "small", seed: int = DEFAULT_SEED, repeats: int = DEFAULT_REPEATS) -> Dict[str, Any]:
+    """Сравнивает однопроходный детектор по токенам с поиском подстрок
+    (sql_features.detect_sql_features).
+
+    statements_ms - только детектор по выражениям, pipeline_ms - вся прежняя
+    работа конвейера (см. legacy_detection_pass) против одного прохода по
+    токенам. Токены готовятся заранее: в конвейере они уже есть после
+    разбиения. statements_ratio - во сколько раз проход по токенам медленнее
+    (>1) или быстрее (<1) поиска подстрок по одним выражениям;
+    tokenized_ms - проход по токенам вместе с токенизацией каждого
+    выражения (цена для вызовов без готовых токенов).
+    Расхождения считаются по признакам; is_complex определяет маршрут в
+    sqlglot. Ожидаемые расхождения описаны в sql_features.detect_features.
+    """
+    results = []
+    for scenario, sql in generate_corpus(size, seed).items():
+        tokens = tokenize(sql)
+        spans = split_statements(sql, tokens)
+        texts = [sql[span.start:span.end] for span in spans]
+
+        legacy_ns = sorted(time_call(lambda: [detect_sql_features(text) for text in texts])
+                           for _ in range(repeats))
+        pipeline_ns = sorted(time_call(lambda: legacy_detection_pass(sql, spans, tokens))
+                             for _ in range(repeats))
+        token_ns = sorted(time_call(lambda: [detect_features(sql, tokens, span.first_token, span.last_token)
+                                             for span in spans])
+                          for _ in range(repeats))
+        tokenized_ns = sorted(time_call(lambda: [detect_features(text, tokenize(text)) for text in texts])
+                              for _ in range(repeats))
+
+        mismatches: Dict[str, int] = {}
+        for span, text in zip(spans, texts):
+            old = features_to_dict(detect_sql_features(text))
+            new = features_to_dict(detect_features(sql, tokens, span.first_token, span.last_token))
+            for name in new:
+                if old[name] != new[name]:
+                    mismatches[name] = mismatches.get(name, 0) + 1
+
+        token_median = percentile(token_ns, 50)
+        results.append({
+            "scenario": scenario,
+            "statements": len(spans),
+            "bytes": len(sql.encode("utf-8")),
+            "legacy_statements_ms": round(percentile(legacy_ns, 50) / 1e6, 3),
+            "legacy_pipeline_ms": round(percentile(pipeline_ns, 50) / 1e6, 3),
+            "token_ms": round(token_median / 1e6, 3),
+            "tokenized_ms": round(percentile(tokenized_ns, 50) / 1e6, 3),
+            "pipeline_speedup": round(percentile(pipeline_ns, 50) / token_median, 2) if token_median else None,
+            "statements_ratio": round(token_median / percentile(legacy_ns, 50), 2) if percentile(legacy_ns, 50) else None,
+            "mismatches": mismatches,
+        })
+    return {"size": size, "seed": seed, "repeats": repeats, "results": results}
+
+# ==================== Отчёт ====================
+
+def case_key(case: Dict[str, Any]) -> Tuple[str, str, str]:
+    return case["scenario"], case["engine"], case["to_dialect"]
+
+def format_case(case: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    """Строка таблицы; с baseline - изменение пропускной способности в процентах"""
+    latency = case["latency"]
+    line = (f"{case['scenario']:<8} {case['engine']:<7} {case['to_dialect']:<10}"
+            f"{case['statements']:>8} {case['throughput']['statements_per_s'] or 0:>12.1f}"
+            f"{latency['p50_us']:>10.1f}{latency['p95_us']:>10.1f}{latency['p99_us']:>10.1f}"
+            f"{case['peak_rss_mb'] or 0:>9.1f}")
+    if "sqlglot" in case["methods"]:
+        share = case["methods"]["sqlglot"]["total_ms"] / max(latency["total_ms"], 1e-9)
+        line += f"  sqlglot {case['methods']['sqlglot']['count']}/{case['statements']} ({share:.0%} времени)"
+    if baseline:
+        before = baseline["throughput"]["statements_per_s"]
+        after = case["throughput"]["statements_per_s"]
+        if before and after:
+            line += f"  {(after - before) / before:+.1%}"
+    return line
+
+TABLE_HEADER = (f"{'сценарий':<8} {'движок':<7} {'диалект':<10}{'выраж.':>8}{'выраж./с':>12}"
+                f"{'p50 мкс':>10}{'p95 мкс':>10}{'p99 мкс':>10}{'RSS МБ':>9}")
+
+# ==================== CLI ====================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк транспиляторов на сгенерированном корпусе")
+    parser.add_argument("--size", choices=list(SIZES), default="small")
+    parser.add_argument("--targets", nargs="+", choices=TARGET_DIALECTS, default=TARGET_DIALECTS)
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("-o", "--output", help="записать результаты в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    parser.add_argument("--detector", action="store_true",
+                        help="только сравнение детектора конструкций с прежним")
+    args = parser.parse_args(argv)
+
+    if args.detector:
+        report = bench_detector(args.size, args.seed, args.repeats)
+        for case in report["results"]:
+            print(f"{case['scenario']:<8} {case['statements']:>8} выраж.  подстроки: выражения "
+                  f"{case['legacy_statements_ms']:>9.3f} мс, конвейер {case['legacy_pipeline_ms']:>9.3f} мс"
+                  f"  по токенам {case['token_ms']:>9.3f} мс  x{case['pipeline_speedup']}"
+                  f" (выражения x{case['statements_ratio']}, с токенизацией {case['tokenized_ms']:.3f} мс)"
+                  f"  расхождения: {case['mismatches']}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as target:
+                json.dump(report, target, ensure_ascii=False, indent=2)
+        return 0
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as source:
+            baseline = {case_key(case): case for case in json.load(source)["results"]}
+
+    print(TABLE_HEADER)
+    report = run_benchmark(args.size, args.targets, args.engines, args.scenarios, args.repeats, args.seed,
+                           progress=lambda case: print(format_case(case, baseline.get(case_key(case))),
+                                                       flush=True))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as target:
+            json.dump(report, target, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())